@@ -1,10 +1,91 @@
 import jwt
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from decouple import config
 from datetime import datetime, timedelta
+from django.conf import settings
+
+
+class VerifiedTokenCache:
+    """
+    This is a bounded, thread safe LRU of already verified tokens. Entries are keyed by a digest of the token and
+    expire at the exp claim of the token, so a token presented again skips signature verification and claim parsing
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(jwtToken, secretKey):
+        return hashlib.sha256(f"{secretKey}:{jwtToken}".encode('utf-8')).digest()
+
+    def get(self, key):
+        """
+        This function is used for getting the payload of a verified token
+        :param key: token digest
+        :return: payload or None when the token is not cached or is expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(payload)
+
+    def put(self, key, payload):
+        """
+        This function is used for storing the payload of a verified token till its expiry
+        :param key: token digest
+        :param payload: decoded token payload
+        """
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return
+        with self._lock:
+            self._entries[key] = (payload['exp'], dict(payload))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        This function is used for getting the cache counters
+        :return: size, maxsize, hits, misses and hit ratio
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
 
 
 class JWTAuth:
     """ This is used for getting token and verify token"""
+    verified_tokens = VerifiedTokenCache(settings.JWT_VERIFY_CACHE_SIZE)
+
     @staticmethod
     def getToken(username, password, secretKey=config('APP_SECRET_KEY')):
         """
@@ -22,6 +103,45 @@ class JWTAuth:
         jwtToken = jwt.encode(pay_load, key=secretKey)
         return jwtToken
 
+    @staticmethod
+    def getAccessToken(user, profile_id, secretKey=config('APP_SECRET_KEY')):
+        """
+        This function is used for getting a short lived access token of the stateless auth mode. The token carries
+        everything needed to authorize a request, so it is verified by its signature alone
+        :param user: user instance
+        :param profile_id: mentor or student profile id of the user
+        :param secretKey: App secrete key
+        :return: return token
+        """
+        pay_load = {
+            'type': 'access',
+            'jti': uuid.uuid4().hex,
+            'uid': user.id,
+            'username': user.username,
+            'role': user.role_id,
+            'pid': profile_id,
+            'su': user.is_superuser,
+            'exp': datetime.utcnow() + timedelta(seconds=settings.AUTH_ACCESS_TOKEN_TTL)
+        }
+        return jwt.encode(pay_load, key=secretKey)
+
+    @staticmethod
+    def getRefreshToken(username, secretKey=config('APP_SECRET_KEY')):
+        """
+        This function is used for getting the refresh token of the stateless auth mode, which is checked against the
+        redis session when a new access token is requested
+        :param username: user's username
+        :param secretKey: App secrete key
+        :return: return token
+        """
+        pay_load = {
+            'type': 'refresh',
+            'jti': uuid.uuid4().hex,
+            'username': username,
+            'exp': datetime.utcnow() + timedelta(seconds=settings.AUTH_SESSION_TTL)
+        }
+        return jwt.encode(pay_load, key=secretKey)
+
     @staticmethod
     def verifyToken(jwtToken, secretKey=config('APP_SECRET_KEY')):
         """
@@ -30,8 +150,15 @@ class JWTAuth:
         :param secretKey: App secrete key
         :return: verify token
         """
+        if not jwtToken:
+            return False
+        key = VerifiedTokenCache.digest(jwtToken, secretKey)
+        verificationStatus = JWTAuth.verified_tokens.get(key)
+        if verificationStatus:
+            return verificationStatus
         try:
             verificationStatus = jwt.decode(jwtToken, key=secretKey, algorithms='HS256')
+            JWTAuth.verified_tokens.put(key, verificationStatus)
             return verificationStatus
         except jwt.ExpiredSignatureError:
             return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AuthConfig(AppConfig):
     name = 'Auth'
+
+    def ready(self):
+        import Auth.signals
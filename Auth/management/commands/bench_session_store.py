@@ -0,0 +1,91 @@
+import time
+import redis
+from django.core.management.base import BaseCommand
+import sys
+
+sys.path.append('..')
+from Auth.JWTAuthentication import JWTAuth
+from LMS.cache import Cache, SessionStore
+
+
+class RoundTripCounter:
+    """Counts the requests written to redis connections, a pipeline or a script call is one round trip"""
+
+    def __init__(self):
+        self.count = 0
+        self._original = None
+
+    def __enter__(self):
+        self._original = redis.connection.Connection.send_packed_command
+        counter = self
+
+        def send_packed_command(connection, command, *args, **kwargs):
+            counter.count += 1
+            return counter._original(connection, command, *args, **kwargs)
+
+        redis.connection.Connection.send_packed_command = send_packed_command
+        return self
+
+    def __exit__(self, *exc):
+        redis.connection.Connection.send_packed_command = self._original
+
+
+class Command(BaseCommand):
+    help = 'Compares redis round trips per login and per authenticated request of the session store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000)
+
+    def measure(self, operation, iterations):
+        with RoundTripCounter() as counter:
+            start = time.perf_counter()
+            for i in range(iterations):
+                operation(i)
+            elapsed = time.perf_counter() - start
+        return counter.count / iterations, elapsed / iterations * 1e6
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        cache = Cache.getCacheInstance()
+        cache.ping()
+        token = JWTAuth.getToken(username='bench', password='bench')
+        principal = '{"id": 1, "username": "bench", "role_id": 1, "profile_id": null}'
+
+        def legacy_login(i):
+            cache.hmset(f"bench:session:{i}", {'auth': token, 'principal': principal})
+            cache.expire(f"bench:session:{i}", 60)
+
+        def legacy_request(i):
+            JWTAuth.verifyToken(token)
+            cache.hget(f"bench:session:{i}", 'auth')
+
+        def legacy_invalid_request(i):
+            jwtData = JWTAuth.verifyToken('invalid')
+            try:
+                cache.hget(jwtData.get('username'), 'auth')
+            except Exception:
+                pass
+
+        def store_login(i):
+            SessionStore.create(f"bench:session:{i}", token, principal, 1, ttl=60)
+
+        def store_request(i):
+            if JWTAuth.verifyToken(token):
+                SessionStore.fetch(f"bench:session:{i}", token)
+
+        def store_invalid_request(i):
+            if JWTAuth.verifyToken('invalid'):
+                SessionStore.fetch(None, 'invalid')
+
+        rows = [
+            ('login', legacy_login, store_login),
+            ('authenticated request', legacy_request, store_request),
+            ('invalid token request', legacy_invalid_request, store_invalid_request),
+        ]
+        self.stdout.write(f"{'operation':<24}{'legacy trips':>14}{'legacy us':>12}{'store trips':>14}{'store us':>12}")
+        for name, legacy, store in rows:
+            legacy_trips, legacy_us = self.measure(legacy, iterations)
+            store_trips, store_us = self.measure(store, iterations)
+            self.stdout.write(f"{name:<24}{legacy_trips:>14.2f}{legacy_us:>12.1f}{store_trips:>14.2f}{store_us:>12.1f}")
+        cache.delete(*[f"bench:session:{i}" for i in range(iterations)])
+        cache.delete(*[SessionStore.KEY.format(f"bench:session:{i}") for i in range(iterations)])
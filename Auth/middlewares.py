@@ -1,34 +1,45 @@
 from .JWTAuthentication import JWTAuth
 from rest_framework import status
+from django.conf import settings
 from django.http import JsonResponse
 from django.urls import reverse
-from .models import User
+from .principal import Principal
+import json
 import sys
 
 sys.path.append('..')
-from LMS.cache import Cache
+from LMS.cache import Cache, SessionStore, RevokedTokens, RateLimiter
+from LMS.loggerConfig import log
 
 
 class TokenAuthentication(object):
     def __init__(self, get_response):
         self.get_response = get_response
 
+    @staticmethod
+    def get_user(token):
+        """
+        This function is used for getting the logged in user of the token
+        :param token: Authorization header
+        :return: user instance or None
+        """
+        # a token which does not decode never reaches redis
+        jwtData = JWTAuth.verifyToken(token)
+        if not jwtData or jwtData.get('type') == 'refresh':
+            return None
+        if jwtData.get('type') == 'access':
+            # stateless access token, authorized by its signature and the local copy of the revocation set
+            if settings.AUTH_STATELESS_MODE and not RevokedTokens.is_revoked(jwtData['jti']):
+                return Principal.from_claims(jwtData)
+            return None
+        principal = SessionStore.authenticate(jwtData.get('username'), token)
+        return Principal.to_user(principal) if principal else None
+
     def __call__(self, request, *args, **kwargs):
-        token = request.headers.get('Authorization')
-        if token:
-            jwtData = JWTAuth.verifyToken(token)
-            cache = Cache.getCacheInstance()
-            cache_token = None
-            try:
-                cache_token = cache.hget(jwtData.get('username'), 'auth')
-            except Exception:
-                pass
-            if cache_token:
-                cache_token = cache_token.decode('utf-8')
-            if jwtData and cache_token == token:
-                user = User.objects.get(username=jwtData.get('username'))
-                request.META['user'] = user
-                return self.get_response(request, *args, **kwargs)
+        user = self.get_user(request.headers.get('Authorization'))
+        if user:
+            request.META['user'] = user
+            return self.get_response(request, *args, **kwargs)
         return JsonResponse({'response': 'You have to login to access this resource',
                              'path': f"{reverse('login')}?next={request.path}"}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -38,19 +49,80 @@ class CantAccessAfterLogin(object):
         self.get_response = get_response
 
     def __call__(self, request, token=None):
-        token = request.headers.get('Authorization')
-        jwtData = JWTAuth.verifyToken(token)
-        cache = Cache.getCacheInstance()
-        cache_token = None
-        try:
-            cache_token = cache.hget(jwtData.get('username'), 'auth')
-        except Exception:
-            pass
-
-        if cache_token:
-            cache_token = cache_token.decode('utf-8')    
-        if jwtData and cache_token == token:
+        # anonymous requests and tokens which do not decode never reach redis
+        if TokenAuthentication.get_user(request.headers.get('Authorization')):
             return JsonResponse({'response': 'You need to logout to access this this resource'},
                                 status=status.HTTP_406_NOT_ACCEPTABLE)
+        return self.get_response(request)
+
+
+class RateLimitMiddleware(object):
+    """
+    This middleware throttles the routes listed in settings.RATE_LIMITS with per IP and per username token buckets.
+    It runs before the view, so a rejected request never reaches password hashing or a celery enqueue
+    """
+    UNLIMITED_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    @staticmethod
+    def client_ip(request):
+        """
+        This function is used for getting the address of the client, skipping the trusted proxies in front of the app
+        :param request: http request
+        :return: client ip
+        """
+        proxies = settings.RATE_LIMIT_PROXY_COUNT
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if proxies and forwarded:
+            addresses = [address.strip() for address in forwarded.split(',')]
+            return addresses[-min(proxies, len(addresses))]
+        return request.META.get('REMOTE_ADDR', '')
+
+    @staticmethod
+    def identity(request, field):
+        """
+        This function is used for reading the username or email the request is made for, without parsing it in DRF
+        :param request: http request
+        :param field: name of the field in the request body
+        :return: lower cased value or None
+        """
+        if request.content_type == 'application/json':
+            try:
+                value = json.loads(request.body).get(field)
+            except (ValueError, AttributeError):
+                return None
         else:
-            return self.get_response(request)
+            value = request.POST.get(field)
+        return str(value).strip().lower()[:254] if value else None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.url_name if request.resolver_match else None
+        limits = settings.RATE_LIMITS.get(route)
+        if not limits or request.method in self.UNLIMITED_METHODS:
+            return None
+        buckets = [('ip', self.client_ip(request)) + tuple(limits['ip'])]
+        identity = self.identity(request, limits['field'])
+        if identity:
+            buckets.append(('username', identity) + tuple(limits['username']))
+        # a redis outage must not lock users out of login
+        if not Cache.breaker.allow():
+            return None
+        try:
+            retry_after = RateLimiter.consume(route, buckets)
+        except Exception as e:
+            log.error(e)
+            Cache.breaker.failure()
+            return None
+        Cache.breaker.success()
+        if retry_after:
+            log.info(f'{route} request is throttled')
+            response = JsonResponse({'response': 'Too many requests, please try again later'},
+                                    status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(retry_after)
+            return response
+        return None
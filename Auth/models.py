@@ -1,7 +1,10 @@
+import hashlib
+from datetime import datetime, timezone
 from django.contrib.auth.base_user import BaseUserManager
-from django.db import models
+from django.conf import settings
+from django.db import models, IntegrityError, transaction
 from django.contrib.auth.models import AbstractUser
-from django.utils.timezone import now
+from django.utils.timezone import now, make_naive
 
 
 class UserManager(BaseUserManager):
@@ -66,7 +69,50 @@ class User(AbstractUser):
 
 
 class TokenBlackList(models.Model):
-    """This model is used to store the used token so that we could check is the token is already used or not"""
+    """This model is used to store the used token so that we could check is the token is already used or not.
+    Tokens are stored as their fixed size sha256 digest on a unique index, and a row is kept only till the token
+    expires, as an expired token is rejected by its signature check anyway"""
 
-    token = models.CharField(max_length=300)
+    digest = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
     time = models.DateTimeField(default=now)
+
+    @staticmethod
+    def digest_of(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_used(token):
+        """
+        This function is used for checking if the token is already used
+        :param token: jwt token
+        :return: True if the token is blacklisted
+        """
+        return TokenBlackList.objects.filter(digest=TokenBlackList.digest_of(token)).exists()
+
+    @staticmethod
+    def mark_used(token, exp):
+        """
+        This function is used for blacklisting the token till its expiry
+        :param token: jwt token
+        :param exp: exp claim of the token
+        :return: False if the token was already used
+        """
+        expires_at = datetime.fromtimestamp(exp, tz=timezone.utc)
+        if not settings.USE_TZ:
+            expires_at = make_naive(expires_at)
+        try:
+            with transaction.atomic():
+                TokenBlackList.objects.create(digest=TokenBlackList.digest_of(token), expires_at=expires_at)
+            return True
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def purge():
+        """
+        This function is used for deleting the tokens which are expired
+        :return: number of deleted tokens
+        """
+        deleted, _ = TokenBlackList.objects.filter(expires_at__lte=now()).delete()
+        return deleted
@@ -1,14 +1,14 @@
 from rest_framework import permissions
-import enum
 
-from Auth.models import Roles
+from Auth.roles import Role, RoleRegistry
+
 
 class isAdmin(permissions.BasePermission):
     message = {'response': 'You are not an admin. Access Denied!'}
 
     def has_permission(self, request, view):
         """ This function is used for Admin permission"""
-        return request.META['user'].role == Roles.objects.get(role='admin') or request.META['user'].is_superuser
+        return RoleRegistry.has_role(request.META['user'], Role.ADMIN) or request.META['user'].is_superuser
 
 
 class isMentorOrAdmin(permissions.BasePermission):
@@ -16,7 +16,7 @@ class isMentorOrAdmin(permissions.BasePermission):
 
     def has_permission(self, request, view):
         """ This function is used for Admin or Mentor permission"""
-        return request.META['user'].role == Roles.objects.get(role='mentor') or request.META['user'].role == Roles.objects.get(role='admin')
+        return RoleRegistry.has_role(request.META['user'], Role.MENTOR, Role.ADMIN)
 
 
 class OnlyStudent(permissions.BasePermission):
@@ -24,4 +24,4 @@ class OnlyStudent(permissions.BasePermission):
 
     def has_permission(self, request, view):
         """ This function is used for Student permission"""
-        return request.META['user'].role == Roles.objects.get(role='student')
+        return RoleRegistry.has_role(request.META['user'], Role.STUDENT)
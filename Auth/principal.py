@@ -0,0 +1,94 @@
+import json
+import sys
+
+from .models import User
+from .roles import RoleRegistry
+
+sys.path.append('..')
+from LMS.cache import SessionStore
+from LMS.loggerConfig import log
+
+
+class Principal:
+    """
+    Compact snapshot of the logged in user kept next to the token in the redis session, so the token
+    authentication middleware can build request.META['user'] without a database query
+    """
+    USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email', 'role_id', 'is_superuser')
+
+    @staticmethod
+    def profile_id(user):
+        """
+        This function is used for getting the mentor or student profile id of the user
+        :param user: user instance
+        :return: Mentor or Student primary key, None for other users
+        """
+        from Management.models import Mentor, Student
+        for model, field in ((Student, 'student_id'), (Mentor, 'mentor_id')):
+            profile = model.objects.filter(**{field: user.id}).values_list('id', flat=True).first()
+            if profile:
+                return profile
+        return None
+
+    @staticmethod
+    def snapshot(user, profile_id=None):
+        """
+        This function is used for creating the snapshot of the user
+        :param user: user instance
+        :param profile_id: mentor or student profile id, looked up when not given
+        :return: json string of the snapshot
+        """
+        data = {field: getattr(user, field) for field in Principal.USER_FIELDS}
+        data['profile_id'] = profile_id if profile_id is not None else Principal.profile_id(user)
+        return json.dumps(data)
+
+    @staticmethod
+    def to_user(snapshot):
+        """
+        This function is used for building the user from the snapshot. Fields which are not in the snapshot are
+        deferred, so they are loaded on first access and a save only writes the loaded fields
+        :param snapshot: json string of the snapshot
+        :return: user instance
+        """
+        return Principal._build(json.loads(snapshot))
+
+    @staticmethod
+    def from_claims(claims):
+        """
+        This function is used for building the user from the claims of a stateless access token
+        :param claims: decoded access token
+        :return: user instance
+        """
+        return Principal._build({'id': claims['uid'], 'username': claims['username'], 'role_id': claims['role'],
+                                 'is_superuser': claims['su'], 'profile_id': claims['pid']})
+
+    @staticmethod
+    def _build(data):
+        field_names = [field.attname for field in User._meta.concrete_fields if field.attname in data]
+        user = User.from_db('default', field_names, [data[name] for name in field_names])
+        user.role = RoleRegistry.by_id(user.role_id)
+        user.profile_id = data.get('profile_id')
+        return user
+
+    @staticmethod
+    def refresh(user, profile_id=None):
+        """
+        This function is used for rewriting the snapshot of a logged in user after user or profile is changed
+        :param user: user instance
+        :param profile_id: mentor or student profile id, looked up when not given
+        """
+        try:
+            SessionStore.update_principal(user.username, Principal.snapshot(user, profile_id))
+        except Exception as e:
+            log.error(e)
+
+    @staticmethod
+    def discard(user):
+        """
+        This function is used for removing the sessions of a deleted user
+        :param user: user instance
+        """
+        try:
+            SessionStore.revoke_all(user.username)
+        except Exception as e:
+            log.error(e)
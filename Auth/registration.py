@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import django
+import pandas
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import User, Roles
+from .roles import Role, RoleRegistry
+from .serializer import BulkUserSerializer
+import sys
+
+sys.path.append('..')
+from LMS.loggerConfig import log
+from Management.utils import GeneratePassword
+
+
+class RegistrationFileException(Exception):
+    pass
+
+
+_hasher_pool = None
+_hasher_pool_lock = threading.Lock()
+
+
+def _setup_hasher_process():
+    """Hasher processes are started with spawn, so they set up django before the password hashers can be loaded"""
+    django.setup()
+
+
+def _hasher_executor():
+    """
+    This function is used for getting the process pool of the password hashers. The pool is created on first use and
+    kept for the life of the worker, its processes are spawned so they do not inherit the db and redis connections of
+    the worker
+    :return: ProcessPoolExecutor
+    """
+    global _hasher_pool
+    with _hasher_pool_lock:
+        if _hasher_pool is None:
+            workers = settings.BULK_REGISTRATION_HASH_WORKERS or os.cpu_count() or 1
+            _hasher_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                               initializer=_setup_hasher_process)
+        return _hasher_pool
+
+
+def _discard_hasher_executor(executor):
+    global _hasher_pool
+    with _hasher_pool_lock:
+        if _hasher_pool is executor:
+            _hasher_pool = None
+    executor.shutdown(wait=False)
+
+
+class BulkRegistration:
+    """
+    Registration of many users at once. Rows are validated without queries, uniqueness is checked for the whole batch
+    in one query, passwords are hashed on a process pool and users and their Student/Mentor profiles are inserted
+    with bulk_create
+    """
+    COLUMNS = ('username', 'first_name', 'last_name', 'email', 'mobile', 'role')
+    UNIQUE_FIELDS = ('username', 'email', 'mobile')
+
+    @staticmethod
+    def read_rows(data, file=None):
+        """
+        This function is used for reading the rows of a csv/xlsx file or of a json array
+        :param data: json array of users
+        :param file: uploaded csv or xlsx file
+        :return: list of rows
+        """
+        if file is None:
+            if not isinstance(data, list):
+                raise RegistrationFileException('Users should be sent as a json array or a csv/xlsx file')
+            return data
+        name = file.name.lower()
+        if name.endswith('.csv'):
+            df = pandas.read_csv(file, dtype=str)
+        elif name.endswith('.xlsx'):
+            df = pandas.read_excel(file, dtype=str)
+        else:
+            raise RegistrationFileException('Only csv and xlsx files are supported')
+        df.columns = [str(column).strip().lower() for column in df.columns]
+        missing = [column for column in BulkRegistration.COLUMNS[1:] if column not in df.columns]
+        if missing:
+            raise RegistrationFileException(f"Columns {', '.join(missing)} are missing")
+        return df.where(df.notnull(), None).to_dict('records')
+
+    @staticmethod
+    def role_of(value):
+        """
+        This function is used for resolving a role given by its id or name
+        :param value: role id or role name
+        :return: Roles instance or None
+        """
+        try:
+            if str(value).isdigit():
+                return RoleRegistry.by_id(int(value))
+            return RoleRegistry.get(str(value).strip().lower())
+        except Roles.DoesNotExist:
+            return None
+
+    @staticmethod
+    def validate(rows):
+        """
+        This function is used for validating the rows, duplicates within the batch and against the existing users
+        :param rows: list of rows
+        :return: list of (validated data or None, errors) in the order of the rows
+        """
+        results = []
+        for row in rows:
+            row = dict(row) if isinstance(row, dict) else {}
+            if not row.get('username'):
+                row['username'] = row.get('email')
+            serializer = BulkUserSerializer(data=row)
+            if not serializer.is_valid():
+                results.append((None, serializer.errors))
+                continue
+            data = dict(serializer.validated_data)
+            data['email'] = User.objects.normalize_email(data['email'])
+            data['role'] = BulkRegistration.role_of(data['role'])
+            if data['role'] is None:
+                results.append((None, {'role': ['Role does not exist']}))
+                continue
+            results.append((data, {}))
+
+        valid = [data for data, _ in results if data]
+        condition = Q()
+        for field in BulkRegistration.UNIQUE_FIELDS:
+            condition |= Q(**{f"{field}__in": {data[field] for data in valid}})
+        existing = {field: set() for field in BulkRegistration.UNIQUE_FIELDS}
+        if valid:
+            for user in User.objects.filter(condition).values(*BulkRegistration.UNIQUE_FIELDS):
+                for field in BulkRegistration.UNIQUE_FIELDS:
+                    existing[field].add(user[field])
+
+        for index, (data, errors) in enumerate(results):
+            if not data:
+                continue
+            for field in BulkRegistration.UNIQUE_FIELDS:
+                if data[field] in existing[field]:
+                    errors[field] = [f"This {field} is already registered! Try with different one"]
+            if errors:
+                results[index] = (None, errors)
+                continue
+            # later rows with the same values are duplicates of this one
+            for field in BulkRegistration.UNIQUE_FIELDS:
+                existing[field].add(data[field])
+        return results
+
+    @staticmethod
+    def hash_passwords(passwords):
+        """
+        This function is used for hashing the passwords, on a process pool when there are enough of them
+        :param passwords: raw passwords
+        :return: hashed passwords in the same order
+        """
+        workers = min(settings.BULK_REGISTRATION_HASH_WORKERS or os.cpu_count() or 1, len(passwords))
+        if len(passwords) < settings.BULK_REGISTRATION_POOL_THRESHOLD or workers < 2:
+            return [make_password(password) for password in passwords]
+        executor = _hasher_executor()
+        try:
+            return list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+        except BrokenProcessPool as e:
+            # a hasher process died, the next batch gets a new pool
+            log.error(f'Password hasher pool is broken: {e}')
+            _discard_hasher_executor(executor)
+            return [make_password(password) for password in passwords]
+
+    @staticmethod
+    def create_profiles(users, profile_ids):
+        """
+        This function is used for creating the Student and Mentor profiles which post_save creates for a single user
+        :param users: created users with primary keys
+        :param profile_ids: SID and MID ids reserved for the users
+        """
+        from Management.models import Student, Mentor
+        for role, model, field, id_field, name in ((Role.STUDENT, Student, 'student', 'sid', 'SID'),
+                                                   (Role.MENTOR, Mentor, 'mentor', 'mid', 'MID')):
+            role_users = [user for user in users if RoleRegistry.has_role(user, role)]
+            if role_users:
+                model.objects.bulk_create([model(**{field: user, id_field: profile_id})
+                                           for user, profile_id in zip(role_users, profile_ids[name])])
+
+    @staticmethod
+    def reserve_profile_ids(users):
+        """
+        This function is used for reserving the SID and MID ids of the users before the insert transaction, so the
+        reserved blocks stay valid if the transaction is rolled back
+        :param users: users to be created
+        :return: ids per sequence
+        """
+        from Management.models import IdAllocator
+        return {name: IdAllocator.next_ids(name, count) if count else []
+                for name, count in (('SID', sum(RoleRegistry.has_role(user, Role.STUDENT) for user in users)),
+                                    ('MID', sum(RoleRegistry.has_role(user, Role.MENTOR) for user in users)))}
+
+    @staticmethod
+    def register(rows):
+        """
+        This function is used for registering the valid rows
+        :param rows: list of rows
+        :return: per row report and the welcome mail data of the created users
+        """
+        results = BulkRegistration.validate(rows)
+        valid = [data for data, _ in results if data]
+        passwords = [GeneratePassword.generate_password(None) for _ in valid]
+        hashes = BulkRegistration.hash_passwords(passwords)
+        users = [User(username=data['username'], first_name=data['first_name'], last_name=data['last_name'],
+                      email=data['email'], mobile=data['mobile'], role=data['role'],
+                      password=password_hash)
+                 for data, password_hash in zip(valid, hashes)]
+        profile_ids = BulkRegistration.reserve_profile_ids(users)
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            if users and not connection.features.can_return_rows_from_bulk_insert:
+                ids = dict(User.objects.filter(username__in=[user.username for user in users])
+                           .values_list('username', 'id'))
+                for user in users:
+                    user.id = ids[user.username]
+            BulkRegistration.create_profiles(users, profile_ids)
+
+        report = []
+        created = iter(zip(users, passwords))
+        mails = []
+        for row_no, (data, errors) in enumerate(results, start=1):
+            if not data:
+                report.append({'row': row_no, 'status': 'failed', 'errors': errors})
+                continue
+            user, password = next(created)
+            report.append({'row': row_no, 'status': 'created', 'id': user.id, 'username': user.username,
+                           'role': user.role.role})
+            mails.append({'name': user.get_full_name(), 'username': user.username, 'password': password,
+                          'email': user.email})
+        log.info(f"{len(users)} of {len(results)} users are registered in bulk")
+        return report, mails
@@ -0,0 +1,137 @@
+import enum
+import threading
+import time
+import sys
+
+from django.conf import settings
+
+from .models import Roles
+
+sys.path.append('..')
+from LMS.cache import Cache
+from LMS.loggerConfig import log
+
+
+class Role(enum.Enum):
+    ADMIN = 'admin'
+    MENTOR = 'mentor'
+    STUDENT = 'student'
+
+
+class RoleRegistry:
+    """
+    Process local registry of the Roles table. Roles are loaded once per worker and compared by primary key, so role
+    checks in permissions and views do not hit the database. The registry is dropped by the post_save/post_delete
+    handlers of Roles and the other workers pick the change up through a version key kept in redis.
+    """
+    VERSION_KEY = 'roles:version'
+
+    _by_name = None
+    _by_id = None
+    _version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _remote_version():
+        # while redis is unavailable the loaded roles are kept
+        if not Cache.breaker.allow():
+            return RoleRegistry._version
+        try:
+            version = Cache.getCacheInstance().get(RoleRegistry.VERSION_KEY)
+        except Exception as e:
+            log.error(e)
+            Cache.breaker.failure()
+            return RoleRegistry._version
+        Cache.breaker.success()
+        return version.decode('utf-8') if version else None
+
+    @staticmethod
+    def _load():
+        """
+        This function is used for loading the roles table into the registry
+        :return: role name to role mapping
+        """
+        registry = RoleRegistry._by_name
+        age = time.monotonic() - RoleRegistry._checked_at
+        if registry is not None and age < settings.ROLE_REGISTRY_REFRESH_SECONDS:
+            return registry
+        # redis is read outside the lock, so a slow redis does not make every request thread wait for one call
+        version = RoleRegistry._remote_version()
+        with RoleRegistry._lock:
+            now = time.monotonic()
+            if RoleRegistry._by_name is None or version != RoleRegistry._version:
+                roles = list(Roles.objects.all())
+                RoleRegistry._by_name = {role.role: role for role in roles}
+                RoleRegistry._by_id = {role.id: role for role in roles}
+                RoleRegistry._version = version
+                log.info('Role registry loaded')
+            RoleRegistry._checked_at = now
+            return RoleRegistry._by_name
+
+    @staticmethod
+    def get(role):
+        """
+        This function is used for getting role instance by its name
+        :param role: Role enum member or role name
+        :return: Roles instance
+        """
+        name = getattr(role, 'value', role)
+        try:
+            return RoleRegistry._load()[name]
+        except KeyError:
+            raise Roles.DoesNotExist(f"Role {name} does not exist")
+
+    @staticmethod
+    def by_id(role_id):
+        """
+        This function is used for getting role instance by its primary key
+        :param role_id: Roles primary key
+        :return: Roles instance
+        """
+        RoleRegistry._load()
+        try:
+            return RoleRegistry._by_id[role_id]
+        except KeyError:
+            raise Roles.DoesNotExist(f"Role with id {role_id} does not exist")
+
+    @staticmethod
+    def has_role(user, *roles):
+        """
+        This function is used for checking user role without querying the database
+        :param user: user instance
+        :param roles: Role enum members or role names
+        :return: True if user has any of the given roles
+        """
+        registry = RoleRegistry._load()
+        return any(user.role_id == registry[getattr(role, 'value', role)].id for role in roles
+                   if getattr(role, 'value', role) in registry)
+
+    @staticmethod
+    def name_of(user):
+        """
+        This function is used for getting role name of the user
+        :param user: user instance
+        :return: role name
+        """
+        return RoleRegistry.by_id(user.role_id).role
+
+    @staticmethod
+    def invalidate(publish=True):
+        """
+        This function is used for dropping the registry of this worker and of the other workers when publish is set
+        """
+        with RoleRegistry._lock:
+            RoleRegistry._by_name = None
+            RoleRegistry._by_id = None
+        if publish:
+            if not Cache.breaker.allow():
+                log.error('Role change is not published, redis is unavailable')
+                return
+            try:
+                RoleRegistry._version = str(Cache.getCacheInstance().incr(RoleRegistry.VERSION_KEY))
+            except Exception as e:
+                log.error(e)
+                Cache.breaker.failure()
+                return
+            Cache.breaker.success()
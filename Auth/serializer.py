@@ -35,6 +35,16 @@ class UserSerializer(serializers.ModelSerializer):
         return data
 
 
+class BulkUserSerializer(serializers.Serializer):
+    """This Serializer is used to validate a row of the bulk registration, uniqueness is checked for the whole batch"""
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField(required=True)
+    first_name = serializers.RegexField(Pattern.NAME_PATTERN.value)
+    last_name = serializers.RegexField(Pattern.NAME_PATTERN.value)
+    mobile = serializers.RegexField(Pattern.MOBILE_PATTERN.value)
+    role = serializers.CharField(max_length=50)
+
+
 class UserLoginSerializer(serializers.ModelSerializer):
     """This Serializer is used to serializer user credential inputs """
     username = serializers.CharField(max_length=20, min_length=3, required=True)
@@ -59,6 +69,18 @@ class ChangeUserPasswordSerializer(serializers.Serializer):
         return data
 
 
+class RevokeSessionsSerializer(serializers.Serializer):
+    """ This serializer is used to select the user or the role whose sessions are revoked """
+    username = serializers.CharField(max_length=150, required=False)
+    role = serializers.PrimaryKeyRelatedField(queryset=Roles.objects.all(), required=False)
+
+    def validate(self, data):
+        """ Exactly one of username and role has to be given """
+        if bool(data.get('username')) == bool(data.get('role')):
+            raise serializers.ValidationError("Provide either username or role")
+        return data
+
+
 class ForgotPasswordSerializer(serializers.ModelSerializer):
     """ This is forgot password serializer where user can request for reset his password """
     class Meta:
@@ -0,0 +1,32 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from .models import Roles, User
+from .principal import Principal
+from .roles import RoleRegistry
+
+
+@receiver(signal=post_save, sender=Roles)
+@receiver(signal=post_delete, sender=Roles)
+def invalidate_role_registry(sender, instance, **kwargs):
+    """
+    This function is used for dropping the cached roles whenever a role is added, changed or deleted
+    """
+    RoleRegistry.invalidate()
+
+
+@receiver(signal=post_save, sender=User)
+def refresh_principal(sender, instance, created, update_fields=None, **kwargs):
+    """
+    This function is used for refreshing the cached principal of a logged in user when the user is changed
+    """
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    Principal.refresh(instance)
+
+
+@receiver(signal=post_delete, sender=User)
+def discard_principal(sender, instance, **kwargs):
+    """
+    This function is used for removing the session of a deleted user
+    """
+    Principal.discard(instance)
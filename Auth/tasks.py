@@ -1,20 +1,45 @@
 from __future__ import absolute_import, unicode_literals
 from celery import shared_task
+import time
 import sys
 sys.path.append("..")
-from LMS.mailConfirmation import Email
+from LMS.mailConfirmation import Email, MailOutbox
+from LMS.loggerConfig import log
 
 
 @shared_task()
 def send_registration_mail(data):
     """ This function is used for sending registration email """
-    Email.sendEmail(Email.configureAddUserEmail(data))
-    return f"Registration confirmation mail is sent {data['email']}"
+    MailOutbox.enqueue(Email.configureAddUserEmail(data))
+    return f"Registration confirmation mail is queued for {data['email']}"
+
+
+@shared_task()
+def send_registration_mails(data_list):
+    """ This function is used for sending the registration emails of a bulk registration, rendered in one pass """
+    MailOutbox.enqueue_many(Email.configureAddUserEmails(data_list))
+    return f"{len(data_list)} registration confirmation mails are queued"
 
 
 @shared_task()
 def send_password_reset_mail(data):
     """ This function is used for sending email when user forgot his password """
-    Email.sendEmail(Email.configurePasswordRestEmail(data))
-    return f"Password reset mail is sent"
+    start = time.perf_counter()
+    MailOutbox.enqueue(Email.configurePasswordRestEmail(data))
+    log.info(f"Password reset mail is prepared in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return f"Password reset mail is queued"
+
 
+@shared_task()
+def purge_token_blacklist():
+    """ This function is used for deleting the expired tokens from the blacklist """
+    from .models import TokenBlackList
+    return f"{TokenBlackList.purge()} expired tokens are purged"
+
+
+@shared_task()
+def flush_mail_outbox():
+    """ This function is used for sending the buffered mails in batches over one SMTP connection """
+    results = MailOutbox.flush()
+    sent = sum(1 for result in results if result['sent'])
+    return {'sent': sent, 'failed': len(results) - sent, 'results': results}
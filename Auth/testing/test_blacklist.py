@@ -0,0 +1,31 @@
+import time
+from django.test import TestCase
+import sys
+
+sys.path.append('..')
+from Auth.JWTAuthentication import JWTAuth
+from Auth.models import TokenBlackList
+
+
+class TokenBlackListTest(TestCase):
+
+    def setUp(self):
+        self.token = JWTAuth.getToken(username='student', password='secret')
+
+    def test_token_can_be_used_once(self):
+        self.assertFalse(TokenBlackList.is_used(self.token))
+        self.assertTrue(TokenBlackList.mark_used(self.token, time.time() + 60))
+        self.assertTrue(TokenBlackList.is_used(self.token))
+        self.assertFalse(TokenBlackList.mark_used(self.token, time.time() + 60))
+
+    def test_token_is_stored_as_fixed_size_digest(self):
+        TokenBlackList.mark_used(self.token, time.time() + 60)
+        self.assertEqual(TokenBlackList.objects.get().digest, TokenBlackList.digest_of(self.token))
+        self.assertEqual(len(TokenBlackList.digest_of(self.token * 10)), 64)
+
+    def test_purge_deletes_only_expired_tokens(self):
+        TokenBlackList.mark_used('expired', time.time() - 1)
+        TokenBlackList.mark_used(self.token, time.time() + 60)
+        self.assertEqual(TokenBlackList.purge(), 1)
+        self.assertTrue(TokenBlackList.is_used(self.token))
+        self.assertFalse(TokenBlackList.is_used('expired'))
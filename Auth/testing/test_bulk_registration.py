@@ -0,0 +1,123 @@
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+import json
+import sys
+
+sys.path.append('..')
+from Auth.models import User, Roles
+from Auth.JWTAuthentication import JWTAuth
+from Auth.principal import Principal
+from Auth import registration
+from Auth.registration import BulkRegistration
+from Auth.roles import RoleRegistry
+from LMS.cache import SessionStore
+from Management.models import Student, Mentor
+
+
+@mock.patch('Auth.views.send_registration_mails')
+class BulkUserRegistrationTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        self.client = Client()
+        admin_role = Roles.objects.create(role='admin')
+        self.student_role = Roles.objects.create(role='student')
+        Roles.objects.create(role='mentor')
+        self.admin = User.objects.create_user(username='admin', first_name='Admin', last_name='Admin',
+                                              role=admin_role, mobile='8989898989',
+                                              email='admin@gmail.com', password='admin123')
+        RoleRegistry.invalidate(publish=False)
+        SessionStore.local.clear()
+        patcher = mock.patch('LMS.cache.SessionStore.fetch', return_value=Principal.snapshot(self.admin))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.headers = {'HTTP_AUTHORIZATION': JWTAuth.getToken(username='admin', password='secret')}
+        self.rows = [
+            {'first_name': 'Ravi', 'last_name': 'Kumar', 'email': 'ravi@gmail.com', 'mobile': '9876543210',
+             'role': 'student'},
+            {'first_name': 'Asha', 'last_name': 'Rao', 'email': 'asha@gmail.com', 'mobile': '9876543211',
+             'role': 'mentor'},
+            {'first_name': 'Ravi', 'last_name': 'Sharma', 'email': 'ravi@gmail.com', 'mobile': '9876543212',
+             'role': 'student'},
+            {'first_name': 'Neha', 'last_name': 'Jain', 'email': 'neha@gmail.com', 'mobile': '8989898989',
+             'role': 'student'},
+            {'first_name': 'Anil', 'last_name': 'Das', 'email': 'anil@gmail.com', 'mobile': '12345',
+             'role': 'student'},
+            {'first_name': 'Mona', 'last_name': 'Sen', 'email': 'mona@gmail.com', 'mobile': '9876543213',
+             'role': str(self.student_role.id)},
+        ]
+
+    def post(self, **kwargs):
+        return self.client.post(reverse('register-users'), secure=True, **self.headers, **kwargs)
+
+    def test_valid_rows_are_created_with_profiles_and_report(self, send_mails):
+        response = self.post(data=json.dumps(self.rows), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        report = response.data['response']
+        self.assertEqual((report['created'], report['failed']), (3, 3))
+        self.assertEqual([row['status'] for row in report['rows']],
+                         ['created', 'created', 'failed', 'failed', 'failed', 'created'])
+        self.assertIn('email', report['rows'][2]['errors'])
+        self.assertIn('mobile', report['rows'][3]['errors'])
+        self.assertIn('mobile', report['rows'][4]['errors'])
+        ravi = User.objects.get(username='ravi@gmail.com')
+        self.assertEqual(Student.objects.get(student=ravi).sid, 'SI-1000')
+        self.assertEqual(Student.objects.get(student__username='mona@gmail.com').sid, 'SI-1001')
+        self.assertEqual(Mentor.objects.get(mentor__username='asha@gmail.com').mid, 'MI-1000')
+        # one batched mail job carrying the generated passwords
+        mails = send_mails.delay.call_args[0][0]
+        send_mails.delay.assert_called_once()
+        self.assertEqual([mail['email'] for mail in mails], ['ravi@gmail.com', 'asha@gmail.com', 'mona@gmail.com'])
+        self.assertTrue(ravi.check_password(mails[0]['password']))
+
+    def test_users_are_read_from_csv(self, send_mails):
+        csv = 'first_name,last_name,email,mobile,role\nRavi,Kumar,ravi@gmail.com,9876543210,student\n'
+        response = self.post(data={'file': SimpleUploadedFile('users.csv', csv.encode('utf-8'))})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Student.objects.filter(student__username='ravi@gmail.com').exists())
+
+    def test_query_count_does_not_grow_with_rows(self, send_mails):
+        RoleRegistry.get('student')
+        queries = []
+        # the first batch also creates the SID sequence
+        for batch, size in enumerate((1, 5, 20)):
+            rows = [{'first_name': 'Ravi', 'last_name': 'Kumar', 'email': f'ravi{batch}-{i}@gmail.com',
+                     'mobile': f'9{batch}7654{i:04d}', 'role': 'student'} for i in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                report, mails = BulkRegistration.register(rows)
+            self.assertEqual(len(mails), size)
+            queries.append(len(context.captured_queries))
+        self.assertEqual(queries[1], queries[2])
+
+    def test_file_type_is_checked(self, send_mails):
+        response = self.post(data={'file': SimpleUploadedFile('users.txt', b'data')})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PasswordHashingTest(TestCase):
+
+    @override_settings(BULK_REGISTRATION_POOL_THRESHOLD=2, BULK_REGISTRATION_HASH_WORKERS=2)
+    def test_passwords_are_hashed_on_process_pool(self):
+        hashes = BulkRegistration.hash_passwords(['abcde-12345', 'fghij-67890', 'klmno-13579'])
+        user = User(password=hashes[1])
+        self.assertTrue(user.check_password('fghij-67890'))
+        self.assertEqual(len(set(hashes)), 3)
+
+    @override_settings(BULK_REGISTRATION_POOL_THRESHOLD=2, BULK_REGISTRATION_HASH_WORKERS=2)
+    def test_pool_is_spawned_once_and_replaced_when_broken(self):
+        executor = registration._hasher_executor()
+        self.assertIs(registration._hasher_executor(), executor)
+        self.assertEqual(executor._mp_context.get_start_method(), 'spawn')
+        with mock.patch.object(executor, 'map', side_effect=BrokenProcessPool('hasher died')):
+            hashes = BulkRegistration.hash_passwords(['abcde-12345', 'fghij-67890'])
+        self.assertTrue(User(password=hashes[0]).check_password('abcde-12345'))
+        self.assertIsNot(registration._hasher_executor(), executor)
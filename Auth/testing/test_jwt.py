@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase
+from unittest import mock
+import time
+import sys
+
+sys.path.append('..')
+from Auth.JWTAuthentication import JWTAuth, VerifiedTokenCache
+
+
+class VerifiedTokenCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        JWTAuth.verified_tokens.clear()
+
+    def test_second_verification_is_served_from_cache(self):
+        token = JWTAuth.getToken(username='admin', password='admin123')
+        self.assertEqual(JWTAuth.verifyToken(token)['username'], 'admin')
+        with mock.patch('Auth.JWTAuthentication.jwt.decode') as decode:
+            self.assertEqual(JWTAuth.verifyToken(token)['username'], 'admin')
+            decode.assert_not_called()
+        stats = JWTAuth.verified_tokens.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+    def test_invalid_token_is_not_cached(self):
+        self.assertFalse(JWTAuth.verifyToken('not-a-token'))
+        self.assertFalse(JWTAuth.verifyToken(None))
+        self.assertEqual(JWTAuth.verified_tokens.stats()['size'], 0)
+
+    def test_entries_expire_at_token_exp(self):
+        cache = VerifiedTokenCache(maxsize=10)
+        cache.put(b'expired', {'username': 'admin', 'exp': time.time() - 1})
+        self.assertIsNone(cache.get(b'expired'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = VerifiedTokenCache(maxsize=2)
+        exp = time.time() + 60
+        cache.put(b'first', {'exp': exp})
+        cache.put(b'second', {'exp': exp})
+        cache.get(b'first')
+        cache.put(b'third', {'exp': exp})
+        self.assertIsNone(cache.get(b'second'))
+        self.assertIsNotNone(cache.get(b'first'))
+        self.assertIsNotNone(cache.get(b'third'))
@@ -0,0 +1,123 @@
+import json
+import smtplib
+from unittest import mock
+from django.core import mail
+from django.core.mail import get_connection
+from django.template import loader
+from django.test import SimpleTestCase, override_settings
+from redis.exceptions import LockNotOwnedError
+import sys
+
+sys.path.append('..')
+from LMS.mailConfirmation import Email, MailOutbox, MailRenderer
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', MAIL_BATCH_SIZE=3,
+                   MAIL_FLUSH_SECONDS=10)
+class MailOutboxTest(SimpleTestCase):
+
+    def setUp(self):
+        self.data = {'email_subject': 'Access Your Account', 'email_body': '<p>Welcome</p>',
+                     'to_email': 'student@gmail.com', 'attempts': 0}
+
+    @mock.patch('Auth.tasks.flush_mail_outbox')
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_flush_is_scheduled_on_first_mail_and_started_on_full_batch(self, cache, flush):
+        for buffered in (1, 2, 3):
+            cache.return_value.rpush.return_value = buffered
+            MailOutbox.enqueue(self.data)
+        flush.apply_async.assert_called_once_with(countdown=10)
+        flush.delay.assert_called_once_with()
+
+    def test_mail_is_delivered_over_given_connection(self):
+        connection = get_connection()
+        result = MailOutbox.deliver(self.data, connection)
+        self.assertEqual(result, {'to_email': 'student@gmail.com', 'email_subject': 'Access Your Account',
+                                  'sent': True})
+        self.assertEqual(mail.outbox[-1].to, ['student@gmail.com'])
+        self.assertIs(mail.outbox[-1].connection, connection)
+
+    def test_failed_mail_is_reported(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = OSError('connection refused')
+        result = MailOutbox.deliver(self.data, connection)
+        self.assertFalse(result['sent'])
+        self.assertEqual(result['error'], 'connection refused')
+
+    def flush(self, connection, batch_size=4, batches=1, release_error=None):
+        batch = [json.dumps(dict(self.data, to_email=f'student{i}@gmail.com')) for i in range(batch_size)]
+        with mock.patch('LMS.cache.Cache.getCacheInstance') as cache, \
+                mock.patch('LMS.mailConfirmation.Cache.runScript', side_effect=[batch] * batches + [[]]) as claim, \
+                mock.patch('LMS.mailConfirmation.get_connection', return_value=connection), \
+                mock.patch('LMS.mailConfirmation.MailOutbox.enqueue') as enqueue:
+            cache.return_value.lock.return_value.release.side_effect = release_error
+            results = MailOutbox.flush()
+        self.claims = claim.call_count
+        return results, enqueue
+
+    def test_connection_is_opened_again_after_a_connection_error(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, smtplib.SMTPServerDisconnected('connection lost'), 1, 1]
+        results, enqueue = self.flush(connection)
+        self.assertEqual([result['sent'] for result in results], [True, False, True, True])
+        self.assertEqual(connection.open.call_count, 2)
+        enqueue.assert_called_once_with(dict(self.data, to_email='student1@gmail.com'), attempts=1)
+
+    def test_rest_of_batch_keeps_its_attempts_when_connection_can_not_be_opened(self):
+        connection = mock.Mock()
+        connection.open.side_effect = [True, OSError('connection refused')]
+        connection.send_messages.side_effect = [1, smtplib.SMTPServerDisconnected('connection lost')]
+        results, enqueue = self.flush(connection)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(enqueue.call_args_list, [
+            mock.call(dict(self.data, to_email='student2@gmail.com'), attempts=0),
+            mock.call(dict(self.data, to_email='student3@gmail.com'), attempts=0),
+            mock.call(dict(self.data, to_email='student1@gmail.com'), attempts=1)])
+
+    def test_no_batch_is_claimed_after_the_last_mail_of_a_batch_loses_the_connection(self):
+        connection = mock.Mock()
+        connection.open.side_effect = [True, OSError('connection refused')]
+        connection.send_messages.side_effect = [1, smtplib.SMTPServerDisconnected('connection lost')]
+        results, enqueue = self.flush(connection, batch_size=2, batches=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.claims, 1)
+        enqueue.assert_called_once_with(dict(self.data, to_email='student1@gmail.com'), attempts=1)
+
+    def test_failed_mails_are_buffered_again_when_the_lock_is_lost(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, smtplib.SMTPRecipientsRefused({})]
+        results, enqueue = self.flush(connection, batch_size=2, release_error=LockNotOwnedError('expired'))
+        self.assertEqual([result['sent'] for result in results], [True, False])
+        enqueue.assert_called_once_with(dict(self.data, to_email='student1@gmail.com'), attempts=1)
+
+    def test_refused_recipient_keeps_the_connection(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [smtplib.SMTPRecipientsRefused({}), 1]
+        results, _ = self.flush(connection, batch_size=2)
+        self.assertEqual([result['sent'] for result in results], [False, True])
+        connection.open.assert_called_once_with()
+
+
+class MailRendererTest(SimpleTestCase):
+
+    def setUp(self):
+        self.digests = [{'name': f'Student {i}', 'email': f'student{i}@gmail.com',
+                         'reviews': [{'week_no': 1, 'score': 80 + i, 'course': 'Python', 'mentor': 'Mentor Mentor',
+                                      'remark': 'Good'}]} for i in range(3)]
+
+    def test_template_is_compiled_once_for_many_recipients(self):
+        MailRenderer._templates.pop('review_digest_mail_template.html', None)
+        with mock.patch('LMS.mailConfirmation.get_template', wraps=loader.get_template) as get_template:
+            mails = Email.configure_review_digest_mails(self.digests)
+            Email.configure_review_digest_mails(self.digests[:1])
+        get_template.assert_called_once_with('review_digest_mail_template.html')
+        self.assertEqual([mail['to_email'] for mail in mails], [digest['email'] for digest in self.digests])
+        self.assertIn('Student 2', mails[2]['email_body'])
+        self.assertIn('82', mails[2]['email_body'])
+
+    def test_render_timings_are_counted(self):
+        before = MailRenderer.stats().get('review_digest_mail_template.html', {}).get('renders', 0)
+        Email.configure_review_digest_mails(self.digests)
+        stats = MailRenderer.stats()['review_digest_mail_template.html']
+        self.assertEqual(stats['renders'], before + 3)
+        self.assertIsNotNone(stats['compile_ms'])
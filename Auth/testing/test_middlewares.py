@@ -0,0 +1,69 @@
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from rest_framework import status
+import time
+import sys
+
+sys.path.append('..')
+from Auth.models import User, Roles
+from Auth.JWTAuthentication import JWTAuth
+from Auth.roles import Role, RoleRegistry
+from LMS.cache import Cache, CircuitBreaker, RevokedTokens
+
+
+class StatelessAuthenticationTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        self.client = Client()
+        admin_role = Roles.objects.create(role='admin')
+        self.admin = User.objects.create_user(username='admin', first_name='Admin', last_name='Admin',
+                                              role=admin_role, mobile='8989898989',
+                                              email='admin@gmail.com', password='admin123')
+        RoleRegistry.invalidate(publish=False)
+        RoleRegistry.get(Role.ADMIN)
+        # revocation set is freshly synced and empty, so no redis call is due
+        RevokedTokens._revoked = frozenset()
+        RevokedTokens._synced_at = time.monotonic()
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance', side_effect=AssertionError('redis is called'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.token = JWTAuth.getAccessToken(self.admin, profile_id=None)
+
+    @override_settings(AUTH_STATELESS_MODE=True)
+    def test_access_token_is_authorized_without_redis_or_user_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('all-courses'), secure=True, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(AUTH_STATELESS_MODE=True)
+    def test_revoked_access_token_is_rejected(self):
+        RevokedTokens._revoked = frozenset([JWTAuth.verifyToken(self.token)['jti']])
+        response = self.client.get(reverse('all-courses'), secure=True, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_STATELESS_MODE=True)
+    def test_refresh_token_is_not_accepted_as_access_token(self):
+        refresh_token = JWTAuth.getRefreshToken(self.admin.username)
+        response = self.client.get(reverse('all-courses'), secure=True, HTTP_AUTHORIZATION=refresh_token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_STATELESS_MODE=True)
+    def test_sessions_are_not_revoked_while_redis_is_unavailable(self):
+        Cache.breaker.state = CircuitBreaker.OPEN
+        Cache.breaker.opened_at = float('inf')
+        self.addCleanup(Cache.breaker.reset)
+        response = self.client.post(reverse('revoke-sessions'), {'username': 'student'}, secure=True,
+                                    HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        with mock.patch('LMS.cache.Cache.runScript'):
+            response = self.client.get(reverse('logout'), secure=True, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_access_token_is_rejected_when_stateless_mode_is_disabled(self):
+        response = self.client.get(reverse('all-courses'), secure=True, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
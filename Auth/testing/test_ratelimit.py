@@ -0,0 +1,55 @@
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from rest_framework import status
+import json
+import sys
+
+sys.path.append('..')
+from LMS.cache import Cache, RateLimiter
+
+RATE_LIMITS = {
+    'login': {'field': 'username', 'ip': (20, 60), 'username': (5, 60)},
+}
+
+
+@override_settings(RATE_LIMITS=RATE_LIMITS)
+class RateLimitMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        Cache.breaker.reset()
+        self.addCleanup(Cache.breaker.reset)
+
+    def login(self, **extra):
+        return self.client.post(reverse('login'), data=json.dumps({'username': 'Student', 'password': 'wrong-password'}),
+                                content_type='application/json', secure=True, **extra)
+
+    @mock.patch('Auth.views.authenticate')
+    @mock.patch.object(RateLimiter, 'consume', return_value=7)
+    def test_throttled_login_is_rejected_before_password_check(self, consume, authenticate):
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '7')
+        authenticate.assert_not_called()
+
+    @mock.patch.object(RateLimiter, 'consume', return_value=0)
+    def test_login_is_charged_per_ip_and_username(self, consume):
+        response = self.login(REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        consume.assert_called_once_with('login', [('ip', '10.0.0.1', 20, 60), ('username', 'student', 5, 60)])
+
+    @override_settings(RATE_LIMIT_PROXY_COUNT=1)
+    @mock.patch.object(RateLimiter, 'consume', return_value=0)
+    def test_client_ip_is_taken_from_trusted_proxy(self, consume):
+        self.login(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2')
+        self.assertEqual(consume.call_args[0][1][0], ('ip', '2.2.2.2', 20, 60))
+
+    @mock.patch.object(RateLimiter, 'consume', side_effect=ConnectionError('redis is down'))
+    def test_login_is_allowed_when_redis_is_down(self, consume):
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @mock.patch.object(RateLimiter, 'consume')
+    def test_routes_without_limits_are_not_charged(self, consume):
+        self.client.get(reverse('all-courses'), secure=True)
+        consume.assert_not_called()
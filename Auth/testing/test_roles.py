@@ -0,0 +1,117 @@
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, Client, RequestFactory
+from django.urls import reverse
+from rest_framework import status
+import sys
+
+sys.path.append('..')
+from Auth.models import User, Roles
+from Auth.JWTAuthentication import JWTAuth
+from Auth.permissions import isAdmin, isMentorOrAdmin, OnlyStudent
+from Auth.principal import Principal
+from Auth.roles import Role, RoleRegistry
+from Management.models import Course, Student
+from LMS.cache import Cache, SessionStore
+
+
+class FakeRedis:
+    """Answers the role version lookups of the registry"""
+
+    def get(self, name):
+        return None
+
+    def incr(self, name):
+        return 1
+
+
+class RoleRegistryTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance', return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client()
+        self.admin_role = Roles.objects.create(role='admin')
+        self.student_role = Roles.objects.create(role='student')
+        self.mentor_role = Roles.objects.create(role='mentor')
+        self.admin = User.objects.create_user(username='admin', first_name='Admin', last_name='Admin',
+                                              role=self.admin_role, mobile='8989898989',
+                                              email='admin@gmail.com', password='admin123')
+        self.student = User.objects.create_user(username='student', first_name='Student', last_name='Student',
+                                                role=self.student_role, mobile='8080808080',
+                                                email='student@gmail.com', password='student123')
+        Course.objects.create(course_name='Python', duration_weeks=4)
+        RoleRegistry.invalidate(publish=False)
+        SessionStore.local.clear()
+
+    def auth_headers(self, user):
+        token = JWTAuth.getToken(username=user.username, password='secret')
+        for patcher in (mock.patch('LMS.cache.Cache.getCacheInstance', return_value=FakeRedis()),
+                        mock.patch('LMS.cache.SessionStore.fetch', return_value=Principal.snapshot(user))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return {'HTTP_AUTHORIZATION': token}
+
+    def test_role_checks_do_not_query_database_once_loaded(self):
+        request = RequestFactory().get('/')
+        request.META['user'] = User.objects.get(username='admin')
+        RoleRegistry.get(Role.ADMIN)
+        with self.assertNumQueries(0):
+            self.assertTrue(isAdmin().has_permission(request, None))
+            self.assertTrue(isMentorOrAdmin().has_permission(request, None))
+            self.assertFalse(OnlyStudent().has_permission(request, None))
+            self.assertEqual(RoleRegistry.name_of(request.META['user']), 'admin')
+
+    def test_registry_is_reloaded_after_role_is_added(self):
+        self.assertRaises(Roles.DoesNotExist, RoleRegistry.get, 'trainer')
+        trainer = Roles.objects.create(role='trainer')
+        self.assertEqual(RoleRegistry.get('trainer').id, trainer.id)
+
+    def test_version_is_read_outside_the_lock_and_through_the_breaker(self):
+        def get(name):
+            self.assertFalse(RoleRegistry._lock.locked())
+            raise ConnectionError('redis is down')
+
+        RoleRegistry.invalidate(publish=False)
+        Cache.breaker.reset()
+        self.addCleanup(Cache.breaker.reset)
+        with mock.patch.object(FakeRedis, 'get', side_effect=get) as redis_get:
+            for _ in range(settings.REDIS_BREAKER_FAILURES):
+                RoleRegistry._checked_at = 0.0
+                self.assertEqual(RoleRegistry.get(Role.ADMIN).id, self.admin_role.id)
+            RoleRegistry._checked_at = 0.0
+            RoleRegistry.get(Role.ADMIN)
+            Roles.objects.create(role='trainer')
+        self.assertEqual(redis_get.call_count, settings.REDIS_BREAKER_FAILURES)
+
+    def test_admin_endpoint_costs_only_data_queries(self):
+        headers = self.auth_headers(self.admin)
+        RoleRegistry.get(Role.ADMIN)
+        # user comes from the cached principal, the only query is for the courses
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('all-courses'), secure=True, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_student_endpoint_costs_no_role_queries(self):
+        headers = self.auth_headers(self.student)
+        RoleRegistry.get(Role.STUDENT)
+        student = Student.objects.get(student=self.student)
+        # student profile and the performance records
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('student-performance', kwargs={'student_id': student.id}),
+                                       secure=True, **headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_principal_snapshot_builds_user_without_queries(self):
+        snapshot = Principal.snapshot(self.student)
+        RoleRegistry.get(Role.STUDENT)
+        with self.assertNumQueries(0):
+            user = Principal.to_user(snapshot)
+            self.assertEqual(user.id, self.student.id)
+            self.assertEqual(user.get_full_name(), 'Student Student')
+            self.assertEqual(user.role.role, 'student')
+        self.assertEqual(user.profile_id, Student.objects.get(student=self.student).id)
+        # password is not part of the snapshot and is loaded on access
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('student123'))
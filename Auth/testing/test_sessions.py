@@ -0,0 +1,165 @@
+from unittest import mock
+from django.test import SimpleTestCase
+import redis
+import time
+import unittest
+import sys
+
+sys.path.append('..')
+from LMS.cache import Cache, CacheUnavailable, CircuitBreaker, SessionStore, RevokedTokens
+
+
+def redis_available():
+    try:
+        return Cache.getCacheInstance().ping()
+    except Exception:
+        return False
+
+
+@unittest.skipUnless(redis_available(), 'redis server is not reachable')
+class SessionStoreTest(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(SessionStore.revoke_all, 'test-user')
+        self.addCleanup(SessionStore.revoke_all, 'test-other')
+
+    def test_sessions_of_devices_are_kept_side_by_side(self):
+        SessionStore.create('test-user', 'token-1', 'principal', role_id=1)
+        SessionStore.create('test-user', 'token-2', 'principal', role_id=1)
+        self.assertEqual(SessionStore.fetch('test-user', 'token-1'), 'principal')
+        self.assertEqual(SessionStore.fetch('test-user', 'token-2'), 'principal')
+        SessionStore.revoke('test-user', 'token-1')
+        self.assertIsNone(SessionStore.fetch('test-user', 'token-1'))
+        self.assertEqual(SessionStore.fetch('test-user', 'token-2'), 'principal')
+
+    def test_revoke_all_keeps_only_given_session(self):
+        SessionStore.create('test-user', 'token-1', 'principal', role_id=1)
+        SessionStore.create('test-user', 'token-2', 'principal', role_id=1)
+        SessionStore.revoke_all('test-user', keep_token='token-2')
+        self.assertIsNone(SessionStore.fetch('test-user', 'token-1'))
+        self.assertEqual(SessionStore.fetch('test-user', 'token-2'), 'principal')
+
+    def test_revoke_role_ends_sessions_of_that_role_only(self):
+        SessionStore.create('test-user', 'token-1', 'principal', role_id=-1)
+        SessionStore.create('test-other', 'token-2', 'principal', role_id=-2)
+        SessionStore.revoke_role(-1)
+        self.assertIsNone(SessionStore.fetch('test-user', 'token-1'))
+        self.assertEqual(SessionStore.fetch('test-other', 'token-2'), 'principal')
+        SessionStore.create('test-user', 'token-3', 'principal', role_id=-1)
+        self.assertEqual(SessionStore.fetch('test-user', 'token-3'), 'principal')
+
+
+@unittest.skipUnless(redis_available(), 'redis server is not reachable')
+class RevokedTokensTest(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(Cache.getCacheInstance().delete, RevokedTokens.KEY)
+        self.addCleanup(setattr, RevokedTokens, '_revoked', frozenset())
+
+    def test_expiry_of_the_set_is_only_extended(self):
+        now = int(time.time())
+        RevokedTokens.revoke('late', now + 600)
+        RevokedTokens.revoke('early', now + 60)
+        self.assertGreater(Cache.getCacheInstance().ttl(RevokedTokens.KEY), 500)
+
+    def test_expired_ids_are_pruned(self):
+        now = int(time.time())
+        Cache.getCacheInstance().zadd(RevokedTokens.KEY, {'expired': now - 10})
+        RevokedTokens.revoke('live', now + 60)
+        self.assertEqual(Cache.getCacheInstance().zrange(RevokedTokens.KEY, 0, -1), [b'live'])
+
+
+@mock.patch('LMS.cache.SESSION_LOCAL_TTL', 0)
+class DegradedSessionLookupTest(SimpleTestCase):
+
+    def setUp(self):
+        Cache.breaker.reset()
+        SessionStore.local.clear()
+        self.addCleanup(Cache.breaker.reset)
+        self.addCleanup(SessionStore.local.clear)
+
+    def test_cached_session_is_served_while_redis_is_down(self):
+        with mock.patch.object(SessionStore, 'fetch', return_value='principal'):
+            self.assertEqual(SessionStore.authenticate('test-user', 'token-1'), 'principal')
+        with mock.patch.object(SessionStore, 'fetch', side_effect=redis.ConnectionError) as fetch:
+            self.assertEqual(SessionStore.authenticate('test-user', 'token-1'), 'principal')
+            self.assertIsNone(SessionStore.authenticate('test-user', 'token-2'))
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_stale_session_is_not_served(self):
+        with mock.patch.object(SessionStore, 'fetch', return_value='principal'):
+            SessionStore.authenticate('test-user', 'token-1')
+        with mock.patch('LMS.cache.SESSION_STALE_SECONDS', 0), \
+                mock.patch.object(SessionStore, 'fetch', side_effect=redis.ConnectionError):
+            self.assertIsNone(SessionStore.authenticate('test-user', 'token-1'))
+
+    def test_breaker_stops_calling_redis_after_failures(self):
+        with mock.patch.object(SessionStore, 'fetch', side_effect=redis.TimeoutError) as fetch:
+            for i in range(Cache.breaker.failures + 3):
+                SessionStore.authenticate('test-user', 'token-1')
+        self.assertEqual(fetch.call_count, Cache.breaker.failures)
+        self.assertEqual(Cache.breaker.stats()['state'], CircuitBreaker.OPEN)
+        self.assertEqual(Cache.breaker.stats()['skipped_calls'], 3)
+
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_sessions_are_revoked_through_the_breaker(self, cache):
+        cache.return_value.delete.side_effect = redis.ConnectionError
+        for i in range(Cache.breaker.failures):
+            with self.assertRaises(redis.ConnectionError):
+                SessionStore.revoke_all('test-user')
+        with self.assertRaises(CacheUnavailable):
+            SessionStore.revoke('test-user', 'token-1')
+        with self.assertRaises(CacheUnavailable):
+            SessionStore.revoke_role(1)
+        self.assertEqual(cache.return_value.delete.call_count, Cache.breaker.failures)
+        cache.return_value.hdel.assert_not_called()
+        cache.return_value.hincrby.assert_not_called()
+
+    def test_breaker_closes_after_successful_trial_call(self):
+        Cache.breaker.opened_at = 0.0
+        Cache.breaker.state = CircuitBreaker.OPEN
+        with mock.patch.object(SessionStore, 'fetch', return_value='principal'):
+            self.assertEqual(SessionStore.authenticate('test-user', 'token-1'), 'principal')
+        self.assertEqual(Cache.breaker.stats()['state'], CircuitBreaker.CLOSED)
+
+    def test_revoked_session_is_dropped_from_local_cache(self):
+        with mock.patch.object(SessionStore, 'fetch', return_value='principal'):
+            SessionStore.authenticate('test-user', 'token-1')
+        with mock.patch.object(Cache, 'getCacheInstance'):
+            SessionStore.revoke_all('test-user')
+        self.assertEqual(SessionStore.local.stats()['size'], 0)
+
+
+class RevokedTokensSyncTest(SimpleTestCase):
+
+    def setUp(self):
+        Cache.breaker.reset()
+        self.addCleanup(Cache.breaker.reset)
+        RevokedTokens._revoked = frozenset(['revoked'])
+        RevokedTokens._synced_at = 0.0
+        self.addCleanup(setattr, RevokedTokens, '_revoked', frozenset())
+
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_set_is_synced_from_redis(self, cache):
+        cache.return_value.zrangebyscore.return_value = [b'other']
+        self.assertFalse(RevokedTokens.is_revoked('revoked'))
+        self.assertTrue(RevokedTokens.is_revoked('other'))
+        cache.return_value.zrangebyscore.assert_called_once()
+
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_last_synced_set_is_kept_while_redis_is_down(self, cache):
+        cache.return_value.zrangebyscore.side_effect = redis.ConnectionError
+        for i in range(Cache.breaker.failures + 3):
+            RevokedTokens._synced_at = 0.0
+            self.assertTrue(RevokedTokens.is_revoked('revoked'))
+        self.assertEqual(cache.return_value.zrangebyscore.call_count, Cache.breaker.failures)
+        self.assertEqual(Cache.breaker.stats()['state'], CircuitBreaker.OPEN)
+
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_set_is_not_read_under_the_lock(self, cache):
+        def zrangebyscore(*args):
+            self.assertFalse(RevokedTokens._lock.locked())
+            return []
+        cache.return_value.zrangebyscore.side_effect = zrangebyscore
+        self.assertFalse(RevokedTokens.is_revoked('revoked'))
+        self.assertGreater(RevokedTokens._synced_at, time.monotonic() - 60)
@@ -0,0 +1,42 @@
+from unittest import mock
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework import status
+import redis
+import sys
+
+sys.path.append('..')
+from LMS.cache import ShortLinks
+from LMS.mailConfirmation import Email
+
+
+class ShortLinkTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.mail_data = {'name': 'Student Student', 'email': 'student@gmail.com', 'site': 'testserver',
+                          'token': 'reset-token'}
+
+    @mock.patch.object(ShortLinks, 'resolve', return_value='http://testserver/user/reset-password/?token=abc')
+    def test_short_link_redirects_to_full_url(self, resolve):
+        response = self.client.get(reverse('short-link', kwargs={'code': 'Ab3_x-9z'}), secure=True)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response['Location'], 'http://testserver/user/reset-password/?token=abc')
+        resolve.assert_called_once_with('Ab3_x-9z')
+
+    @mock.patch.object(ShortLinks, 'resolve', return_value=None)
+    def test_expired_short_link_is_not_found(self, resolve):
+        response = self.client.get(reverse('short-link', kwargs={'code': 'expired'}), secure=True)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @mock.patch.object(ShortLinks, 'create', return_value='Ab3_x-9z')
+    def test_reset_mail_links_to_local_short_url(self, create):
+        email_data = Email.configurePasswordRestEmail(self.mail_data)
+        self.assertIn(f"http://testserver{reverse('short-link', kwargs={'code': 'Ab3_x-9z'})}",
+                      email_data['email_body'])
+        create.assert_called_once_with(f"http://testserver{reverse('reset-password')}?token=reset-token")
+
+    @mock.patch.object(ShortLinks, 'create', side_effect=redis.ConnectionError)
+    def test_reset_mail_falls_back_to_full_url(self, create):
+        email_data = Email.configurePasswordRestEmail(self.mail_data)
+        self.assertIn(f"{reverse('reset-password')}?token=reset-token", email_data['email_body'])
@@ -5,10 +5,15 @@ from . import views
 urlpatterns = [
     path('role/', views.AddRoleAPIView.as_view(), name='role'),
     path('register-user/', views.UserRegistrationView.as_view(), name='register-user'),
+    path('register-users/', views.BulkUserRegistrationView.as_view(), name='register-users'),
     path('login/', views.UserLoginView.as_view(), name='login'),
     path('logout/', views.UserLogoutView.as_view(), name='logout'),
+    path('token-refresh/', views.TokenRefreshView.as_view(), name='token-refresh'),
+    path('revoke-sessions/', views.RevokeSessionsAPIView.as_view(), name='revoke-sessions'),
     path('change-password/', views.ChangeUserPasswordView.as_view(), name='change-password'),
     path('forgot-password/', views.ForgotPasswordView.as_view(), name='forgot-password'),
     path('reset-password/', views.ResetPasswordView.as_view(), name='reset-password'),
+    path('metrics/', views.MetricsAPIView.as_view(), name='metrics'),
+    path('l/<str:code>/', views.ShortLinkRedirectView.as_view(), name='short-link'),
 
 ]
\ No newline at end of file
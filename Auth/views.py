@@ -3,25 +3,31 @@ from rest_framework import status
 from rest_framework.generics import GenericAPIView
 from .serializer import *
 from .permissions import isAdmin
+from .principal import Principal
+from .roles import RoleRegistry
+from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
+from django.http import HttpResponseRedirect
 from django.contrib.auth import authenticate
 from .JWTAuthentication import JWTAuth
 from django.utils.decorators import method_decorator
 from .middlewares import TokenAuthentication, CantAccessAfterLogin
 from django.contrib.auth.hashers import check_password
 from .models import User, TokenBlackList, Roles
-from django.db import IntegrityError
-from .tasks import send_registration_mail, send_password_reset_mail
+from django.db import IntegrityError, transaction
+from .tasks import send_registration_mail, send_registration_mails, send_password_reset_mail
+from .registration import BulkRegistration, RegistrationFileException
 import sys
 
 sys.path.append('..')
 from LMS.loggerConfig import log
 from Management.utils import GeneratePassword
-from LMS.cache import Cache
+from LMS.cache import Cache, SessionStore, RevokedTokens, RateLimiter, ShortLinks
 import datetime
+import redis
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from LMS.mailConfirmation import Email
+from LMS.mailConfirmation import Email, MailRenderer
 
 
 class AddRoleAPIView(GenericAPIView):
@@ -84,7 +90,7 @@ class UserRegistrationView(GenericAPIView):
         email = serializer.data.get('email')
         mobile = serializer.data.get('mobile')
         roles = serializer.data.get('role')
-        role = Roles.objects.get(id=roles)
+        role = RoleRegistry.by_id(roles)
         password = GeneratePassword.generate_password(self)
         user = User.objects.create_user(username=username, first_name=first_name, last_name=last_name,
                                         email=email, mobile=mobile, role=role, password=password)
@@ -103,6 +109,35 @@ class UserRegistrationView(GenericAPIView):
             status=status.HTTP_201_CREATED)
 
 
+@method_decorator(TokenAuthentication, name='dispatch')
+class BulkUserRegistrationView(GenericAPIView):
+    """ This API is used to Register many Users at once """
+    serializer_class = BulkUserSerializer
+    permission_classes = (isAdmin,)
+
+    def post(self, request):
+        """This API is used by an Admin to add users from a csv/xlsx file or a json array and informs every created
+         user about their account creation via email
+         :request params : file with username, first_name, last_name, email, mobile, role columns or json array
+         :return: result of every row
+        """
+        try:
+            rows = BulkRegistration.read_rows(request.data, request.FILES.get('file'))
+        except RegistrationFileException as e:
+            log.error(e)
+            return Response({'response': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not rows or len(rows) > settings.BULK_REGISTRATION_MAX_ROWS:
+            return Response({'response': f"Send between 1 and {settings.BULK_REGISTRATION_MAX_ROWS} users"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        report, mails = BulkRegistration.register(rows)
+        site = get_current_site(request).domain
+        if mails:
+            send_registration_mails.delay([dict(mail, site=site) for mail in mails])
+        log.info(f"{len(mails)} users are registered and mails are sent")
+        return Response({'response': {'created': len(mails), 'failed': len(report) - len(mails), 'rows': report}},
+                        status=status.HTTP_201_CREATED if mails else status.HTTP_400_BAD_REQUEST)
+
+
 @method_decorator(CantAccessAfterLogin, name='dispatch')
 class UserLoginView(GenericAPIView):
     """ This API is used to logged in the user"""
@@ -119,21 +154,28 @@ class UserLoginView(GenericAPIView):
         password = serializer.data.get('password')
         user = authenticate(request, username=username, password=password)
         if user:
-            role = user.role
+            role = RoleRegistry.by_id(user.role_id)
             user.last_login = str(datetime.datetime.now())
-            user.save()
+            user.save(update_fields=['last_login'])
             log.info('successful login')
-            jwt_token = JWTAuth.getToken(username=username, password=password)
             response = Response(
                 {'response': f'You are logged in successfully', 'username': username, 'role': role.role},
                 status=status.HTTP_200_OK)
-            response['Authorization'] = jwt_token
             response["Access-Control-Allow-Headers"] = "X-Requested-With,Content-Type,Authorization"
-            response['Access-Control-Expose-Headers']='Authorization'
+            if settings.AUTH_STATELESS_MODE:
+                profile_id = Principal.profile_id(user)
+                jwt_token = JWTAuth.getAccessToken(user, profile_id)
+                session_token = JWTAuth.getRefreshToken(username)
+                principal = Principal.snapshot(user, profile_id)
+                response['Refresh-Token'] = session_token
+                response['Access-Control-Expose-Headers'] = 'Authorization,Refresh-Token'
+            else:
+                jwt_token = session_token = JWTAuth.getToken(username=username, password=password)
+                principal = Principal.snapshot(user)
+                response['Access-Control-Expose-Headers'] = 'Authorization'
+            response['Authorization'] = jwt_token
             # token is storing in redis cache
-            cache = Cache.getCacheInstance()
-            cache.hmset(username, {'auth': jwt_token})
-            cache.expire(username, time=datetime.timedelta(days=2))
+            SessionStore.create(username, session_token, principal, user.role_id)
             return response
         log.info('bad credential found')
         return Response({'response': 'Bad credential found'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -147,14 +189,55 @@ class UserLogoutView(GenericAPIView):
     def get(self, request):
         """This API is used to log user out and to clear the user session
         """
-        cache = Cache.getCacheInstance()
         user = request.META.get('user')
-        if user:
-            cache.delete(user.username)  # deleting redis cache
+        token = request.headers.get('Authorization')
+        jwtData = JWTAuth.verifyToken(token)
+        try:
+            if jwtData and jwtData.get('type') == 'access':
+                RevokedTokens.revoke(jwtData['jti'], jwtData['exp'])  # stateless access token stays valid till revoked
+                refresh_token = request.headers.get('Refresh-Token')
+                if refresh_token:
+                    SessionStore.revoke(user.username, refresh_token)
+                else:
+                    SessionStore.revoke_all(user.username)
+            else:
+                SessionStore.revoke(user.username, token)  # deleting session of this device from redis cache
+        except redis.RedisError as e:
+            # the session is still live, the client has to logout again
+            log.error(e)
+            return Response({'response': 'You can not be logged out right now'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
         log.info('logout successful')
         return Response({'response': 'You are logged out'}, status=status.HTTP_200_OK)
 
 
+class TokenRefreshView(GenericAPIView):
+    """ This API is used to get a new access token in the stateless auth mode """
+
+    def post(self, request):
+        """This API is used to issue a new access token for the refresh token of a live session
+        @param request: Refresh-Token header
+        @return: new access token in Authorization header
+        """
+        if not settings.AUTH_STATELESS_MODE:
+            return Response({'response': 'Stateless auth mode is disabled'}, status=status.HTTP_400_BAD_REQUEST)
+        refresh_token = request.headers.get('Refresh-Token')
+        jwtData = JWTAuth.verifyToken(refresh_token)
+        if not jwtData or jwtData.get('type') != 'refresh':
+            log.info('Invalid refresh token')
+            return Response({'response': 'Invalid refresh token'}, status=status.HTTP_401_UNAUTHORIZED)
+        principal = SessionStore.fetch(jwtData.get('username'), refresh_token)
+        if not principal:
+            log.info('Session of refresh token is not found')
+            return Response({'response': 'Session expired, login again'}, status=status.HTTP_401_UNAUTHORIZED)
+        user = Principal.to_user(principal)
+        response = Response({'response': 'Access token is refreshed'}, status=status.HTTP_200_OK)
+        response['Authorization'] = JWTAuth.getAccessToken(user, user.profile_id)
+        response['Access-Control-Expose-Headers'] = 'Authorization'
+        log.info('Access token is refreshed')
+        return response
+
+
 @method_decorator(TokenAuthentication, name='dispatch')
 class ChangeUserPasswordView(GenericAPIView):
     """ This API is used to change the user password """
@@ -171,12 +254,46 @@ class ChangeUserPasswordView(GenericAPIView):
         if check_password(old_password, request.META['user'].password):
             request.META['user'].set_password(raw_password=serializer.data.get('new_password'))
             request.META['user'].save()
+            # other devices have to login with the new password, this device stays logged in
+            current_session = request.headers.get('Refresh-Token') or request.headers.get('Authorization')
+            SessionStore.revoke_all(request.META['user'].username, keep_token=current_session)
             log.info('password changed successfully')
             return Response({'response': 'Your password is changed successfully!'}, status=status.HTTP_200_OK)
         log.info('Old password does not match')
         return Response({'response': 'Old password does not match!'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
+@method_decorator(TokenAuthentication, name='dispatch')
+class RevokeSessionsAPIView(GenericAPIView):
+    """ This API is used to logout all devices of a user or all users of a role """
+    serializer_class = RevokeSessionsSerializer
+    permission_classes = (isAdmin,)
+
+    def post(self, request):
+        """This API is used by the admin to revoke sessions, e.g. during incident response
+        @param request: username or role id
+        @return: revokes the sessions
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        role = serializer.validated_data.get('role')
+        username = serializer.validated_data.get('username')
+        try:
+            if role:
+                SessionStore.revoke_role(role.id)
+            else:
+                SessionStore.revoke_all(username)
+        except redis.RedisError as e:
+            log.error(e)
+            return Response({'response': 'Sessions can not be revoked right now'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if role:
+            log.info(f"Sessions of role {role.role} are revoked")
+            return Response({'response': f"All sessions of {role.role} role are revoked"}, status=status.HTTP_200_OK)
+        log.info(f"Sessions of {username} are revoked")
+        return Response({'response': f"All sessions of {username} are revoked"}, status=status.HTTP_200_OK)
+
+
 @method_decorator(CantAccessAfterLogin, name='dispatch')
 class ForgotPasswordView(GenericAPIView):
     """ This API is used to send reset password link when user forgot password """
@@ -216,16 +333,13 @@ class ResetPasswordView(GenericAPIView):
         @param token: jwt token
         """
         token = request.GET.get('token')
-        try:
-            blacklist_token = TokenBlackList.objects.get(token=token)
-        except TokenBlackList.DoesNotExist:
-            blacklist_token = None
-        if blacklist_token:
+        # an expired or forged link is rejected by its signature before the blacklist is looked up
+        jwtData = JWTAuth.verifyToken(token)
+        if jwtData and TokenBlackList.is_used(token):
             log.info('This link is already used')
             return Response({'response': 'This link is already used'}, status=status.HTTP_406_NOT_ACCEPTABLE)
         serializer = self.serializer_class(data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        jwtData = JWTAuth.verifyToken(token)
         if jwtData:
             username = jwtData.get('username')
             password = jwtData.get('password')
@@ -235,9 +349,14 @@ class ResetPasswordView(GenericAPIView):
         try:
             user = User.objects.get(username=username)
             if password == user.password:
-                user.set_password(raw_password=serializer.data.get('new_password'))
-                user.save()
-                TokenBlackList.objects.create(token=token)
+                with transaction.atomic():
+                    if not TokenBlackList.mark_used(token, jwtData['exp']):
+                        log.info('This link is already used')
+                        return Response({'response': 'This link is already used'},
+                                        status=status.HTTP_406_NOT_ACCEPTABLE)
+                    user.set_password(raw_password=serializer.data.get('new_password'))
+                    user.save()
+                SessionStore.revoke_all(user.username)
                 log.info('Password is reset')
                 return Response({'response': 'Your Password is reset'}, status=status.HTTP_200_OK)
             log.info('password does not match')
@@ -245,3 +364,48 @@ class ResetPasswordView(GenericAPIView):
         except User.DoesNotExist as e:
             log.error(e)
             return Response({'response': 'User not found!'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class ShortLinkRedirectView(GenericAPIView):
+    """ This API is used for opening the short links sent in mails """
+
+    def get(self, request, code):
+        """This API is used to redirect a short link to its full url
+        @param code: short code
+        @return: redirect to the full url
+        """
+        try:
+            url = ShortLinks.resolve(code)
+        except Exception as e:
+            log.error(e)
+            return Response({'response': 'Link can not be opened right now'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if url:
+            return HttpResponseRedirect(url)
+        log.info('expired short link is opened')
+        return Response({'response': 'This link is expired'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@method_decorator(TokenAuthentication, name='dispatch')
+class MetricsAPIView(GenericAPIView):
+    """ This API is used for fetching the runtime counters of this worker """
+    permission_classes = (isAdmin,)
+
+    def get(self, request):
+        """This API is used by the admin to get the cache counters used for sizing the worker caches
+        @return: counters of this worker
+        """
+        metrics = {
+            'jwt_verification_cache': JWTAuth.verified_tokens.stats(),
+            'redis_pool': Cache.stats(),
+            'redis_breaker': Cache.breaker.stats(),
+            'session_cache': SessionStore.local.stats(),
+            'mail_rendering': MailRenderer.stats(),
+        }
+        try:
+            metrics['throttled_requests'] = RateLimiter.throttled()
+        except Exception as e:
+            log.error(e)
+            metrics['throttled_requests'] = None
+        log.info('Metrics are retrieved')
+        return Response({'response': metrics}, status=status.HTTP_200_OK)
@@ -1,14 +1,599 @@
+import hashlib
+import os
+import threading
+import time
 import redis
-from decouple import config
-from LMS.settings import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+import secrets
+from collections import OrderedDict
+from LMS.settings import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, \
+    REDIS_SOCKET_TIMEOUT, REDIS_SOCKET_CONNECT_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL, AUTH_SESSION_TTL, \
+    AUTH_REVOCATION_SYNC_SECONDS, REDIS_BREAKER_FAILURES, REDIS_BREAKER_RESET_SECONDS, SESSION_LOCAL_CACHE_SIZE, \
+    SESSION_LOCAL_TTL, SESSION_STALE_SECONDS, SHORT_LINK_TTL
+from LMS.loggerConfig import log
+
+
+class CacheUnavailable(redis.RedisError):
+    """
+    Raised instead of calling redis while the circuit breaker is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of the redis calls of a process. After 'failures' consecutive errors the breaker opens and calls
+    are skipped for 'reset_timeout' seconds, then a single trial call is let through (half open) which closes the
+    breaker on success or opens it again on failure
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failures, reset_timeout):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = CircuitBreaker.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.skipped_calls = 0
+
+    def allow(self):
+        """
+        This function is used for checking if a redis call may be made
+        :return: False while the breaker is open or a trial call is in flight
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+            # one trial call per reset_timeout, so a trial which never reports back does not keep the breaker open
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = CircuitBreaker.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            self.skipped_calls += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CircuitBreaker.CLOSED
+            self.consecutive_failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.consecutive_failures >= self.failures:
+                if self.state != CircuitBreaker.OPEN:
+                    self.times_opened += 1
+                    log.error('redis circuit breaker is open')
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        """
+        This function is used for getting the breaker state
+        :return: state and counters
+        """
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened,
+                'skipped_calls': self.skipped_calls,
+            }
+
+
+class LocalSessionCache:
+    """
+    Bounded LRU of the sessions recently validated by redis in this process, keyed by (username, session field).
+    Entries younger than SESSION_LOCAL_TTL answer requests without redis, older ones are only served while redis is
+    unavailable and till they are SESSION_STALE_SECONDS old
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age, stale=False):
+        """
+        This function is used for getting the principal of a session validated at most max_age seconds ago
+        :param key: (username, session field)
+        :param max_age: accepted age of the entry in seconds
+        :param stale: True if redis could not be asked, which is counted apart
+        :return: principal snapshot or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > max_age:
+                if not stale:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return entry[1]
+
+    def put(self, key, principal):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), principal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, username):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == username]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        This function is used for getting the cache counters
+        :return: size, maxsize, hits, stale hits and misses
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+            }
 
 
 class Cache:
+    """
+    Redis client shared by the middlewares, views and celery tasks of a process. Connections come from a bounded
+    BlockingConnectionPool which is created again in a forked child (gunicorn/celery prefork workers), so a
+    connection is never shared between processes
+    """
     obj = None
+    pool = None
+    pid = None
+    breaker = CircuitBreaker(REDIS_BREAKER_FAILURES, REDIS_BREAKER_RESET_SECONDS)
+    _lock = threading.Lock()
+    _scripts = {}
+
+    @staticmethod
+    def createPool():
+        """
+        This function is used for creating the connection pool from the redis settings
+        :return: BlockingConnectionPool
+        """
+        return redis.BlockingConnectionPool(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD,
+                                            max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+                                            socket_timeout=REDIS_SOCKET_TIMEOUT,
+                                            socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+                                            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                                            retry_on_timeout=True)
 
     @staticmethod
     def getCacheInstance():
-        if Cache.obj is None:
-            Cache.obj = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
+        """
+        This function is used for getting the redis client of the current process
+        :return: redis client
+        """
+        pid = os.getpid()
+        if Cache.obj is None or Cache.pid != pid:
+            with Cache._lock:
+                if Cache.obj is None or Cache.pid != pid:
+                    Cache.pool = Cache.createPool()
+                    Cache.obj = redis.Redis(connection_pool=Cache.pool)
+                    Cache.pid = pid
         return Cache.obj
-#  redis configuration
+
+    @staticmethod
+    def reset():
+        """
+        This function is used for dropping the client inherited from the parent process. The inherited sockets are
+        not closed here as they are still used by the parent
+        """
+        with Cache._lock:
+            Cache.obj = None
+            Cache.pool = None
+            Cache.pid = None
+        Cache.breaker.reset()
+
+    @staticmethod
+    def stats():
+        """
+        This function is used for getting the utilisation of the connection pool of this process
+        :return: pool counters
+        """
+        pool = Cache.pool
+        if pool is None or Cache.pid != os.getpid():
+            return {'max_connections': REDIS_MAX_CONNECTIONS, 'created': 0, 'in_use': 0, 'idle': 0}
+        created = len(pool._connections)
+        idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+        return {
+            'max_connections': pool.max_connections,
+            'created': created,
+            'in_use': created - idle,
+            'idle': idle,
+        }
+
+    @staticmethod
+    def runScript(source, keys, args):
+        """
+        This function is used for running a lua script in one round trip. Scripts are always called with an explicit
+        client, so one registration serves every client
+        :param source: lua source
+        :param keys: redis keys of the script
+        :param args: arguments of the script
+        :return: script reply
+        """
+        cache = Cache.getCacheInstance()
+        if source not in Cache._scripts:
+            Cache._scripts[source] = cache.register_script(source)
+        return Cache._scripts[source](keys=keys, args=args, client=cache)
+
+    @staticmethod
+    def guarded(call):
+        """
+        This function is used for running a redis write through the circuit breaker, for the callers which can not
+        go on without it and have to tell the client to retry
+        :param call: function doing the redis calls
+        :return: reply of the call
+        :raise CacheUnavailable: while the breaker is open
+        """
+        if not Cache.breaker.allow():
+            raise CacheUnavailable('redis circuit breaker is open')
+        try:
+            reply = call()
+        except redis.RedisError:
+            Cache.breaker.failure()
+            raise
+        Cache.breaker.success()
+        return reply
+
+
+class SessionStore:
+    """
+    Redis sessions of the users. All sessions of a user live in one hash 'session:<username>', holding one
+    's:<token digest>' field per device with its expiry, role id and role epoch, and the principal snapshot shared by
+    the sessions. Expired sessions are pruned on login and the key lives as long as its longest session.
+    Revoking all sessions of a user is one DEL and revoking all sessions of a role is one HINCRBY of the role epoch,
+    as sessions created before the bump no longer match. Every operation is a single round trip.
+    Requests are authenticated through a local cache of recently validated sessions and the redis circuit breaker, so
+    an unhealthy redis neither fails every request nor makes each of them wait for the socket timeout
+    """
+    KEY = 'session:{}'
+    ROLE_EPOCHS_KEY = 'session:role-epochs'
+    PRINCIPAL_FIELD = 'principal'
+    local = LocalSessionCache(SESSION_LOCAL_CACHE_SIZE)
+
+    # KEYS: user sessions, role epochs. ARGV: session field, expiry, role id, principal, now, ttl
+    CREATE_SCRIPT = """
+    local fields = redis.call('hgetall', KEYS[1])
+    for i = 1, #fields, 2 do
+        if string.sub(fields[i], 1, 2) == 's:' then
+            if tonumber(string.match(fields[i + 1], '^(%d+)')) <= tonumber(ARGV[5]) then
+                redis.call('hdel', KEYS[1], fields[i])
+            end
+        end
+    end
+    local epoch = redis.call('hget', KEYS[2], ARGV[3]) or '0'
+    redis.call('hset', KEYS[1], ARGV[1], ARGV[2] .. ':' .. ARGV[3] .. ':' .. epoch, 'principal', ARGV[4])
+    if redis.call('ttl', KEYS[1]) < tonumber(ARGV[6]) then
+        redis.call('expire', KEYS[1], ARGV[6])
+    end
+    return 1
+    """
+
+    # KEYS: user sessions, role epochs. ARGV: session field, now
+    FETCH_SCRIPT = """
+    local values = redis.call('hmget', KEYS[1], ARGV[1], 'principal')
+    if not values[1] then
+        return false
+    end
+    local exp, role, epoch = string.match(values[1], '^(%d+):(%d+):(%d+)$')
+    if tonumber(exp) <= tonumber(ARGV[2]) or (redis.call('hget', KEYS[2], role) or '0') ~= epoch then
+        redis.call('hdel', KEYS[1], ARGV[1])
+        return false
+    end
+    return values[2]
+    """
+
+    # writes the principal only when the user still has a session, so a refresh never resurrects a logged out user
+    UPDATE_PRINCIPAL_SCRIPT = """
+    if redis.call('exists', KEYS[1]) == 1 then
+        return redis.call('hset', KEYS[1], 'principal', ARGV[1])
+    end
+    return -1
+    """
+
+    # KEYS: user sessions. ARGV: session field to keep
+    REVOKE_OTHERS_SCRIPT = """
+    local removed = 0
+    for _, name in ipairs(redis.call('hkeys', KEYS[1])) do
+        if string.sub(name, 1, 2) == 's:' and name ~= ARGV[1] then
+            removed = removed + redis.call('hdel', KEYS[1], name)
+        end
+    end
+    return removed
+    """
+
+    @staticmethod
+    def _field(token):
+        return 's:' + hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def create(username, token, principal, role_id, ttl=None):
+        """
+        This function is used for adding a session of a user next to the sessions of the other devices
+        :param username: username of the user
+        :param token: jwt token identifying the session
+        :param principal: principal snapshot
+        :param role_id: role of the user, used for revoking all sessions of a role
+        :param ttl: expiry of the session in seconds
+        """
+        ttl = ttl or AUTH_SESSION_TTL
+        now = int(time.time())
+        Cache.runScript(SessionStore.CREATE_SCRIPT, [SessionStore.KEY.format(username), SessionStore.ROLE_EPOCHS_KEY],
+                        [SessionStore._field(token), now + ttl, role_id, principal, now, ttl])
+
+    @staticmethod
+    def fetch(username, token):
+        """
+        This function is used for validating the session of the token
+        :param username: username of the user
+        :param token: jwt token identifying the session
+        :return: principal snapshot if the session is live, otherwise None
+        """
+        principal = Cache.runScript(SessionStore.FETCH_SCRIPT,
+                                    [SessionStore.KEY.format(username), SessionStore.ROLE_EPOCHS_KEY],
+                                    [SessionStore._field(token), int(time.time())])
+        return principal.decode('utf-8') if principal else None
+
+    @staticmethod
+    def authenticate(username, token):
+        """
+        This function is used for validating the session of a request. A session validated in the last
+        SESSION_LOCAL_TTL seconds is answered locally, otherwise redis is asked while the circuit breaker allows it,
+        and while redis is unavailable the sessions validated in the last SESSION_STALE_SECONDS are still served
+        :param username: username of the user
+        :param token: jwt token identifying the session
+        :return: principal snapshot if the session is live, otherwise None
+        """
+        key = (username, SessionStore._field(token))
+        principal = SessionStore.local.get(key, SESSION_LOCAL_TTL)
+        if principal:
+            return principal
+        if Cache.breaker.allow():
+            try:
+                principal = SessionStore.fetch(username, token)
+            except redis.RedisError as e:
+                log.error(e)
+                Cache.breaker.failure()
+            else:
+                Cache.breaker.success()
+                if principal:
+                    SessionStore.local.put(key, principal)
+                else:
+                    SessionStore.local.discard(key)
+                return principal
+        return SessionStore.local.get(key, SESSION_STALE_SECONDS, stale=True)
+
+    @staticmethod
+    def update_principal(username, principal):
+        """
+        This function is used for rewriting the principal of a user with live sessions
+        :param username: username of the user
+        :param principal: principal snapshot
+        """
+        SessionStore.local.discard_user(username)
+        Cache.runScript(SessionStore.UPDATE_PRINCIPAL_SCRIPT, [SessionStore.KEY.format(username)], [principal])
+
+    @staticmethod
+    def revoke(username, token):
+        """
+        This function is used for deleting the session of one device
+        :param username: username of the user
+        :param token: jwt token identifying the session
+        :raise CacheUnavailable: while the redis circuit breaker is open
+        """
+        SessionStore.local.discard((username, SessionStore._field(token)))
+        Cache.guarded(lambda: Cache.getCacheInstance().hdel(SessionStore.KEY.format(username),
+                                                            SessionStore._field(token)))
+
+    @staticmethod
+    def revoke_all(username, keep_token=None):
+        """
+        This function is used for deleting all sessions of a user
+        :param username: username of the user
+        :param keep_token: token of a session which stays logged in
+        :raise CacheUnavailable: while the redis circuit breaker is open
+        """
+        SessionStore.local.discard_user(username)
+        if keep_token:
+            Cache.guarded(lambda: Cache.runScript(SessionStore.REVOKE_OTHERS_SCRIPT,
+                                                  [SessionStore.KEY.format(username)],
+                                                  [SessionStore._field(keep_token)]))
+        else:
+            Cache.guarded(lambda: Cache.getCacheInstance().delete(SessionStore.KEY.format(username)))
+
+    @staticmethod
+    def revoke_role(role_id):
+        """
+        This function is used for invalidating the sessions of all users of a role
+        :param role_id: Roles primary key
+        :return: new epoch of the role
+        :raise CacheUnavailable: while the redis circuit breaker is open
+        """
+        SessionStore.local.clear()
+        return Cache.guarded(lambda: Cache.getCacheInstance().hincrby(SessionStore.ROLE_EPOCHS_KEY, role_id, 1))
+
+
+class RevokedTokens:
+    """
+    Revocation set of the stateless auth mode. Revoked access token ids are kept in a redis sorted set scored by
+    their expiry, and every worker keeps a local copy which it syncs at most every AUTH_REVOCATION_SYNC_SECONDS,
+    so checking a token does not need a network round trip
+    """
+    KEY = 'auth:revoked'
+
+    # KEYS: revocation set. ARGV: token id, token expiry, now. The set lives as long as its latest token, so an
+    # earlier token never shortens its expiry
+    REVOKE_SCRIPT = """
+    redis.call('zadd', KEYS[1], ARGV[2], ARGV[1])
+    redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[3])
+    local ttl = math.max(tonumber(ARGV[2]) - tonumber(ARGV[3]), 1)
+    if redis.call('ttl', KEYS[1]) < ttl then
+        redis.call('expire', KEYS[1], ttl)
+    end
+    return 1
+    """
+
+    _revoked = frozenset()
+    _synced_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def revoke(jti, exp):
+        """
+        This function is used for revoking an access token till its expiry, expired ids are pruned on the way
+        :param jti: token id
+        :param exp: expiry timestamp of the token
+        """
+        Cache.runScript(RevokedTokens.REVOKE_SCRIPT, [RevokedTokens.KEY], [jti, int(exp), int(time.time())])
+        with RevokedTokens._lock:
+            RevokedTokens._revoked = RevokedTokens._revoked | {jti}
+
+    @staticmethod
+    def is_revoked(jti):
+        """
+        This function is used for checking the token id against the local copy of the revocation set
+        :param jti: token id
+        :return: True if the token is revoked
+        """
+        now = time.monotonic()
+        if now - RevokedTokens._synced_at < AUTH_REVOCATION_SYNC_SECONDS or not Cache.breaker.allow():
+            # the last synced copy is kept till the next sync and while redis is unavailable
+            return jti in RevokedTokens._revoked
+        with RevokedTokens._lock:
+            if now - RevokedTokens._synced_at < AUTH_REVOCATION_SYNC_SECONDS:
+                return jti in RevokedTokens._revoked
+            RevokedTokens._synced_at = now
+            before = RevokedTokens._revoked
+        try:
+            revoked = Cache.getCacheInstance().zrangebyscore(RevokedTokens.KEY, time.time(), '+inf')
+        except redis.RedisError as e:
+            log.error(e)
+            Cache.breaker.failure()
+            return jti in RevokedTokens._revoked
+        Cache.breaker.success()
+        with RevokedTokens._lock:
+            # ids revoked by this worker while the set was read are kept
+            RevokedTokens._revoked = frozenset(member.decode('utf-8') for member in revoked) | \
+                                     (RevokedTokens._revoked - before)
+        return jti in RevokedTokens._revoked
+
+
+class RateLimiter:
+    """
+    Token buckets of the rate limited routes. A bucket holds up to 'capacity' requests and is refilled at
+    capacity/period per second. All buckets of a request are checked and charged by one lua script, so a request
+    either consumes one token from every bucket or from none of them. Rejections are counted per route and scope in
+    one redis hash shared by the workers
+    """
+    KEY = 'ratelimit:{}:{}:{}'
+    THROTTLED_KEY = 'ratelimit:throttled'
+
+    # KEYS: buckets, throttled counter. ARGV: now, route, then capacity, period and scope of every bucket
+    CONSUME_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local buckets = #KEYS - 1
+    local tokens = {}
+    for i = 1, buckets do
+        local capacity = tonumber(ARGV[3 * i])
+        local period = tonumber(ARGV[3 * i + 1])
+        local state = redis.call('hmget', KEYS[i], 'tokens', 'ts')
+        local left = tonumber(state[1]) or capacity
+        local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+        left = math.min(capacity, left + elapsed * capacity / period)
+        if left < 1 then
+            redis.call('hincrby', KEYS[buckets + 1], ARGV[2] .. ':' .. ARGV[3 * i + 2], 1)
+            return math.ceil((1 - left) * period / capacity)
+        end
+        tokens[i] = left
+    end
+    for i = 1, buckets do
+        redis.call('hset', KEYS[i], 'tokens', tokens[i] - 1, 'ts', now)
+        redis.call('expire', KEYS[i], ARGV[3 * i + 1])
+    end
+    return 0
+    """
+
+    @staticmethod
+    def consume(route, buckets):
+        """
+        This function is used for taking one token from every bucket of the request
+        :param route: url name of the route
+        :param buckets: (scope, identity, capacity, period) of every bucket
+        :return: 0 if the request is allowed, otherwise the seconds to wait before retrying
+        """
+        keys = [RateLimiter.KEY.format(route, scope, identity) for scope, identity, _, _ in buckets]
+        args = [time.time(), route]
+        for scope, _, capacity, period in buckets:
+            args += [capacity, period, scope]
+        return Cache.runScript(RateLimiter.CONSUME_SCRIPT, keys + [RateLimiter.THROTTLED_KEY], args)
+
+    @staticmethod
+    def throttled():
+        """
+        This function is used for getting the number of rejected requests
+        :return: counts keyed by 'route:scope'
+        """
+        counts = Cache.getCacheInstance().hgetall(RateLimiter.THROTTLED_KEY)
+        return {name.decode('utf-8'): int(count) for name, count in counts.items()}
+
+
+class ShortLinks:
+    """
+    Short codes of the links sent in mails. A code maps to its url in redis till the link expires, so generating a
+    mail does not depend on an external shortener
+    """
+    KEY = 'link:{}'
+    CODE_BYTES = 6
+
+    @staticmethod
+    def create(url, ttl=None):
+        """
+        This function is used for storing a url under a new random code
+        :param url: absolute url
+        :param ttl: lifetime of the code in seconds
+        :return: short code
+        """
+        cache = Cache.getCacheInstance()
+        while True:
+            code = secrets.token_urlsafe(ShortLinks.CODE_BYTES)
+            if cache.set(ShortLinks.KEY.format(code), url, ex=ttl or SHORT_LINK_TTL, nx=True):
+                return code
+
+    @staticmethod
+    def resolve(code):
+        """
+        This function is used for getting the url of a code
+        :param code: short code
+        :return: url or None when the code is unknown or expired
+        """
+        url = Cache.getCacheInstance().get(ShortLinks.KEY.format(code))
+        return url.decode('utf-8') if url else None
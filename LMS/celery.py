@@ -3,6 +3,8 @@ from __future__ import absolute_import, unicode_literals
 import os
 
 from celery import Celery
+from celery.signals import worker_process_init
+from django.conf import settings
 # from celery.schedules import crontab
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LMS.settings')
@@ -13,9 +15,36 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
 
-# app.conf.beat_schedule = {
-#
-# }
+app.conf.beat_schedule = {
+    'purge-token-blacklist': {
+        'task': 'Auth.tasks.purge_token_blacklist',
+        'schedule': float(os.environ.get('TOKEN_BLACKLIST_PURGE_SECONDS', 60 * 60)),
+    },
+    # picks up mails whose flush was lost, e.g. when the SMTP server was down
+    'flush-mail-outbox': {
+        'task': 'Auth.tasks.flush_mail_outbox',
+        'schedule': float(os.environ.get('MAIL_OUTBOX_SWEEP_SECONDS', 5 * 60)),
+    },
+    'flush-review-digests': {
+        'task': 'Management.tasks.flush_review_digests',
+        'schedule': float(settings.REVIEW_DIGEST_FLUSH_SECONDS),
+    },
+}
+
+
+@worker_process_init.connect
+def reset_cache_client(**kwargs):
+    """Prefork children get their own redis pool instead of the one inherited from the parent"""
+    from LMS.cache import Cache
+    Cache.reset()
+
+
+@worker_process_init.connect
+def compile_mail_templates(**kwargs):
+    """Mail templates are compiled once when the worker starts, not on the first mail of every template"""
+    from LMS.mailConfirmation import MailRenderer
+    MailRenderer.warm()
+
 
 @app.task(bind=True)
 def debug_task(self):
@@ -1,27 +1,124 @@
-from django.core.mail import EmailMessage
-import pyshorteners
+import json
+import os
+import smtplib
+import threading
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
 from django.urls import reverse
-from django.template.loader import render_to_string
+from django.template.loader import get_template
+from redis.exceptions import LockError
+from LMS.cache import Cache, ShortLinks
+from LMS.loggerConfig import log
+
+
+class MailRenderer:
+    """
+    Renderer of the mail templates. Every template is loaded and compiled once per worker and a list of recipient
+    contexts is rendered in one call, so rendering a wave of mails does not go through the template loaders again.
+    Compile and render timings are kept per template
+    """
+    _templates = {}
+    _timings = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def template(name):
+        """
+        This function is used for getting the compiled template
+        :param name: template name
+        :return: compiled template
+        """
+        template = MailRenderer._templates.get(name)
+        if template is None:
+            start = time.perf_counter()
+            template = get_template(name)
+            with MailRenderer._lock:
+                MailRenderer._templates[name] = template
+                MailRenderer._timing(name)['compile_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return template
+
+    @staticmethod
+    def warm():
+        """
+        This function is used for compiling every template of the template dirs up front
+        """
+        for directory in settings.TEMPLATES[0]['DIRS']:
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.html'):
+                    MailRenderer.template(name)
+
+    @staticmethod
+    def render(name, context):
+        return MailRenderer.render_many(name, [context])[0]
+
+    @staticmethod
+    def render_many(name, contexts):
+        """
+        This function is used for rendering a template for every recipient
+        :param name: template name
+        :param contexts: context of every recipient
+        :return: rendered bodies in the order of the contexts
+        """
+        template = MailRenderer.template(name)
+        start = time.perf_counter()
+        bodies = [template.render(context) for context in contexts]
+        elapsed = time.perf_counter() - start
+        with MailRenderer._lock:
+            timing = MailRenderer._timing(name)
+            timing['renders'] += len(bodies)
+            timing['render_ms'] += elapsed * 1000
+            timing['max_batch_ms'] = max(timing['max_batch_ms'], elapsed * 1000)
+        return bodies
+
+    @staticmethod
+    def _timing(name):
+        return MailRenderer._timings.setdefault(name, {'compile_ms': None, 'renders': 0, 'render_ms': 0.0,
+                                                       'max_batch_ms': 0.0})
+
+    @staticmethod
+    def stats():
+        """
+        This function is used for getting the render timings of this worker
+        :return: compile time, number of renders and render times per template
+        """
+        with MailRenderer._lock:
+            return {name: dict(timing,
+                               render_ms=round(timing['render_ms'], 3),
+                               max_batch_ms=round(timing['max_batch_ms'], 3),
+                               avg_render_ms=round(timing['render_ms'] / timing['renders'], 3) if timing['renders']
+                               else 0.0)
+                    for name, timing in MailRenderer._timings.items()}
+
 
 class Email:
     @staticmethod
     def configureAddUserEmail(data):
-        absoluteURL = "http://" + data['site'] + reverse('login') 
-        email_body_template = render_to_string('registration_email_template.html', {
-            'absolute_url': absoluteURL,
+        return Email.configureAddUserEmails([data])[0]
+
+    @staticmethod
+    def configureAddUserEmails(data_list):
+        bodies = MailRenderer.render_many('registration_email_template.html', [{
+            'absolute_url': "http://" + data['site'] + reverse('login'),
             'name': data['name'],
             'username': data['username'],
             'password': data['password'],
-        })
-        email_data = {'email_body': email_body_template, 'email_subject': 'Access Your Account', 'to_email': data['email']}
-        return email_data
+        } for data in data_list])
+        return [{'email_body': body, 'email_subject': 'Access Your Account', 'to_email': data['email']}
+                for data, body in zip(data_list, bodies)]
 
     @staticmethod
     def configurePasswordRestEmail(data):
         absoluteURL = "http://" + data['site'] + reverse('reset-password')+"?token="+data['token']
-        shortener = pyshorteners.Shortener()
-        short_url = shortener.tinyurl.short(absoluteURL)
-        email_body = render_to_string('password_reset_mail_template.html', {
+        try:
+            short_url = "http://" + data['site'] + reverse('short-link', kwargs={'code': ShortLinks.create(absoluteURL)})
+        except Exception as e:
+            # the mail still goes out with the full link
+            log.error(e)
+            short_url = absoluteURL
+        email_body = MailRenderer.render('password_reset_mail_template.html', {
             'name': data['name'],
             'link': short_url
         })
@@ -29,23 +126,186 @@ class Email:
         return email_data
 
     @staticmethod
-    def configure_result_notification_mail(data):
-        email_body = render_to_string('review_mail_template.html', {
-            'name': data['name'],
-            'marks': data['score'],
-            'week_no': data['week_no'],
-            'course': data['course'],
-            'mentor': data['mentor'],
-            'remarks': data['remark']
-        })
-        email_data = {'email_body': email_body, 'email_subject': 'Fellowship Review Results', 'to_email': data['email']}
-        return email_data
+    def configure_review_digest_mails(digests):
+        bodies = MailRenderer.render_many('review_digest_mail_template.html', [{
+            'name': digest['name'],
+            'reviews': [{
+                'marks': review['score'],
+                'week_no': review['week_no'],
+                'course': review['course'],
+                'mentor': review['mentor'],
+                'remarks': review['remark']
+            } for review in digest['reviews']]
+        } for digest in digests])
+        return [{'email_body': body, 'email_subject': 'Fellowship Review Results', 'to_email': digest['email']}
+                for digest, body in zip(digests, bodies)]
 
     @staticmethod
-    def sendEmail(data):
+    def buildMessage(data, connection=None):
         email = EmailMessage(
             subject=data['email_subject'],
-            to=(data['to_email'],)
+            to=(data['to_email'],),
+            connection=connection
         )
         email.attach(content=data['email_body'], mimetype='text/html')
-        email.send()
+        return email
+
+    @staticmethod
+    def sendEmail(data):
+        Email.buildMessage(data).send()
+
+
+class MailOutbox:
+    """
+    Buffer of the mails waiting to be sent. Tasks render a mail and push it to a redis list, and the flusher sends the
+    buffered mails in batches of MAIL_BATCH_SIZE over one SMTP connection. A flush is started as soon as a batch is
+    full and at most MAIL_FLUSH_SECONDS after the first mail of a batch is buffered. A batch is moved to a sending
+    list before it is sent, so the mails of a flusher which dies on the way are sent by the next one. After a
+    connection level error the connection is opened again before the next mail, and if it can not be opened the rest
+    of the batch is buffered again without counting an attempt
+    """
+    KEY = 'mail:outbox'
+    SENDING_KEY = 'mail:outbox:sending'
+    LOCK_KEY = 'mail:outbox:lock'
+    # errors about one message, the connection stays usable after them
+    MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+    # KEYS: outbox, sending. ARGV: batch size
+    CLAIM_SCRIPT = """
+    if redis.call('llen', KEYS[2]) == 0 then
+        local batch = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+        if #batch == 0 then
+            return batch
+        end
+        redis.call('ltrim', KEYS[1], #batch, -1)
+        redis.call('rpush', KEYS[2], unpack(batch))
+    end
+    return redis.call('lrange', KEYS[2], 0, -1)
+    """
+
+    @staticmethod
+    def enqueue(data, attempts=0):
+        """
+        This function is used for buffering a rendered mail
+        :param data: email subject, body and recipient
+        :param attempts: number of failed deliveries of the mail
+        """
+        from Auth.tasks import flush_mail_outbox
+        buffered = Cache.getCacheInstance().rpush(MailOutbox.KEY, json.dumps(dict(data, attempts=attempts)))
+        if buffered % settings.MAIL_BATCH_SIZE == 0:
+            flush_mail_outbox.delay()
+        elif buffered == 1:
+            flush_mail_outbox.apply_async(countdown=settings.MAIL_FLUSH_SECONDS)
+
+    @staticmethod
+    def enqueue_many(data_list):
+        """
+        This function is used for buffering a list of rendered mails in one round trip
+        :param data_list: email subject, body and recipient of every mail
+        """
+        from Auth.tasks import flush_mail_outbox
+        if not data_list:
+            return
+        buffered = Cache.getCacheInstance().rpush(MailOutbox.KEY, *[json.dumps(dict(data, attempts=0))
+                                                                    for data in data_list])
+        if buffered >= settings.MAIL_BATCH_SIZE:
+            flush_mail_outbox.delay()
+        else:
+            flush_mail_outbox.apply_async(countdown=settings.MAIL_FLUSH_SECONDS)
+
+    @staticmethod
+    def flush():
+        """
+        This function is used for sending the buffered mails over one SMTP connection. Failed mails are buffered again
+        till they fail MAIL_MAX_ATTEMPTS times
+        :return: delivery result of every mail
+        """
+        cache = Cache.getCacheInstance()
+        lock = cache.lock(MailOutbox.LOCK_KEY, timeout=settings.MAIL_FLUSH_LOCK_SECONDS)
+        if not lock.acquire(blocking=False):
+            # another flusher is sending, it drains the outbox
+            return []
+        results = []
+        failed = []
+        unsent = []
+        connection_lost = False
+        connection = get_connection()
+        try:
+            connection.open()
+            while not connection_lost:
+                batch = Cache.runScript(MailOutbox.CLAIM_SCRIPT, [MailOutbox.KEY, MailOutbox.SENDING_KEY],
+                                        [settings.MAIL_BATCH_SIZE])
+                if not batch:
+                    break
+                for position, item in enumerate(batch):
+                    data = json.loads(item)
+                    result = MailOutbox.deliver(data, connection)
+                    results.append(result)
+                    if result['sent']:
+                        continue
+                    failed.append(data)
+                    if result.get('connection_error') and not MailOutbox.reconnect(connection):
+                        connection_lost = True
+                        unsent = [json.loads(item) for item in batch[position + 1:]]
+                        break
+                cache.delete(MailOutbox.SENDING_KEY)
+                lock.extend(settings.MAIL_FLUSH_LOCK_SECONDS, replace_ttl=True)
+        finally:
+            connection.close()
+            # the claimed mails are buffered again while the lock is held, a lost lock can not drop them
+            MailOutbox.requeue(unsent, failed)
+            try:
+                lock.release()
+            except LockError as e:
+                log.error(f'Mail flush lock is already released: {e}')
+        return results
+
+    @staticmethod
+    def requeue(unsent, failed):
+        """
+        This function is used for buffering again the mails a flush could not send
+        :param unsent: mails which did not reach a working connection, they keep their attempts
+        :param failed: mails which failed, they are retried by a later flush till MAIL_MAX_ATTEMPTS
+        """
+        for data in unsent:
+            MailOutbox.enqueue(data, attempts=data['attempts'])
+        for data in failed:
+            if data['attempts'] + 1 < settings.MAIL_MAX_ATTEMPTS:
+                MailOutbox.enqueue(data, attempts=data['attempts'] + 1)
+            else:
+                log.error(f"{data['email_subject']} mail to {data['to_email']} is dropped")
+
+    @staticmethod
+    def reconnect(connection):
+        """
+        This function is used for replacing a broken SMTP connection
+        :param connection: email backend
+        :return: True if the connection is open again
+        """
+        try:
+            connection.close()
+            connection.open()
+        except Exception as e:
+            log.error(f'Mail connection can not be opened again: {e}')
+            return False
+        return True
+
+    @staticmethod
+    def deliver(data, connection):
+        """
+        This function is used for sending one mail over an open connection
+        :param data: buffered mail
+        :param connection: open email backend
+        :return: delivery result
+        """
+        result = {'to_email': data['to_email'], 'email_subject': data['email_subject'], 'sent': False}
+        try:
+            result['sent'] = connection.send_messages([Email.buildMessage(data, connection)]) == 1
+        except Exception as e:
+            result['error'] = str(e)
+            result['connection_error'] = isinstance(e, OSError) and not isinstance(e, MailOutbox.MESSAGE_ERRORS)
+        if result['sent']:
+            log.info(f"{data['email_subject']} mail is sent to {data['to_email']}")
+        else:
+            log.error(f"{data['email_subject']} mail to {data['to_email']} is not sent: {result.get('error')}")
+        return result
@@ -51,6 +51,7 @@ REST_FRAMEWORK = {'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSc
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'Auth.middlewares.RateLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -141,6 +142,19 @@ EMAIL_PORT = os.environ.get('EMAIL_PORT')
 EMAIL_HOST_USER = os.environ.get('MAILUSER')
 EMAIL_HOST_PASSWORD = os.environ.get('MAILPASSWORD')
 
+# Buffered mails are sent in batches of MAIL_BATCH_SIZE over one SMTP connection, at most MAIL_FLUSH_SECONDS after
+# they are buffered. A failed mail is retried by the next flush till it fails MAIL_MAX_ATTEMPTS times
+MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 100))
+MAIL_FLUSH_SECONDS = int(os.environ.get('MAIL_FLUSH_SECONDS', 10))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 3))
+MAIL_FLUSH_LOCK_SECONDS = int(os.environ.get('MAIL_FLUSH_LOCK_SECONDS', 5 * 60))
+
+# Review results are coalesced per student and sent as one digest mail every REVIEW_DIGEST_FLUSH_SECONDS, the
+# digests of REVIEW_DIGEST_BATCH_SIZE students are built with one query
+REVIEW_DIGEST_FLUSH_SECONDS = int(os.environ.get('REVIEW_DIGEST_FLUSH_SECONDS', 5 * 60))
+REVIEW_DIGEST_BATCH_SIZE = int(os.environ.get('REVIEW_DIGEST_BATCH_SIZE', 100))
+REVIEW_DIGEST_LOCK_SECONDS = int(os.environ.get('REVIEW_DIGEST_LOCK_SECONDS', 5 * 60))
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -160,15 +174,90 @@ SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 CORS_ALLOW_HEADERS = list(default_headers) + [
     'Authorization',
+    'Refresh-Token',
 ]
 
 REDIS_HOST = os.environ.get('REDISHOST')
 REDIS_PORT = os.environ.get('REDISPORT')
 REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
+# Connection pool of LMS.cache, callers wait up to REDIS_POOL_TIMEOUT seconds for a free connection
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+# Redis calls are skipped for REDIS_BREAKER_RESET_SECONDS after REDIS_BREAKER_FAILURES consecutive errors
+REDIS_BREAKER_FAILURES = int(os.environ.get('REDIS_BREAKER_FAILURES', 5))
+REDIS_BREAKER_RESET_SECONDS = float(os.environ.get('REDIS_BREAKER_RESET_SECONDS', 10))
+
+# Sessions validated by redis are trusted by the worker for SESSION_LOCAL_TTL seconds, and while redis is unavailable
+# for up to SESSION_STALE_SECONDS
+SESSION_LOCAL_CACHE_SIZE = int(os.environ.get('SESSION_LOCAL_CACHE_SIZE', 10000))
+SESSION_LOCAL_TTL = float(os.environ.get('SESSION_LOCAL_TTL', 5))
+SESSION_STALE_SECONDS = float(os.environ.get('SESSION_STALE_SECONDS', 5 * 60))
+
+# Lifetime of the redis session created on login, in seconds
+AUTH_SESSION_TTL = int(os.environ.get('AUTH_SESSION_TTL', 2 * 24 * 60 * 60))
+
+# Stateless auth mode: short lived access tokens carrying user id, role and profile id are verified by signature
+# alone, the refresh token is checked against redis and logout adds the access token to a revocation set which
+# workers sync every AUTH_REVOCATION_SYNC_SECONDS
+AUTH_STATELESS_MODE = os.environ.get('AUTH_STATELESS_MODE', 'False') == 'True'
+AUTH_ACCESS_TOKEN_TTL = int(os.environ.get('AUTH_ACCESS_TOKEN_TTL', 15 * 60))
+AUTH_REVOCATION_SYNC_SECONDS = int(os.environ.get('AUTH_REVOCATION_SYNC_SECONDS', 5))
+
+# Bulk registration accepts up to BULK_REGISTRATION_MAX_ROWS users per request and hashes their passwords on a pool
+# of BULK_REGISTRATION_HASH_WORKERS processes (cpu count by default) once there are BULK_REGISTRATION_POOL_THRESHOLD
+BULK_REGISTRATION_MAX_ROWS = int(os.environ.get('BULK_REGISTRATION_MAX_ROWS', 5000))
+BULK_REGISTRATION_HASH_WORKERS = int(os.environ.get('BULK_REGISTRATION_HASH_WORKERS', 0))
+BULK_REGISTRATION_POOL_THRESHOLD = int(os.environ.get('BULK_REGISTRATION_POOL_THRESHOLD', 16))
+
+# Numbers of the SID, CID and MID ids a worker reserves at once
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', 50))
+
+# Uploaded score sheets are read, validated and saved in chunks of EXCEL_CHUNK_ROWS rows
+EXCEL_CHUNK_ROWS = int(os.environ.get('EXCEL_CHUNK_ROWS', 5000))
+
+# Progress and report of a score sheet import are kept this long after the last update of the job
+IMPORT_JOB_TTL = int(os.environ.get('IMPORT_JOB_TTL', 24 * 60 * 60))
+# Digests of the imported rows of an uploader are kept this long after their last import
+IMPORT_ROW_DIGEST_TTL = int(os.environ.get('IMPORT_ROW_DIGEST_TTL', 30 * 24 * 60 * 60))
+
+# Store a weekly Performance record only when its score is recorded, the pending weeks are derived from the course
+PERFORMANCE_LAZY_WEEKS = os.environ.get('PERFORMANCE_LAZY_WEEKS', 'False') == 'True'
+
+# Lifetime of the short links sent in mails, matching the validity of the password reset token
+SHORT_LINK_TTL = int(os.environ.get('SHORT_LINK_TTL', 2 * 24 * 60 * 60))
+
+# Seconds a worker trusts its role registry before checking the redis version key
+ROLE_REGISTRY_REFRESH_SECONDS = int(os.environ.get('ROLE_REGISTRY_REFRESH_SECONDS', 30))
+
+# Number of verified JWTs each worker keeps to skip repeated signature verification
+JWT_VERIFY_CACHE_SIZE = int(os.environ.get('JWT_VERIFY_CACHE_SIZE', 10000))
+
+# Token buckets of Auth.middlewares.RateLimitMiddleware keyed by url name, as (capacity, period in seconds) per client
+# ip and per value of the 'field' of the request body. RATE_LIMIT_PROXY_COUNT is the number of proxies in front of
+# the app whose X-Forwarded-For entries are trusted
+RATE_LIMITS = {
+    'login': {
+        'field': 'username',
+        'ip': (int(os.environ.get('LOGIN_RATE_LIMIT_IP', 20)), 60),
+        'username': (int(os.environ.get('LOGIN_RATE_LIMIT_USERNAME', 5)), 60),
+    },
+    'forgot-password': {
+        'field': 'email',
+        'ip': (int(os.environ.get('FORGOT_PASSWORD_RATE_LIMIT_IP', 5)), 60),
+        'username': (int(os.environ.get('FORGOT_PASSWORD_RATE_LIMIT_EMAIL', 3)), 60 * 60),
+    },
+}
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))
 
 #Celery Conf
 # CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
 # CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND')
 
 CELERY_BROKER_URL="redis://:{}@{}:{}".format(REDIS_PASSWORD,REDIS_HOST,REDIS_PORT)
-CELERY_RESULT_BACKEND="redis://:{}@{}:{}".format(REDIS_PASSWORD,REDIS_HOST,REDIS_PORT)
\ No newline at end of file
+CELERY_RESULT_BACKEND="redis://:{}@{}:{}".format(REDIS_PASSWORD,REDIS_HOST,REDIS_PORT)
+CELERY_BROKER_POOL_LIMIT = REDIS_MAX_CONNECTIONS
+CELERY_REDIS_MAX_CONNECTIONS = REDIS_MAX_CONNECTIONS
\ No newline at end of file
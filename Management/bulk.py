@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.db import transaction
+from .digest import ReviewDigests
+from .schedule import PerformanceSchedule
+import sys
+
+sys.path.append('..')
+from Auth.principal import Principal
+from LMS.loggerConfig import log
+
+
+class BulkSignals:
+    """
+    Bulk mode of the Management signals. Inside BulkSignals.scope() the post_save receivers collect their instances
+    instead of acting on every save, and on exit of the outermost scope the side effects run once for the whole batch:
+    profiles of the created users are inserted with bulk_create, the schedules of the saved mappings are generated
+    together and the review results are buffered in one pipeline. Nothing is run when the scope exits with an error
+    """
+    _state = threading.local()
+
+    @staticmethod
+    def active():
+        return getattr(BulkSignals._state, 'depth', 0) > 0
+
+    @staticmethod
+    def collect(kind, key, instance):
+        """
+        This function is used for deferring the side effect of a saved instance to the end of the scope
+        :param kind: users, principals, mappings or reviews
+        :param key: key of the instance, a later save of the same key replaces the earlier one
+        :param instance: saved instance
+        """
+        BulkSignals._state.pending[kind][key] = instance
+
+    @staticmethod
+    @contextmanager
+    def scope():
+        state = BulkSignals._state
+        if not BulkSignals.active():
+            state.pending = {kind: OrderedDict() for kind in ('users', 'principals', 'mappings', 'reviews')}
+        state.depth = getattr(state, 'depth', 0) + 1
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            state.depth -= 1
+            if not state.depth:
+                pending, state.pending = state.pending, None
+                if completed:
+                    BulkSignals.flush(pending)
+
+    @staticmethod
+    def flush(pending):
+        """
+        This function is used for running the collected side effects as batch operations
+        :param pending: collected instances per kind
+        """
+        from Auth.registration import BulkRegistration
+        users = list(pending['users'].values())
+        if users:
+            BulkRegistration.create_profiles(users, BulkRegistration.reserve_profile_ids(users))
+        if pending['mappings']:
+            PerformanceSchedule.generate(list(pending['mappings'].values()))
+        principals = list(pending['principals'].values())
+        reviews = list(pending['reviews'].values())
+        # redis is written once the batch is committed, a rolled back batch leaves no trace there
+        transaction.on_commit(lambda: BulkSignals._publish(principals, reviews))
+        log.info(f"Bulk signals: {len(users)} profiles, {len(pending['mappings'])} schedules, "
+                 f"{len(reviews)} review results")
+
+    @staticmethod
+    def _publish(principals, reviews):
+        for user, profile_id in principals:
+            Principal.refresh(user, profile_id=profile_id)
+        if reviews:
+            ReviewDigests.record_many(reviews)
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from django.conf import settings
+from .models import Performance
+import sys
+
+sys.path.append('..')
+from LMS.cache import Cache
+from LMS.loggerConfig import log
+from LMS.mailConfirmation import Email, MailOutbox
+
+
+class ReviewDigests:
+    """
+    Coalesced review result notifications. A scored save only adds the record id to the redis buffer of its student,
+    without a query or a task. The flusher claims the buffers of REVIEW_DIGEST_BATCH_SIZE students at a time, loads
+    their records with one query and queues one digest mail per student, holding the latest score of every reviewed
+    week. Claimed ids are moved to a sending set first, so the digests of a flusher which dies on the way are sent by
+    the next one
+    """
+    KEY = 'review:digest:{}'
+    STUDENTS_KEY = 'review:digest:students'
+    SENDING_KEY = 'review:digest:sending'
+    LOCK_KEY = 'review:digest:lock'
+
+    # KEYS: students, sending. ARGV: batch size, student buffer key prefix
+    CLAIM_SCRIPT = """
+    if redis.call('scard', KEYS[2]) == 0 then
+        local students = redis.call('spop', KEYS[1], tonumber(ARGV[1]))
+        for _, student in ipairs(students) do
+            local key = ARGV[2] .. student
+            local ids = redis.call('smembers', key)
+            if #ids > 0 then
+                redis.call('sadd', KEYS[2], unpack(ids))
+            end
+            redis.call('del', key)
+        end
+    end
+    return redis.call('smembers', KEYS[2])
+    """
+
+    @staticmethod
+    def record(performance):
+        """
+        This function is used for buffering the review result of a saved record
+        :param performance: scored Performance instance
+        """
+        ReviewDigests.record_many([performance])
+
+    @staticmethod
+    def record_many(performances):
+        """
+        This function is used for buffering the review results of saved records in one round trip
+        :param performances: scored Performance instances
+        """
+        if not performances:
+            return
+        # an unhealthy redis must not slow down saving the scores
+        if not Cache.breaker.allow():
+            log.error(f'{len(performances)} review results are not buffered, redis is unavailable')
+            return
+        try:
+            pipe = Cache.getCacheInstance().pipeline()
+            for performance in performances:
+                pipe.sadd(ReviewDigests.KEY.format(performance.student_id), performance.pk)
+            pipe.sadd(ReviewDigests.STUDENTS_KEY, *{performance.student_id for performance in performances})
+            pipe.execute()
+        except Exception as e:
+            log.error(e)
+            Cache.breaker.failure()
+            return
+        Cache.breaker.success()
+
+    @staticmethod
+    def build(performance_ids):
+        """
+        This function is used for building the digests of the buffered records with one query
+        :param performance_ids: Performance primary keys
+        :return: digest of every student, with the reviews ordered by course and week
+        """
+        records = Performance.objects.filter(id__in=performance_ids, score__isnull=False).select_related(
+            'student__student', 'mentor__mentor', 'course').order_by('student_id', 'course_id', 'week_no')
+        digests = OrderedDict()
+        for record in records:
+            user = record.student.student
+            digest = digests.setdefault(record.student_id, {'name': user.get_full_name(), 'email': user.email,
+                                                            'reviews': []})
+            digest['reviews'].append({
+                'week_no': record.week_no,
+                'score': record.score,
+                'course': record.course.course_name,
+                'mentor': record.mentor.mentor.get_full_name() if record.mentor else None,
+                'remark': record.remark
+            })
+        return list(digests.values())
+
+    @staticmethod
+    def flush():
+        """
+        This function is used for queueing the digest mails of the buffered review results
+        :return: number of queued digests
+        """
+        cache = Cache.getCacheInstance()
+        lock = cache.lock(ReviewDigests.LOCK_KEY, timeout=settings.REVIEW_DIGEST_LOCK_SECONDS)
+        if not lock.acquire(blocking=False):
+            # another flusher drains the buffers
+            return 0
+        queued = 0
+        try:
+            while True:
+                ids = Cache.runScript(ReviewDigests.CLAIM_SCRIPT,
+                                      [ReviewDigests.STUDENTS_KEY, ReviewDigests.SENDING_KEY],
+                                      [settings.REVIEW_DIGEST_BATCH_SIZE, ReviewDigests.KEY.format('')])
+                if not ids:
+                    break
+                digests = ReviewDigests.build([int(performance_id) for performance_id in ids])
+                MailOutbox.enqueue_many(Email.configure_review_digest_mails(digests))
+                cache.delete(ReviewDigests.SENDING_KEY)
+                queued += len(digests)
+                lock.extend(settings.REVIEW_DIGEST_LOCK_SECONDS, replace_ttl=True)
+        finally:
+            lock.release()
+        log.info(f'{queued} review digests are queued')
+        return queued
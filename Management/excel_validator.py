@@ -1,15 +1,14 @@
-import enum
-
-from Auth.models import Roles
+import datetime
+import re
+import numpy
+import pandas
+from Auth.roles import Role, RoleRegistry
 from .utils import ExcelHeader, ValueRange, Pattern
 import sys
 
 sys.path.append('..')
 
 
-# class ExceptionType(enum.Enum):
-
-
 class ExcelException(Exception):
     """This is a custom exception class"""
 
@@ -22,79 +21,198 @@ class ExcelException(Exception):
 
 
 class ExcelValidator:
+    """
+    Validation of the score sheets. The header is checked for the whole file, every other rule is evaluated as a
+    vectorized mask over its column and the messages of all failing cells are collected in one pass, so one invalid
+    cell does not reject the whole file. Regexes are compiled once
+    """
+    PATTERN_RULES = (
+        (ExcelHeader.SID.value, re.compile(Pattern.SID.value), 'SID pattern does not match, [SI-0000] expected'),
+        (ExcelHeader.CID.value, re.compile(Pattern.CID.value), 'CID pattern does not match, [CI-0000] expected'),
+        (ExcelHeader.MID.value, re.compile(Pattern.MID.value), 'MID pattern does not match, [MI-0000] expected'),
+        (ExcelHeader.WEEK.value, re.compile(Pattern.WEEK.value),
+         'WEEK pattern does not match, [week xx, Week xx, WEEK xx] expected'),
+    )
+    DATE_PATTERN = re.compile(Pattern.REVIEW_DATE.value)
+    DATE_MESSAGE = 'Invalid date or date pattern found, [dd-mm-yyyy] expected'
+    KEY_COLUMNS = (ExcelHeader.SID.value, ExcelHeader.CID.value, ExcelHeader.WEEK.value)
 
     @staticmethod
-    def validate_header(df, role):
-        # checking the header 
-        input_file_header_set = set(df.columns)
-        required_header_set = set([ExcelHeader.SID.value, ExcelHeader.CID.value,
-                                   ExcelHeader.WEEK.value, ExcelHeader.SCORE.value, ExcelHeader.REVIEW_DATE.value,
-                                   ExcelHeader.REMARKS.value])
-        if role == Roles.objects.get(role='admin'):
-            required_header_set.add(ExcelHeader.MID.value)
-        if input_file_header_set != required_header_set:
-            raise ExcelException('Check file Header. ' + str(required_header_set) + ' expeced')
+    def required_header(is_admin):
+        header = {ExcelHeader.SID.value, ExcelHeader.CID.value, ExcelHeader.WEEK.value, ExcelHeader.SCORE.value,
+                  ExcelHeader.REVIEW_DATE.value, ExcelHeader.REMARKS.value}
+        if is_admin:
+            header.add(ExcelHeader.MID.value)
+        return header
 
     @staticmethod
-    def validate_null_fields(df):
-        # checking the null values
-        if df.isnull().values.any():
-            null_list = [(col.value, df.loc[:, col.value].isnull().sum()) for col in ExcelHeader if
-                         df.loc[:, col.value].isnull().sum() > 0]
-            raise ExcelException('Null values found ' + str(null_list))
+    def validate_header(df, is_admin):
+        # a wrong header makes every row unreadable, so it rejects the file
+        required_header_set = ExcelValidator.required_header(is_admin)
+        if set(df.columns) != required_header_set:
+            raise ExcelException('Check file Header. ' + str(required_header_set) + ' expeced')
 
     @staticmethod
-    def validate_data_type(df):
-        # checking the data types
-        if (df[ExcelHeader.SCORE.value].map(type) == str).any():
-            raise ExcelException(ExcelHeader.SCORE.value + ' should not be a string')
+    def text(column):
+        """
+        This function is used for getting the string cells of a column
+        :param column: sheet column
+        :return: column holding the strings, the other cells are NaN
+        """
+        kind = pandas.api.types.infer_dtype(column, skipna=True)
+        if kind in ('string', 'empty'):
+            return column
+        if kind in ('mixed', 'mixed-integer'):
+            column = column.astype(object)
+            return column.where(column.str.len().notnull())
+        return pandas.Series(numpy.nan, index=column.index, dtype=object)
 
     @staticmethod
-    def validate_score_range(df):
-        if df[ExcelHeader.SCORE.value].max() > ValueRange.SCORE_MAX_VALUE.value:
-            raise ExcelException(ExcelHeader.SCORE.value + ' should not be a beyond ')
-        if df[ExcelHeader.SCORE.value].min() < ValueRange.SCORE_MIN_VALUE.value:
-            raise ExcelException(ExcelHeader.SCORE.value + ' should not be a bellow ')
+    def per_value(column, function, missing):
+        """
+        This function is used for applying a function once per distinct string of a column, sheet columns repeat the
+        same ids, weeks and dates on many rows
+        :param column: sheet column
+        :param function: function of a string
+        :param missing: result for the cells which are not strings
+        :return: column of the results
+        """
+        codes, uniques = pandas.factorize(ExcelValidator.text(column))
+        results = numpy.array([function(value) for value in uniques] + [missing], dtype=object)
+        # code -1 of the missing cells picks the last result
+        return pandas.Series(results[codes], index=column.index)
 
     @staticmethod
-    def validate_pattern(df, role):
-        if role == Roles.objects.get(role='admin'):
-            if (df[ExcelHeader.MID.value].map(type) == int).any() or not df[ExcelHeader.MID.value].str.match(
-                    Pattern.MID.value).all():
-                raise ExcelException('MID pattern does not match, [MI-0000] expected')
+    def parse_date(value):
+        """
+        This function is used for reading a review date cell, the validator and the ingestion read dates only here
+        :param value: string in one of the dd-mm-yyyy forms of the date pattern, or a date typed by the sheet reader
+        :return: date, or None when the cell is not a valid date
+        """
+        if isinstance(value, datetime.date):
+            # NaT is a datetime too
+            if pandas.isnull(value):
+                return None
+            return value.date() if isinstance(value, datetime.datetime) else value
+        if not isinstance(value, str) or not ExcelValidator.DATE_PATTERN.match(value):
+            return None
+        try:
+            return datetime.datetime.strptime(re.sub('[-/]', '', value), '%d%m%Y').date()
+        except ValueError:
+            return None
 
-        if (df[ExcelHeader.CID.value].map(type) == int).any() or not df[ExcelHeader.CID.value].str.match(
-                Pattern.CID.value).all():
-            raise ExcelException('CID pattern does not match, [CI-0000] expected')
+    @staticmethod
+    def review_dates(column):
+        """
+        This function is used for reading the review date column, once per distinct cell
+        :param column: review date column
+        :return: column of dates, None for the invalid cells
+        """
+        codes, uniques = pandas.factorize(column)
+        dates = numpy.array([ExcelValidator.parse_date(value) for value in uniques] + [None], dtype=object)
+        # code -1 of the missing cells picks the last result
+        return pandas.Series(dates[codes], index=column.index)
 
-        # checking the CID pattern
-        if (df[ExcelHeader.SID.value].map(type) == int).any() or not df[ExcelHeader.SID.value].str.match(
-                Pattern.SID.value).all():
-            raise ExcelException('SID pattern does not match, [SI-0000] expected')
+    @staticmethod
+    def keys(df):
+        """
+        This function is used for getting the key of every row, a record is identified by its SID, CID and week number
+        :param df: data frame with a valid header
+        :return: multi index of the keys and the mask of the rows with a complete key
+        """
+        keys = pandas.DataFrame({
+            ExcelHeader.SID.value: df[ExcelHeader.SID.value],
+            ExcelHeader.CID.value: df[ExcelHeader.CID.value],
+            ExcelHeader.WEEK.value: ExcelValidator.per_value(df[ExcelHeader.WEEK.value],
+                                                             lambda value: value.split(' ')[-1], None),
+        })
+        return pandas.MultiIndex.from_frame(keys), keys.notnull().all(axis=1)
 
-        # checking week pattern
-        if (df[ExcelHeader.WEEK.value].map(type) == int).any() or not df[ExcelHeader.WEEK.value].str.match(
-                Pattern.WEEK.value).all():
-            raise ExcelException('WEEK pattern does not match, [week xx, Week xx, WEEK xx] expected')
+    @staticmethod
+    def rules(df, seen=frozenset()):
+        """
+        This function is used for getting the rules of the sheet as masks of the invalid cells
+        :param df: data frame with a valid header
+        :param seen: keys of the rows of the earlier chunks of the sheet
+        :return: (column, mask, message) in the order the rules are reported
+        """
+        for column in df.columns:
+            yield column, df[column].isnull(), f'{column} value is missing'
+
+        score = df[ExcelHeader.SCORE.value]
+        if not pandas.api.types.is_numeric_dtype(score):
+            # a score given as a string is not a number even if it could be parsed as one
+            score = pandas.to_numeric(score.where(ExcelValidator.text(score).isnull()), errors='coerce')
+        yield ExcelHeader.SCORE.value, score.isnull(), ExcelHeader.SCORE.value + ' should be a number'
+        yield ExcelHeader.SCORE.value, score > ValueRange.SCORE_MAX_VALUE.value, \
+            f'{ExcelHeader.SCORE.value} should not be beyond {ValueRange.SCORE_MAX_VALUE.value}'
+        yield ExcelHeader.SCORE.value, score < ValueRange.SCORE_MIN_VALUE.value, \
+            f'{ExcelHeader.SCORE.value} should not be below {ValueRange.SCORE_MIN_VALUE.value}'
+
+        for column, pattern, message in ExcelValidator.PATTERN_RULES:
+            if column in df.columns:
+                # cells which are not strings do not match
+                matches = ExcelValidator.per_value(df[column], lambda value: bool(pattern.match(value)), False)
+                yield column, ~matches.astype(bool), message
+        if ExcelHeader.REVIEW_DATE.value in df.columns:
+            dates = ExcelValidator.review_dates(df[ExcelHeader.REVIEW_DATE.value])
+            yield ExcelHeader.REVIEW_DATE.value, dates.isnull(), ExcelValidator.DATE_MESSAGE
+
+        # the first row of a key is kept whichever chunk it is read in, the later copies are duplicates
+        keys, complete = ExcelValidator.keys(df)
+        duplicate = keys.duplicated(keep='first')
+        if seen:
+            duplicate |= keys.isin(seen)
+        yield ExcelHeader.WEEK.value, complete & duplicate, \
+            'Duplicate records found. [SID, CID, WEEK] should not be duplicate'
 
-        if not df[ExcelHeader.REVIEW_DATE.value].str.match(Pattern.REVIEW_DATE.value).all():
-            raise ExcelException('Invalid date or date pattern found, [dd-mm-yyyy] expected')
+    @staticmethod
+    def validate_rows(df, seen=frozenset()):
+        """
+        This function is used for validating every cell of the sheet
+        :param df: data frame with a valid header
+        :param seen: keys of the rows of the earlier chunks of the sheet
+        :return: error matrix, holding the first failing rule of every cell and NaN for the valid cells
+        """
+        errors = pandas.DataFrame(index=df.index, columns=df.columns, dtype=object)
+        for column, mask, message in ExcelValidator.rules(df, seen):
+            errors[column] = errors[column].where(errors[column].notnull() | ~mask, message)
+        return errors
 
     @staticmethod
-    def validate_duplicate_data(df):
-        # list of set of CID, SID and WEEK to check duplicate records
-        row_tuple_list = [(row[1][0], row[1][1], row[1][2].split(' ')[1]) for row in df.iloc[0:, 0:3].iterrows()]
+    def remember_keys(df, seen):
+        """
+        This function is used for adding the complete keys of the rows to the keys of the earlier chunks
+        :param df: data frame with a valid header
+        :param seen: set of keys
+        """
+        keys, complete = ExcelValidator.keys(df)
+        seen.update(keys[complete.to_numpy()])
 
-        # checking duplicate records
-        row_tuple_list_set = set(row_tuple_list)
-        if len(row_tuple_list) != len(row_tuple_list_set):
-            raise ExcelException('Duplicate reocrds found. [SID, CID, WEEK] should not be duplicate')
+    @staticmethod
+    def report(errors):
+        """
+        This function is used for converting the error matrix to the per row report of the response
+        :param errors: error matrix
+        :return: errors of the invalid rows, by row number and column
+        """
+        invalid = errors.dropna(how='all')
+        return {f"Row_no-{index + 1}": {column: message for column, message in row.items() if isinstance(message, str)}
+                for index, row in zip(invalid.index, invalid.to_dict('records'))}
 
     @staticmethod
-    def validateExcel(df, role):
-        ExcelValidator.validate_header(df, role)  # validating header
-        ExcelValidator.validate_null_fields(df)  # validating null fields
-        ExcelValidator.validate_data_type(df)  # validating data types
-        ExcelValidator.validate_score_range(df)  # validating Score Range
-        ExcelValidator.validate_pattern(df, role)  # validating CID and SID
-        ExcelValidator.validate_duplicate_data(df)  # validate duplicate data
+    def validateExcel(df, role, seen=None):
+        """
+        This function is used for validating the sheet
+        :param df: data frame of the sheet
+        :param role: role of the uploading user
+        :param seen: keys of the rows of the earlier chunks of the sheet, the keys of this chunk are added to it
+        :return: rows which passed validation and the errors of the other rows
+        """
+        is_admin = role.id == RoleRegistry.get(Role.ADMIN).id
+        ExcelValidator.validate_header(df, is_admin)
+        errors = ExcelValidator.validate_rows(df, seen or frozenset())
+        if seen is not None:
+            ExcelValidator.remember_keys(df, seen)
+        invalid = errors.notnull().any(axis=1)
+        return df[~invalid], ExcelValidator.report(errors)
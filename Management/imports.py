@@ -0,0 +1,249 @@
+import hashlib
+import json
+import time
+import uuid
+import pandas
+from django.conf import settings
+from django.core.files.storage import default_storage
+from .excel_validator import ExcelException, ExcelValidator
+from .ingestion import ScoreIngestion
+from .models import Performance
+from .sheets import SheetReader
+from .utils import ExcelHeader
+import sys
+
+sys.path.append('..')
+from Auth.principal import Principal
+from LMS.cache import Cache
+from LMS.loggerConfig import log
+
+
+class ImportJobs:
+    """
+    Score sheet imports run by celery instead of the web request. The upload is stored in the default storage, which
+    the web and celery workers have to share, and the job reports its progress after every chunk to the redis hash
+    'import:job:<id>'. The hash holds the per row report once the job is completed and expires IMPORT_JOB_TTL seconds
+    after its last update.
+    Uploads are fingerprinted by the sha256 of their content and the uploader, so the same file uploaded again gives
+    back the job of the first upload. The digest of every imported row is kept per uploader by its sid, cid and week,
+    and the rows of a later upload which did not change since are skipped before validation, as long as their week
+    still holds the same score and remark
+    """
+    KEY = 'import:job:{}'
+    UPLOAD_KEY = 'import:upload:{}:{}'
+    ROWS_KEY = 'import:rows:{}'
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    COUNTERS = ('owner', 'rows', 'saved', 'errors', 'unchanged')
+    TIMES = ('queued_at', 'started_at', 'finished_at')
+
+    # KEYS: upload. ARGV: failed job id, new job id, ttl. The claim of a failed job goes to the first retry only
+    RECLAIM_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+
+    @staticmethod
+    def _write(job_id, fields):
+        key = ImportJobs.KEY.format(job_id)
+        pipe = Cache.getCacheInstance().pipeline()
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, settings.IMPORT_JOB_TTL)
+        pipe.execute()
+
+    @staticmethod
+    def fingerprint(file, user):
+        """
+        This function is used for getting the key of an upload by its content and uploader
+        :param file: uploaded xlsx or csv file
+        :param user: uploading mentor or admin
+        :return: redis key of the upload
+        """
+        content = hashlib.sha256()
+        for block in file.chunks():
+            content.update(block)
+        file.seek(0)
+        return ImportJobs.UPLOAD_KEY.format(user.id, content.hexdigest())
+
+    @staticmethod
+    def start(file, user):
+        """
+        This function is used for storing an uploaded sheet and queueing its import, unless the same user uploaded the
+        same file before and that job did not fail
+        :param file: uploaded xlsx or csv file
+        :param user: uploading mentor or admin
+        :return: job id and whether a new job is queued
+        """
+        from .tasks import import_score_sheet
+        fingerprint = ImportJobs.fingerprint(file, user)
+        cache = Cache.getCacheInstance()
+        job_id = uuid.uuid4().hex
+        # the upload is claimed in one command, so concurrent uploads of the same file queue one job
+        while not cache.set(fingerprint, job_id, nx=True, ex=settings.IMPORT_JOB_TTL):
+            previous = cache.get(fingerprint)
+            if previous is None:
+                continue
+            previous = previous.decode('utf-8')
+            job = ImportJobs.get(previous)
+            # the job hash is written right after the claim, a claim without it is a job being queued
+            if job is None or job['status'] != ImportJobs.FAILED:
+                log.info(f'{file.name} is already imported by job {previous}')
+                return previous, False
+            if Cache.runScript(ImportJobs.RECLAIM_SCRIPT, [fingerprint], [previous, job_id, settings.IMPORT_JOB_TTL]):
+                break
+        path = None
+        try:
+            path = default_storage.save(f"imports/{job_id}.{SheetReader.extension(file.name)}", file)
+            ImportJobs._write(job_id, {'status': ImportJobs.QUEUED, 'owner': user.id, 'file': file.name, 'rows': 0,
+                                       'saved': 0, 'errors': 0, 'unchanged': 0, 'queued_at': time.time()})
+            import_score_sheet.delay(job_id, path, Principal.snapshot(user, getattr(user, 'profile_id', None)))
+        except Exception:
+            # the upload is given up, so the next upload of the file is queued again
+            cache.delete(fingerprint)
+            if path:
+                default_storage.delete(path)
+            raise
+        log.info(f'Import job {job_id} is queued for {file.name}')
+        return job_id, True
+
+    @staticmethod
+    def row_digests(chunk):
+        """
+        This function is used for getting the digest of every row of a chunk
+        :param chunk: data frame of the sheet
+        :return: data frame of the key and the digest of every row, or None when the key columns are missing
+        """
+        if not set(ExcelValidator.KEY_COLUMNS) <= set(chunk.columns):
+            return None
+        # cells are compared as text, as a score column is typed int or object depending on the rows of the chunk
+        text = chunk.astype(str)
+        sid, cid, week = (text[column] for column in ExcelValidator.KEY_COLUMNS)
+        return pandas.DataFrame({'key': sid + '|' + cid + '|' + week.str.lower(),
+                                 'digest': pandas.util.hash_pandas_object(text, index=False).astype(str)},
+                                index=chunk.index)
+
+    @staticmethod
+    def unchanged(owner, digests):
+        """
+        This function is used for finding the rows which are imported before with the same content
+        :param owner: id of the uploading user
+        :param digests: key and digest of every row
+        :return: mask of the unchanged rows
+        """
+        if digests.empty:
+            return pandas.Series(False, index=digests.index, dtype=bool)
+        stored = Cache.getCacheInstance().hmget(ImportJobs.ROWS_KEY.format(owner), list(digests['key']))
+        previous = pandas.Series([value and value.decode('utf-8') for value in stored], index=digests.index)
+        return previous.eq(digests['digest'])
+
+    @staticmethod
+    def still_saved(chunk):
+        """
+        This function is used for checking the rows against their saved weeks, a score which is deleted or edited after
+        the import makes the row import again
+        :param chunk: data frame of the rows
+        :return: mask of the rows whose week holds their score and remark
+        """
+        sid, cid, week, score, remark = (chunk[column.value] for column in (
+            ExcelHeader.SID, ExcelHeader.CID, ExcelHeader.WEEK, ExcelHeader.SCORE, ExcelHeader.REMARKS))
+        week_no = pandas.to_numeric(week.astype(str).str.split(' ').str[-1], errors='coerce')
+        score = pandas.to_numeric(score, errors='coerce')
+        saved = set(Performance.objects.filter(student__sid__in=set(sid), course__cid__in=set(cid),
+                                               score__isnull=False)
+                    .values_list('student__sid', 'course__cid', 'week_no', 'score', 'remark'))
+        return pandas.Series([row in saved for row in zip(sid, cid, week_no, score, remark)], index=chunk.index,
+                             dtype=bool)
+
+    @staticmethod
+    def remember(owner, digests):
+        """
+        This function is used for storing the digests of the imported rows
+        :param owner: id of the uploading user
+        :param digests: key and digest of the imported rows
+        """
+        if digests.empty:
+            return
+        key = ImportJobs.ROWS_KEY.format(owner)
+        pipe = Cache.getCacheInstance().pipeline()
+        pipe.hset(key, mapping=dict(zip(digests['key'], digests['digest'])))
+        pipe.expire(key, settings.IMPORT_ROW_DIGEST_TTL)
+        pipe.execute()
+
+    @staticmethod
+    def run(job_id, path, principal):
+        """
+        This function is used for importing a stored sheet chunk by chunk
+        :param job_id: job id
+        :param path: path of the sheet in the default storage
+        :param principal: principal snapshot of the uploading user
+        :return: final state of the job
+        """
+        user = Principal.to_user(principal)
+        ImportJobs._write(job_id, {'status': ImportJobs.RUNNING, 'started_at': time.time()})
+        report = {}
+        rows = saved = unchanged = 0
+        seen = set()
+        try:
+            with default_storage.open(path, 'rb') as file:
+                for chunk in SheetReader.chunks(file):
+                    rows += len(chunk)
+                    digests = ImportJobs.row_digests(chunk)
+                    if digests is not None:
+                        skipped = ImportJobs.unchanged(user.id, digests)
+                        if skipped.any():
+                            skipped[skipped] = ImportJobs.still_saved(chunk[skipped])
+                            unchanged += int(skipped.sum())
+                            ExcelValidator.remember_keys(chunk[skipped], seen)
+                        chunk, digests = chunk[~skipped], digests[~skipped]
+                    valid, validation_errors = ExcelValidator.validateExcel(chunk, user.role, seen)
+                    report.update(validation_errors)
+                    chunk_saved, ingestion_errors = ScoreIngestion.ingest(valid, user)
+                    report.update(ingestion_errors)
+                    saved += chunk_saved
+                    # a saved row, or a row whose score was already saved, gives a duplicate entry when imported again
+                    if digests is not None:
+                        imported = [index for index in valid.index
+                                    if ingestion_errors.get(f"Row_no-{index + 1}", ScoreIngestion.DUPLICATE)
+                                    == ScoreIngestion.DUPLICATE]
+                        ImportJobs.remember(user.id, digests.loc[imported])
+                    ImportJobs._write(job_id, {'rows': rows, 'saved': saved, 'errors': len(report),
+                                               'unchanged': unchanged})
+            state = {'status': ImportJobs.COMPLETED, 'report': json.dumps(report)}
+        except ExcelException as e:
+            state = {'status': ImportJobs.FAILED, 'message': str(e), 'report': json.dumps(report)}
+        except Exception as e:
+            log.error(e)
+            state = {'status': ImportJobs.FAILED, 'message': 'Import failed, rows before the failure are saved',
+                     'report': json.dumps(report)}
+        finally:
+            default_storage.delete(path)
+        state['finished_at'] = time.time()
+        ImportJobs._write(job_id, state)
+        log.info(f"Import job {job_id} is {state['status']}: {saved} of {rows} rows saved, {unchanged} unchanged")
+        return state
+
+    @staticmethod
+    def get(job_id):
+        """
+        This function is used for getting the progress of a job
+        :param job_id: job id
+        :return: progress and, once the job is finished, the per row report or None for an unknown job
+        """
+        fields = Cache.getCacheInstance().hgetall(ImportJobs.KEY.format(job_id))
+        if not fields:
+            return None
+        job = {name.decode('utf-8'): value.decode('utf-8') for name, value in fields.items()}
+        for name in ImportJobs.COUNTERS:
+            job[name] = int(job.get(name, 0))
+        for name in ImportJobs.TIMES:
+            if name in job:
+                job[name] = float(job[name])
+        if 'report' in job:
+            job['report'] = json.loads(job['report'])
+        job['job_id'] = job_id
+        return job
@@ -0,0 +1,136 @@
+import pandas
+from django.db import transaction
+from django.db.models import F
+from .digest import ReviewDigests
+from .excel_validator import ExcelValidator
+from .models import Student, Course, Mentor, StudentCourseMentor, Performance
+from .utils import ExcelHeader
+import sys
+
+sys.path.append('..')
+from Auth.roles import Role, RoleRegistry
+from LMS.loggerConfig import log
+
+
+class ScoreIngestion:
+    """
+    Ingestion of the weekly scores of a validated excel sheet. SIDs, CIDs and MIDs of the whole sheet are resolved with
+    one IN query each, the student-course-mentor mappings are checked with one join and the existing records with one
+    query, so the number of queries does not depend on the number of rows. Unscored records are updated with one
+    bulk_update and the weeks without a record are inserted with one bulk_create, in one transaction
+    """
+    DUPLICATE = 'Duplicate Entry found, Data is already saved'
+    NOT_MAPPED = 'course-mentor-student mapping does not exist'
+    INVALID_DATE = 'Invalid review date, [dd-mm-yyyy] expected'
+
+    @staticmethod
+    def resolve(model, field, values):
+        """
+        This function is used for resolving the public ids of a sheet column with one query
+        :param model: Student, Course or Mentor
+        :param field: sid, cid or mid
+        :param values: column values
+        :return: primary key of every known id
+        """
+        return dict(model.objects.filter(**{f"{field}__in": set(values)}).values_list(field, 'id'))
+
+    @staticmethod
+    def prepare(df, user):
+        """
+        This function is used for converting the sheet to rows with resolved primary keys
+        :param df: validated data frame
+        :param user: uploading mentor or admin
+        :return: list of rows, numbered by their position in the sheet
+        """
+        rows = pandas.DataFrame({
+            'row_no': df.index + 1,
+            'sid': df[ExcelHeader.SID.value],
+            'cid': df[ExcelHeader.CID.value],
+            'week_no': df[ExcelHeader.WEEK.value].astype(str).str.split(' ').str[1].astype(int),
+            'score': df[ExcelHeader.SCORE.value].astype(float),
+            'review_date': ExcelValidator.review_dates(df[ExcelHeader.REVIEW_DATE.value]),
+            'remark': df[ExcelHeader.REMARKS.value],
+        })
+        rows['student'] = rows['sid'].map(ScoreIngestion.resolve(Student, 'sid', rows['sid']))
+        rows['course'] = rows['cid'].map(ScoreIngestion.resolve(Course, 'cid', rows['cid']))
+        if RoleRegistry.has_role(user, Role.MENTOR):
+            rows['mentor'] = user.profile_id
+        else:
+            mids = df[ExcelHeader.MID.value]
+            rows['mentor'] = mids.map(ScoreIngestion.resolve(Mentor, 'mid', mids))
+        rows = rows.astype(object).where(rows.notnull(), None).to_dict('records')
+        for row in rows:
+            # ids of a column with unknown values are floats in pandas
+            for key in ('row_no', 'student', 'course', 'mentor', 'week_no'):
+                if row[key] is not None:
+                    row[key] = int(row[key])
+        return rows
+
+    @staticmethod
+    def ingest(df, user):
+        """
+        This function is used for saving the scores of the sheet
+        :param df: validated data frame
+        :param user: uploading mentor or admin
+        :return: number of saved scores and the errors per row
+        """
+        # a chunk whose rows all failed validation may have columns which are not text
+        if df.empty:
+            return 0, {}
+        rows = ScoreIngestion.prepare(df, user)
+        errors = {}
+        for row in rows:
+            row_no = row['row_no']
+            if row['student'] is None:
+                errors[f"Row_no-{row_no}"] = str(Student.DoesNotExist('Student matching query does not exist.'))
+            elif row['course'] is None:
+                errors[f"Row_no-{row_no}"] = str(Course.DoesNotExist('Course matching query does not exist.'))
+            elif row['mentor'] is None:
+                errors[f"Row_no-{row_no}"] = str(Mentor.DoesNotExist('Mentor matching query does not exist.'))
+            elif row['review_date'] is None:
+                errors[f"Row_no-{row_no}"] = ScoreIngestion.INVALID_DATE
+        valid = [(row['row_no'], row) for row in rows if f"Row_no-{row['row_no']}" not in errors]
+        student_ids = {row['student'] for _, row in valid}
+
+        # mappings whose mentor teaches the mapped course
+        mapped = set(StudentCourseMentor.objects.filter(student_id__in=student_ids, mentor__course=F('course'))
+                     .values_list('student_id', 'course_id', 'mentor_id'))
+        existing = {(record.student_id, record.course_id, record.week_no): record
+                    for record in Performance.objects.filter(student_id__in=student_ids,
+                                                             course_id__in={row['course'] for _, row in valid})}
+        updates = []
+        inserts = []
+        for row_no, row in valid:
+            if (row['student'], row['course'], row['mentor']) not in mapped:
+                errors[f"Row_no-{row_no}"] = ScoreIngestion.NOT_MAPPED
+                continue
+            record = existing.get((row['student'], row['course'], row['week_no']))
+            if record is not None and record.score is not None:
+                errors[f"Row_no-{row_no}"] = ScoreIngestion.DUPLICATE
+                continue
+            if record is None:
+                record = Performance(student_id=row['student'], course_id=row['course'], week_no=row['week_no'])
+                inserts.append(record)
+            else:
+                updates.append(record)
+            record.mentor_id = row['mentor']
+            record.score = row['score']
+            record.review_date = row['review_date']
+            record.remark = row['remark']
+            record.update_by_id = user.id
+
+        with transaction.atomic():
+            Performance.objects.bulk_update(updates, ['mentor', 'score', 'review_date', 'remark', 'update_by'])
+            Performance.objects.bulk_create(inserts)
+            if inserts and inserts[0].pk is None:
+                # backends which do not return the ids of a bulk insert
+                ids = {(record.student_id, record.course_id, record.week_no): record.id
+                       for record in Performance.objects.filter(student_id__in={r.student_id for r in inserts},
+                                                                score__isnull=False)}
+                for record in inserts:
+                    record.id = ids[(record.student_id, record.course_id, record.week_no)]
+            saved = updates + inserts
+            # bulk writes send no post_save, the review results are buffered for the whole sheet
+            transaction.on_commit(lambda: ReviewDigests.record_many(saved))
+        log.info(f"{len(saved)} of {len(rows)} scores are saved from excel")
+        return len(saved), errors
@@ -0,0 +1,66 @@
+import random
+import time
+import pandas
+from django.core.management.base import BaseCommand
+import sys
+
+sys.path.append('..')
+from Management.excel_validator import ExcelValidator
+from Management.utils import ExcelHeader, Pattern
+
+
+def legacy_validate(df):
+    """The six passes of the previous validator, which stopped at the first failing rule"""
+    if df.isnull().values.any():
+        return 'null'
+    if (df[ExcelHeader.SCORE.value].map(type) == str).any():
+        return 'type'
+    if df[ExcelHeader.SCORE.value].max() > 10 or df[ExcelHeader.SCORE.value].min() < 0:
+        return 'range'
+    for column, pattern in ((ExcelHeader.MID.value, Pattern.MID.value), (ExcelHeader.CID.value, Pattern.CID.value),
+                            (ExcelHeader.SID.value, Pattern.SID.value), (ExcelHeader.WEEK.value, Pattern.WEEK.value)):
+        if (df[column].map(type) == int).any() or not df[column].str.match(pattern).all():
+            return 'pattern'
+    if not df[ExcelHeader.REVIEW_DATE.value].str.match(Pattern.REVIEW_DATE.value).all():
+        return 'date'
+    rows = [(row[1].iloc[0], row[1].iloc[1], row[1].iloc[2].split(' ')[1]) for row in df.iloc[0:, 0:3].iterrows()]
+    if len(rows) != len(set(rows)):
+        return 'duplicate'
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Compares the previous and the vectorized excel validator on a generated score sheet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--invalid', type=float, default=0.01, help='share of rows with an invalid cell')
+
+    def sheet(self, rows, invalid):
+        random.seed(rows)
+        df = pandas.DataFrame({
+            ExcelHeader.SID.value: [f'SI-{1000 + i // 12}' for i in range(rows)],
+            ExcelHeader.CID.value: ['CI-1000'] * rows,
+            ExcelHeader.WEEK.value: [f'Week {i % 12 + 1}' for i in range(rows)],
+            ExcelHeader.SCORE.value: [random.randint(0, 10) for _ in range(rows)],
+            ExcelHeader.REVIEW_DATE.value: ['10-05-2021'] * rows,
+            ExcelHeader.REMARKS.value: ['Good'] * rows,
+            ExcelHeader.MID.value: ['MI-1000'] * rows,
+        })
+        for index in random.sample(range(rows), int(rows * invalid)):
+            df.at[index, random.choice([ExcelHeader.SID.value, ExcelHeader.WEEK.value])] = 'invalid'
+        return df
+
+    def measure(self, operation):
+        start = time.perf_counter()
+        result = operation()
+        return time.perf_counter() - start, result
+
+    def handle(self, *args, **options):
+        df = self.sheet(options['rows'], options['invalid'])
+        valid = df[~df[ExcelHeader.SID.value].eq('invalid') & ~df[ExcelHeader.WEEK.value].eq('invalid')]
+        self.stdout.write(f"{'sheet':<16}{'rows':>10}{'legacy s':>12}{'vectorized s':>14}{'invalid rows':>14}")
+        for name, sheet in (('valid', valid), ('with errors', df)):
+            legacy_seconds, _ = self.measure(lambda: legacy_validate(sheet))
+            seconds, errors = self.measure(lambda: ExcelValidator.report(ExcelValidator.validate_rows(sheet)))
+            self.stdout.write(f"{name:<16}{len(sheet):>10}{legacy_seconds:>12.3f}{seconds:>14.3f}{len(errors):>14}")
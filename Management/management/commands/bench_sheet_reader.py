@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import tracemalloc
+import openpyxl
+import pandas
+from django.core.files import File
+from django.core.management.base import BaseCommand
+import sys
+
+sys.path.append('..')
+from Management.excel_validator import ExcelValidator
+from Management.sheets import SheetReader
+from Management.utils import ExcelHeader
+
+
+class Command(BaseCommand):
+    help = 'Compares the peak traced memory of reading a whole score sheet and of reading it in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000])
+        parser.add_argument('--chunk-size', type=int, default=None, help='settings.EXCEL_CHUNK_ROWS by default')
+
+    def write_sheets(self, directory, rows):
+        header = [ExcelHeader.SID.value, ExcelHeader.CID.value, ExcelHeader.WEEK.value, ExcelHeader.SCORE.value,
+                  ExcelHeader.REVIEW_DATE.value, ExcelHeader.REMARKS.value]
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        with open(os.path.join(directory, 'scores.csv'), 'w') as csv:
+            csv.write(','.join(header) + '\n')
+            for i in range(rows):
+                row = [f'SI-{1000 + i // 12}', 'CI-1000', f'Week {i % 12 + 1}', i % 11, '10-05-2021', 'Good work']
+                sheet.append(row)
+                csv.write(','.join(str(value) for value in row) + '\n')
+        workbook.save(os.path.join(directory, 'scores.xlsx'))
+        return os.path.join(directory, 'scores.xlsx'), os.path.join(directory, 'scores.csv')
+
+    def measure(self, operation):
+        tracemalloc.start()
+        start = time.perf_counter()
+        operation()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 2 ** 20, elapsed
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        def whole(path, read):
+            def operation():
+                ExcelValidator.validate_rows(read(path))
+            return operation
+
+        def chunked(path):
+            def operation():
+                with File(open(path, 'rb'), name=path) as file:
+                    for chunk in SheetReader.chunks(file, chunk_size):
+                        ExcelValidator.validate_rows(chunk)
+            return operation
+
+        self.stdout.write(f"{'rows':>8}  {'format':<6}{'whole MiB':>12}{'whole s':>10}{'chunked MiB':>14}{'chunked s':>12}")
+        for rows in options['rows']:
+            with tempfile.TemporaryDirectory() as directory:
+                xlsx, csv = self.write_sheets(directory, rows)
+                for name, path, read in (('xlsx', xlsx, pandas.read_excel), ('csv', csv, pandas.read_csv)):
+                    whole_mib, whole_s = self.measure(whole(path, read))
+                    chunked_mib, chunked_s = self.measure(chunked(path))
+                    self.stdout.write(f"{rows:>8}  {name:<6}{whole_mib:>12.1f}{whole_s:>10.2f}"
+                                      f"{chunked_mib:>14.1f}{chunked_s:>12.2f}")
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import sys
+
+sys.path.append('..')
+from Management.models import Performance
+
+
+class Command(BaseCommand):
+    help = 'Deletes the unscored weekly Performance records, which are synthesized on read with PERFORMANCE_LAZY_WEEKS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        placeholders = Performance.objects.filter(score=None)
+        if options['dry_run']:
+            self.stdout.write(f"{placeholders.count()} placeholder records would be deleted")
+            return
+        # without lazy weeks the placeholders are the schedule itself, reads would lose the pending weeks
+        if not settings.PERFORMANCE_LAZY_WEEKS:
+            raise CommandError('PERFORMANCE_LAZY_WEEKS is disabled, the placeholder records are still in use')
+        deleted = 0
+        while True:
+            # bounded deletes keep the table lock and the transaction small
+            ids = list(placeholders.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += Performance.objects.filter(id__in=ids, score=None).delete()[0]
+        self.stdout.write(f"{deleted} placeholder records deleted")
@@ -1,4 +1,9 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+import os
+import threading
 import sys
 from .utils import Degree, Default
 
@@ -6,18 +11,104 @@ sys.path.append('..')
 from Auth.models import User
 
 
+class IdSequence(models.Model):
+    """
+    This model keeps the next free number of the SID, CID and MID ids
+    """
+    name = models.CharField(max_length=10, unique=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class IdAllocator:
+    """
+    Allocator of the SID, CID and MID ids. Numbers are reserved from IdSequence with a single UPDATE, in blocks of
+    ID_BLOCK_SIZE which every worker hands out locally (hi/lo), so an insert needs no lookup of the last id and
+    concurrent inserts never get the same id. Numbers of a block not used before the worker exits are skipped.
+    Inside a transaction only the requested numbers are reserved, as a rolled back reservation must not be cached
+    """
+    _blocks = {}
+    _pid = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def sequences():
+        return {
+            'SID': (Student, 'sid', Default.SID.value),
+            'CID': (Course, 'cid', Default.CID.value),
+            'MID': (Mentor, 'mid', Default.MID.value),
+        }
+
+    @staticmethod
+    def _initial_value(name):
+        """
+        This function is used for starting a sequence after the ids which are already in the table
+        :param name: SID, CID or MID
+        :return: first free number
+        """
+        model, field, default = IdAllocator.sequences()[name]
+        last_id = model.objects.order_by('-pk').values_list(field, flat=True).first()
+        return int((last_id or default).split('-')[1]) + (1 if last_id else 0)
+
+    @staticmethod
+    def _reserve(name, count):
+        """
+        This function is used for reserving count numbers of a sequence
+        :param name: SID, CID or MID
+        :param count: number of ids
+        :return: first reserved number
+        """
+        with transaction.atomic():
+            if IdSequence.objects.filter(name=name).update(next_value=F('next_value') + count):
+                return IdSequence.objects.values_list('next_value', flat=True).get(name=name) - count
+            first = IdAllocator._initial_value(name)
+            try:
+                with transaction.atomic():
+                    IdSequence.objects.create(name=name, next_value=first + count)
+                return first
+            except IntegrityError:
+                # another worker has created the sequence in the meantime
+                return IdAllocator._reserve(name, count)
+
+    @staticmethod
+    def next_ids(name, count=1):
+        """
+        This function is used for getting new ids of a sequence
+        :param name: SID, CID or MID
+        :param count: number of ids
+        :return: list of ids like SI-1000
+        """
+        prefix = IdAllocator.sequences()[name][2].split('-')[0]
+        if transaction.get_connection().in_atomic_block:
+            first = IdAllocator._reserve(name, count)
+            return [f"{prefix}-{number}" for number in range(first, first + count)]
+        numbers = []
+        with IdAllocator._lock:
+            if IdAllocator._pid != os.getpid():
+                # a forked worker must not hand out the block of its parent
+                IdAllocator._blocks = {}
+                IdAllocator._pid = os.getpid()
+            low, high = IdAllocator._blocks.get(name, (0, 0))
+            while len(numbers) < count:
+                if low == high:
+                    size = max(count - len(numbers), settings.ID_BLOCK_SIZE)
+                    low = IdAllocator._reserve(name, size)
+                    high = low + size
+                take = min(count - len(numbers), high - low)
+                numbers.extend(range(low, low + take))
+                low += take
+            IdAllocator._blocks[name] = (low, high)
+        return [f"{prefix}-{number}" for number in numbers]
+
+
 def get_course_id():
     """
     This function is used for getting course_id
     :return: Course id
     """
-    last_record = Course.objects.all().last()
-    if last_record:
-        str_part, int_part = last_record.cid.split('-')
-        int_part = int(int_part)
-        int_part += 1
-        return str_part + '-' + str(int_part)
-    return Default.CID.value
+    return IdAllocator.next_ids('CID')[0]
 
 
 def get_student_id():
@@ -25,13 +116,7 @@ def get_student_id():
     This function is used for getting student_id
     :return: student_id
     """
-    last_record = Student.objects.all().last()
-    if last_record:
-        str_part, int_part = last_record.sid.split('-')
-        int_part = int(int_part)
-        int_part += 1
-        return str_part + '-' + str(int_part)
-    return Default.SID.value
+    return IdAllocator.next_ids('SID')[0]
 
 
 def get_mentor_id():
@@ -39,13 +124,65 @@ def get_mentor_id():
     This function is used for getting mentor_id
     :return: mentor_id
     """
-    last_record = Mentor.objects.all().last()
-    if last_record:
-        str_part, int_part = last_record.mid.split('-')
-        int_part = int(int_part)
-        int_part += 1
-        return str_part + '-' + str(int_part)
-    return Default.MID.value
+    return IdAllocator.next_ids('MID')[0]
+
+
+class DirtyFieldsMixin(models.Model):
+    """
+    This mixin tracks the fields changed since the instance was loaded or saved. Saving an unchanged instance writes
+    nothing and sends no signal, saving a changed one updates only the changed columns, so post_save handlers see the
+    changed fields in update_fields
+    """
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = instance._field_values()
+        return instance
+
+    def _field_values(self):
+        deferred = self.get_deferred_fields()
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname in deferred:
+                continue
+            value = getattr(self, field.attname)
+            if isinstance(value, FieldFile):
+                # a new upload is a change even under the same name
+                value = (value.name, value._committed)
+            values[field.name] = value
+        return values
+
+    def changed_fields(self):
+        """
+        This function is used for getting the fields changed since the instance was loaded or saved
+        :return: list of field names, or None for an instance which is not saved yet
+        """
+        saved_values = getattr(self, '_saved_values', None)
+        if saved_values is None or self.pk is None:
+            return None
+        return [name for name, value in self._field_values().items()
+                if name not in saved_values or saved_values[name] != value]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not kwargs.get('force_insert') and not (args and args[0]):
+            changed = self.changed_fields()
+            if changed is not None:
+                if not changed:
+                    return
+                kwargs['update_fields'] = update_fields = changed
+        super().save(*args, **kwargs)
+        values = self._field_values()
+        if update_fields is None or getattr(self, '_saved_values', None) is None:
+            self._saved_values = values
+        else:
+            for name in update_fields:
+                name = self._meta.get_field(name).name
+                if name in values:
+                    self._saved_values[name] = values[name]
 
 
 class Course(models.Model):
@@ -75,7 +212,7 @@ class Mentor(models.Model):
         return self.mentor.get_full_name()
 
 
-class Student(models.Model):
+class Student(DirtyFieldsMixin, models.Model):
     """
     This is student model for student personal's information
     """
@@ -125,7 +262,7 @@ class Education(models.Model):
         return self.student.student.get_full_name()
 
 
-class StudentCourseMentor(models.Model):
+class StudentCourseMentor(DirtyFieldsMixin, models.Model):
     """
     This model is used for mapping mentor and course to student
     """
@@ -136,7 +273,7 @@ class StudentCourseMentor(models.Model):
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='updated_by')
 
 
-class Performance(models.Model):
+class Performance(DirtyFieldsMixin, models.Model):
     """
     This is performance model for student's performance
     """
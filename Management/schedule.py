@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db import transaction
+from .models import Course, Performance, StudentCourseMentor
+
+
+class PerformanceSchedule:
+    """
+    Weekly performance records of the students mapped to a course. Schedules of any number of mappings are
+    generated with one delete, one lookup and one bulk insert.
+    With settings.PERFORMANCE_LAZY_WEEKS a record is stored only when its score is recorded, and the weeks which are
+    not reviewed yet are synthesized from the course duration when the records are read
+    """
+
+    @staticmethod
+    def durations(mappings):
+        """
+        This function is used for getting the duration of the mapped courses, the courses which are not loaded with the
+        mappings are read with one query
+        :param mappings: StudentCourseMentor instances
+        :return: weeks of every course by primary key
+        """
+        course_field = StudentCourseMentor._meta.get_field('course')
+        durations = {mapping.course_id: mapping.course.duration_weeks for mapping in mappings
+                     if mapping.course_id and course_field.is_cached(mapping)}
+        missing = {mapping.course_id for mapping in mappings if mapping.course_id} - durations.keys()
+        if missing:
+            durations.update(Course.objects.filter(id__in=missing).values_list('id', 'duration_weeks'))
+        return durations
+
+    @staticmethod
+    def generate(mappings):
+        """
+        This function is used for generating the weekly records of the mapped students. Records which are not
+        reviewed yet are replaced, reviewed records are kept and their weeks are not created again
+        :param mappings: StudentCourseMentor instances
+        :return: number of created records
+        """
+        mappings = [mapping for mapping in mappings if mapping.course_id]
+        if not mappings:
+            return 0
+        student_ids = {mapping.student_id for mapping in mappings}
+        if settings.PERFORMANCE_LAZY_WEEKS:
+            # placeholders left from the eager mode
+            Performance.objects.filter(student_id__in=student_ids, score=None).delete()
+            return 0
+        durations = PerformanceSchedule.durations(mappings)
+        with transaction.atomic():
+            Performance.objects.filter(student_id__in=student_ids, score=None).delete()
+            reviewed = set(Performance.objects.filter(student_id__in=student_ids)
+                           .values_list('student_id', 'course_id', 'week_no'))
+            records = [Performance(student_id=mapping.student_id, mentor_id=mapping.mentor_id,
+                                   course_id=mapping.course_id, week_no=week_no)
+                       for mapping in mappings
+                       for week_no in range(1, (durations[mapping.course_id] or 0) + 1)
+                       if (mapping.student_id, mapping.course_id, week_no) not in reviewed]
+            Performance.objects.bulk_create(records)
+        return len(records)
+
+    @staticmethod
+    def with_pending_weeks(records, mappings):
+        """
+        This function is used for adding the weeks which are not reviewed yet to the stored records
+        :param records: stored Performance records
+        :param mappings: StudentCourseMentor of the students, the loaded student, mentor and course are shared
+        :return: stored and synthesized records ordered by student, course and week
+        """
+        records = list(records)
+        mappings = list(mappings)
+        durations = PerformanceSchedule.durations(mappings)
+        related = [StudentCourseMentor._meta.get_field(name) for name in ('student', 'mentor', 'course')]
+        stored = {(record.student_id, record.course_id, record.week_no) for record in records}
+        for mapping in mappings:
+            if not mapping.course_id:
+                continue
+            for week_no in range(1, (durations[mapping.course_id] or 0) + 1):
+                if (mapping.student_id, mapping.course_id, week_no) not in stored:
+                    record = Performance(student_id=mapping.student_id, mentor_id=mapping.mentor_id,
+                                         course_id=mapping.course_id, week_no=week_no)
+                    # the related instances loaded with the mapping are shared, the others are not read here
+                    for field in related:
+                        if field.is_cached(mapping):
+                            field.set_cached_value(record, field.get_cached_value(mapping))
+                    records.append(record)
+        return sorted(records, key=lambda record: (record.student_id, record.course_id, record.week_no or 0))
+
+    @staticmethod
+    def records(filters, mapping_filters):
+        """
+        This function is used for reading the records of the students, with the pending weeks in the lazy mode
+        :param filters: filters of the Performance records
+        :param mapping_filters: filters of the StudentCourseMentor of the same students
+        :return: queryset or list of records
+        """
+        query = Performance.objects.filter(**filters)
+        if not settings.PERFORMANCE_LAZY_WEEKS:
+            return query
+        related = ('student__student', 'mentor__mentor', 'course')
+        return PerformanceSchedule.with_pending_weeks(
+            query.select_related(*related), StudentCourseMentor.objects.filter(**mapping_filters).select_related(*related))
+
+    @staticmethod
+    def week(student_id, week_no, mentor_id=None):
+        """
+        This function is used for getting the record of a week, which in the lazy mode is a new record built from the
+        mapping of the student when the week is not reviewed yet
+        :param student_id: Student primary key
+        :param week_no: week number
+        :param mentor_id: Mentor primary key, when the record has to belong to the mentor
+        :return: Performance instance
+        """
+        filters = {'student_id': student_id}
+        if mentor_id:
+            filters['mentor_id'] = mentor_id
+        try:
+            return Performance.objects.get(week_no=week_no, **filters)
+        except Performance.DoesNotExist:
+            if not settings.PERFORMANCE_LAZY_WEEKS:
+                raise
+        mapping = StudentCourseMentor.objects.filter(**filters).select_related('course').first()
+        if not mapping or not mapping.course_id or not 1 <= week_no <= (mapping.course.duration_weeks or 0):
+            raise Performance.DoesNotExist('Performance matching query does not exist.')
+        return Performance(student_id=student_id, mentor_id=mapping.mentor_id, course_id=mapping.course_id,
+                           week_no=week_no)
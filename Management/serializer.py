@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import Course, Mentor, StudentCourseMentor, Student, Education, Performance
 import sys
 import re
+from .sheets import SheetReader
 from .utils import Pattern
 
 sys.path.append('..')
@@ -193,8 +194,8 @@ class ExcelDataSerializer(serializers.Serializer):
     file = serializers.FileField(required=True)
 
     def validate(self, data):
-        if data['file']._name.split('.')[1] not in ['xlsx']:
-            raise serializers.ValidationError('Invalid file format. [.xlsx] expected')
+        if SheetReader.extension(data['file'].name) not in SheetReader.EXTENSIONS:
+            raise serializers.ValidationError('Invalid file format. [.xlsx, .csv] expected')
         return data
 
 class AddMentorSerializer(serializers.ModelSerializer):
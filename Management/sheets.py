@@ -0,0 +1,72 @@
+import datetime
+import openpyxl
+import pandas
+from django.conf import settings
+from .utils import ExcelHeader
+
+
+class SheetReader:
+    """
+    Streaming reader of the uploaded score sheets. xlsx files are read row by row with openpyxl in read only mode and
+    csv files with the chunked pandas parser, so only one chunk of rows is held in memory whatever the size of the
+    sheet. openpyxl still loads the shared strings table of a workbook whole, so csv is the format with flat memory.
+    Chunks are indexed by the position of their rows in the sheet, and a sheet without rows still gives one empty
+    chunk, so its header is validated
+    """
+    EXTENSIONS = ('xlsx', 'csv')
+    DATE_FORMAT = '%d-%m-%Y'
+
+    @staticmethod
+    def extension(name):
+        return name.rsplit('.', 1)[-1].lower()
+
+    @staticmethod
+    def chunks(file, chunk_size=None):
+        """
+        This function is used for reading a sheet in chunks
+        :param file: uploaded xlsx or csv file
+        :param chunk_size: rows per chunk, settings.EXCEL_CHUNK_ROWS by default
+        :return: generator of data frames
+        """
+        chunk_size = chunk_size or settings.EXCEL_CHUNK_ROWS
+        if SheetReader.extension(file.name) == 'csv':
+            return SheetReader.csv_chunks(file, chunk_size)
+        return SheetReader.xlsx_chunks(file, chunk_size)
+
+    @staticmethod
+    def csv_chunks(file, chunk_size):
+        for chunk in pandas.read_csv(file, chunksize=chunk_size, dtype=str):
+            # every csv cell is text, the scores which are numbers are typed like the number cells of a workbook
+            if ExcelHeader.SCORE.value in chunk.columns:
+                text = chunk[ExcelHeader.SCORE.value]
+                score = pandas.to_numeric(text, errors='coerce')
+                chunk[ExcelHeader.SCORE.value] = score.astype(object).where(score.notnull(), text)
+            yield chunk
+
+    @staticmethod
+    def xlsx_chunks(file, chunk_size):
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = list(next(rows, None) or [])
+            # read only sheets report the used range, which may have empty trailing columns
+            while header and header[-1] is None:
+                header.pop()
+            columns = [f'Unnamed: {position}' if name is None else name for position, name in enumerate(header)]
+            start = 0
+            buffer = []
+            for row in rows:
+                row = row[:len(columns)]
+                if all(value is None for value in row):
+                    continue
+                # dates typed as dates by the spreadsheet are read like the dates typed as text
+                buffer.append([value.strftime(SheetReader.DATE_FORMAT) if isinstance(value, datetime.date) else value
+                               for value in row])
+                if len(buffer) == chunk_size:
+                    yield pandas.DataFrame(buffer, columns=columns, index=range(start, start + len(buffer)))
+                    start += len(buffer)
+                    buffer = []
+            if buffer or not start:
+                yield pandas.DataFrame(buffer, columns=columns, index=range(start, start + len(buffer)))
+        finally:
+            workbook.close()
@@ -1,11 +1,20 @@
+from django.db import transaction
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from .models import Student, Mentor, StudentCourseMentor, Performance, Education
-from .tasks import send_review_result_notification_mail
+from .bulk import BulkSignals
+from .digest import ReviewDigests
+from .schedule import PerformanceSchedule
 
 import sys
 sys.path.append('..')
-from Auth.models import User, Roles
+from Auth.models import User
+from Auth.principal import Principal
+from Auth.roles import Role, RoleRegistry
+
+# saves which change none of these fields keep the schedule and do not notify the student
+SCHEDULE_FIELDS = {'student', 'course', 'mentor'}
+REVIEW_FIELDS = {'score', 'remark'}
 
 
 @receiver(signal=post_save, sender=User)
@@ -14,35 +23,66 @@ def create_student_or_mentor(sender, instance, created, **kwargs):
     This function is used for creating user instance based on user role
     """
     if created:
-        if instance.role == Roles.objects.get(role='admin'):
+        if BulkSignals.active():
+            BulkSignals.collect('users', instance.pk, instance)
+        elif RoleRegistry.has_role(instance, Role.ADMIN):
             pass
-        elif instance.role == Roles.objects.get(role='student'):
+        elif RoleRegistry.has_role(instance, Role.STUDENT):
             Student.objects.create(student=instance)
-        elif instance.role == Roles.objects.get(role='mentor'):
+        elif RoleRegistry.has_role(instance, Role.MENTOR):
             Mentor.objects.create(mentor=instance)
 
 
+@receiver(signal=post_save, sender=Student)
+def refresh_student_principal(sender, instance, update_fields=None, **kwargs):
+    """
+    This function is used for refreshing the cached principal of a logged in student when the profile is saved
+    """
+    # the principal only holds the profile id, other profile fields do not change it
+    if update_fields is not None and 'student' not in update_fields:
+        return
+    if BulkSignals.active():
+        BulkSignals.collect('principals', instance.student_id, (instance.student, instance.id))
+        return
+    Principal.refresh(instance.student, profile_id=instance.id)
+
+
+@receiver(signal=post_save, sender=Mentor)
+def refresh_mentor_principal(sender, instance, **kwargs):
+    """
+    This function is used for refreshing the cached principal of a logged in mentor when the profile is saved
+    """
+    if BulkSignals.active():
+        BulkSignals.collect('principals', instance.mentor_id, (instance.mentor, instance.id))
+        return
+    Principal.refresh(instance.mentor, profile_id=instance.id)
+
+
 @receiver(signal=post_save, sender=StudentCourseMentor)
-def create_performace_record(sender, instance, created, **kwargs):
-    if not created:
-        old_records = Performance.objects.filter(student_id=instance.student.id, score=None)
-        for record in old_records:
-            record.delete()
-    for week_no in range(1, instance.course.duration_weeks+1):
-        Performance.objects.create(student=instance.student, mentor=instance.mentor,
-                                    course=instance.course, week_no=week_no)
+def create_performace_record(sender, instance, created, update_fields=None, **kwargs):
+    """
+    This function is used for generating the weekly performance records of the mapped course
+    """
+    if update_fields is not None and not SCHEDULE_FIELDS.intersection(update_fields):
+        return
+    if BulkSignals.active():
+        BulkSignals.collect('mappings', instance.student_id, instance)
+        return
+    PerformanceSchedule.generate([instance])
 
 
 @receiver(signal=post_save, sender=Performance)
-def notify_student_about_review_result(sender, instance, created, **kwargs):
-    if not created:
-        data = {
-            'name': instance.student.student.get_full_name(),
-            'email': instance.student.student.email,
-            'week_no': instance.week_no,
-            'score': instance.score,
-            'course': instance.course.course_name,
-            'mentor': instance.mentor.mentor.get_full_name(),
-            'remark': instance.remark
-        }
-        send_review_result_notification_mail.delay(data)
+def notify_student_about_review_result(sender, instance, created, update_fields=None, **kwargs):
+    """
+    This function is used for buffering the review result, which is mailed to the student in the next digest
+    """
+    if update_fields is not None and not REVIEW_FIELDS.intersection(update_fields):
+        return
+    # with lazy weeks the record of a week is created together with its score
+    if instance.score is None:
+        return
+    if BulkSignals.active():
+        BulkSignals.collect('reviews', instance.pk, instance)
+        return
+    # redis is written once the score is committed, a rolled back review is never mailed
+    transaction.on_commit(lambda: ReviewDigests.record(instance))
@@ -3,7 +3,6 @@ from celery import shared_task
 # from django_celery_results.models import TaskResult
 import sys
 sys.path.append("..")
-from LMS.mailConfirmation import Email
 
 
 
@@ -15,9 +14,18 @@ from LMS.mailConfirmation import Email
 
 
 @shared_task()
-def send_review_result_notification_mail(data):
+def flush_review_digests():
     """
-    This function is used for sending review email to student
+    This function is used for sending one digest mail per student of the buffered review results
     """
-    Email.sendEmail(Email.configure_result_notification_mail(data))
-    return f"Review result notification mail is sent to {data['email']}"
+    from .digest import ReviewDigests
+    return f"{ReviewDigests.flush()} review digest mails are queued"
+
+
+@shared_task()
+def import_score_sheet(job_id, path, principal):
+    """
+    This function is used for importing an uploaded score sheet, reporting its progress to redis
+    """
+    from .imports import ImportJobs
+    return ImportJobs.run(job_id, path, principal)
@@ -0,0 +1,105 @@
+from unittest import mock
+from django.test import TestCase
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from ..models import User, Course, Mentor, Student, StudentCourseMentor, Performance
+from ..bulk import BulkSignals
+from ..views import StudentCourseMentorMapAPIView
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.roles import RoleRegistry
+
+
+def run_on_commit(func):
+    func()
+
+
+@mock.patch('Management.bulk.transaction.on_commit', side_effect=run_on_commit)
+@mock.patch('Auth.principal.Principal.refresh')
+class BulkSignalsTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        self.student_role = Roles.objects.create(role='student')
+        self.mentor_role = Roles.objects.create(role='mentor')
+        RoleRegistry.invalidate(publish=False)
+        self.course = Course.objects.create(course_name='Python', duration_weeks=4)
+
+    def create_users(self, role, count, offset=0):
+        return [User.objects.create_user(username=f'{role.role}{i}', first_name='First', last_name='Last', role=role,
+                                         mobile=f'80808{i:05d}', email=f'{role.role}{i}@gmail.com',
+                                         password='password123')
+                for i in range(offset, offset + count)]
+
+    def test_profiles_are_created_together_on_exit(self, refresh, on_commit):
+        with BulkSignals.scope():
+            students = self.create_users(self.student_role, 3)
+            mentors = self.create_users(self.mentor_role, 2, offset=3)
+            self.assertFalse(Student.objects.exists())
+        self.assertEqual(Student.objects.filter(student__in=students).count(), 3)
+        self.assertEqual(Mentor.objects.filter(mentor__in=mentors).count(), 2)
+        self.assertEqual(len(set(Student.objects.values_list('sid', flat=True))), 3)
+
+    def test_nothing_is_run_when_the_scope_fails(self, refresh, on_commit):
+        with self.assertRaises(ValueError):
+            with BulkSignals.scope():
+                self.create_users(self.student_role, 2)
+                raise ValueError('invalid row')
+        self.assertFalse(Student.objects.exists())
+        self.assertFalse(BulkSignals.active())
+
+    def test_schedules_of_a_batch_cost_constant_queries(self, refresh, on_commit):
+        self.create_users(self.mentor_role, 1)
+        mentor = Mentor.objects.get()
+        students = list(Student.objects.filter(student__in=self.create_users(self.student_role, 6)))
+
+        def map_students(batch):
+            with BulkSignals.scope():
+                for student in batch:
+                    StudentCourseMentor.objects.create(student=student, course=self.course, mentor=mentor)
+
+        # one insert per mapping, then one delete, one lookup and one insert of all schedules inside a savepoint
+        with self.assertNumQueries(3 + 5):
+            map_students(students[:3])
+        with self.assertNumQueries(3 + 5):
+            map_students(students[3:])
+        self.assertEqual(Performance.objects.count(), 24)
+
+    @mock.patch('Management.bulk.ReviewDigests.record_many')
+    def test_review_results_are_buffered_once_per_batch(self, record_many, refresh, on_commit):
+        self.create_users(self.mentor_role, 1)
+        mentor = Mentor.objects.get()
+        student = Student.objects.get(student=self.create_users(self.student_role, 1)[0])
+        StudentCourseMentor.objects.create(student=student, course=self.course, mentor=mentor)
+        with BulkSignals.scope():
+            with BulkSignals.scope():
+                for record in Performance.objects.filter(student=student):
+                    record.score = 7
+                    record.save()
+            record_many.assert_not_called()
+        record_many.assert_called_once()
+        self.assertEqual(sorted(record.week_no for record in record_many.call_args[0][0]), [1, 2, 3, 4])
+
+    def test_mapping_a_list_of_students_generates_their_schedules_in_one_scope(self, refresh, on_commit):
+        admin = User.objects.create_user(username='admin', first_name='Admin', last_name='Admin',
+                                         role=Roles.objects.create(role='admin'), mobile='8000000000',
+                                         email='admin@gmail.com', password='admin123')
+        self.create_users(self.mentor_role, 1)
+        mentor = Mentor.objects.get()
+        mentor.course.add(self.course)
+        students = Student.objects.filter(student__in=self.create_users(self.student_role, 3, offset=1))
+        request = Request(APIRequestFactory().post('/', [{'student': student.id, 'course': self.course.id,
+                                                          'mentor': mentor.id} for student in students],
+                                                   format='json'), parsers=[JSONParser()])
+        request.META['user'] = admin
+        with mock.patch('Management.bulk.PerformanceSchedule.generate') as generate:
+            response = StudentCourseMentorMapAPIView().post(request)
+        self.assertEqual(response.data, {'response': '3 records added'})
+        generate.assert_called_once()
+        self.assertEqual(len(generate.call_args[0][0]), 3)
@@ -0,0 +1,95 @@
+from unittest import mock
+from django.test import TestCase
+from ..models import User, Course, Mentor, Student, StudentCourseMentor, Performance
+from ..digest import ReviewDigests
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.roles import RoleRegistry
+from LMS.cache import Cache
+
+
+def run_on_commit(func):
+    func()
+
+
+class ReviewDigestsTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('Management.signals.transaction.on_commit', side_effect=run_on_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        student_role = Roles.objects.create(role='student')
+        mentor_role = Roles.objects.create(role='mentor')
+        RoleRegistry.invalidate(publish=False)
+        self.course = Course.objects.create(course_name='Python', duration_weeks=4)
+        with mock.patch('Auth.principal.Principal.refresh'):
+            mentor_user = User.objects.create_user(username='mentor', first_name='Mentor', last_name='Mentor',
+                                                   role=mentor_role, mobile='8989898989',
+                                                   email='mentor@gmail.com', password='mentor123')
+            self.mentor = Mentor.objects.get(mentor=mentor_user)
+            self.students = []
+            for i in range(2):
+                user = User.objects.create_user(username=f'student{i}', first_name='Student', last_name=f'No{i}',
+                                                role=student_role, mobile=f'808080808{i}',
+                                                email=f'student{i}@gmail.com', password='student123')
+                self.students.append(Student.objects.get(student=user))
+                StudentCourseMentor.objects.create(student=self.students[-1], course=self.course, mentor=self.mentor)
+        Cache.breaker.reset()
+
+    def score(self, student, week_no, score):
+        record = Performance.objects.get(student=student, week_no=week_no)
+        record.score = score
+        record.remark = f'week {week_no}'
+        record.save()
+        return record
+
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_scored_save_is_buffered_without_queries(self, cache):
+        record = Performance.objects.get(student=self.students[0], week_no=1)
+        record.score = 8
+        with self.assertNumQueries(1):
+            record.save()
+        pipe = cache.return_value.pipeline.return_value
+        pipe.sadd.assert_has_calls([mock.call(f'review:digest:{self.students[0].id}', record.id),
+                                    mock.call('review:digest:students', self.students[0].id)])
+        pipe.execute.assert_called_once_with()
+
+    @mock.patch('LMS.cache.Cache.getCacheInstance')
+    def test_review_result_is_dropped_while_redis_is_unavailable(self, cache):
+        Cache.breaker.state = 'open'
+        Cache.breaker.opened_at = float('inf')
+        self.score(self.students[0], 1, 8)
+        cache.return_value.pipeline.assert_not_called()
+        Cache.breaker.reset()
+
+    @mock.patch('Management.digest.ReviewDigests.record')
+    def test_digests_are_built_per_student_with_one_query(self, record):
+        ids = [self.score(self.students[0], 1, 8).id, self.score(self.students[0], 2, 9).id,
+               self.score(self.students[1], 1, 7).id]
+        with self.assertNumQueries(1):
+            digests = ReviewDigests.build(ids)
+        self.assertEqual([digest['email'] for digest in digests], ['student0@gmail.com', 'student1@gmail.com'])
+        self.assertEqual([review['week_no'] for review in digests[0]['reviews']], [1, 2])
+        self.assertEqual(digests[0]['reviews'][1], {'week_no': 2, 'score': 9, 'course': 'Python',
+                                                    'mentor': 'Mentor Mentor', 'remark': 'week 2'})
+
+    @mock.patch('Management.digest.MailOutbox.enqueue_many')
+    @mock.patch('Management.digest.Cache.runScript')
+    @mock.patch('Management.digest.Cache.getCacheInstance')
+    def test_flush_queues_one_digest_mail_per_student(self, cache, run_script, enqueue_many):
+        with mock.patch('Management.digest.ReviewDigests.record'):
+            ids = [self.score(self.students[0], week_no, 8).id for week_no in (1, 2, 3)]
+            ids.append(self.score(self.students[1], 1, 6).id)
+        run_script.side_effect = [[str(performance_id).encode() for performance_id in ids], []]
+        self.assertEqual(ReviewDigests.flush(), 2)
+        mails = enqueue_many.call_args[0][0]
+        self.assertEqual([mail['to_email'] for mail in mails], ['student0@gmail.com', 'student1@gmail.com'])
+        self.assertEqual(mails[0]['email_body'].count('Current Score'), 3)
+        cache.return_value.delete.assert_called_once_with(ReviewDigests.SENDING_KEY)
+        cache.return_value.lock.return_value.release.assert_called_once_with()
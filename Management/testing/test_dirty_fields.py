@@ -0,0 +1,98 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from ..models import User, Course, Mentor, Student, StudentCourseMentor, Performance
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.roles import RoleRegistry
+
+
+def run_on_commit(func):
+    func()
+
+
+class DirtyFieldsTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('Management.signals.transaction.on_commit', side_effect=run_on_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        student_role = Roles.objects.create(role='student')
+        mentor_role = Roles.objects.create(role='mentor')
+        RoleRegistry.invalidate(publish=False)
+        self.course = Course.objects.create(course_name='Python', duration_weeks=2)
+        with mock.patch('Auth.principal.Principal.refresh'):
+            mentor_user = User.objects.create_user(username='mentor', first_name='Mentor', last_name='Mentor',
+                                                   role=mentor_role, mobile='8989898989',
+                                                   email='mentor@gmail.com', password='mentor123')
+            student_user = User.objects.create_user(username='student', first_name='Student', last_name='Student',
+                                                    role=student_role, mobile='8080808080',
+                                                    email='student@gmail.com', password='student123')
+        self.mentor = Mentor.objects.get(mentor=mentor_user)
+        self.student = Student.objects.get(student=student_user)
+        StudentCourseMentor.objects.create(student=self.student, course=self.course, mentor=self.mentor)
+
+    @mock.patch('Management.signals.ReviewDigests.record')
+    def test_unchanged_instance_is_not_written(self, record):
+        record_ = Performance.objects.get(student=self.student, week_no=1)
+        with self.assertNumQueries(0):
+            record_.save()
+        record.assert_not_called()
+
+    @mock.patch('Management.signals.ReviewDigests.record')
+    def test_only_changed_columns_are_updated(self, record):
+        performance = Performance.objects.get(student=self.student, week_no=1)
+        performance.score = 8
+        with CaptureQueriesContext(connection) as queries:
+            performance.save()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"score"', queries[0]['sql'])
+        self.assertNotIn('"remark"', queries[0]['sql'])
+        record.assert_called_once_with(performance)
+        self.assertEqual(performance.changed_fields(), [])
+
+    @mock.patch('Management.signals.ReviewDigests.record')
+    def test_review_is_notified_only_for_score_or_remark_changes(self, record):
+        performance = Performance.objects.get(student=self.student, week_no=1)
+        performance.score = 8
+        performance.save()
+        performance.review_date = '2021-05-10'
+        performance.save()
+        performance.remark = 'Good'
+        performance.save()
+        self.assertEqual(record.call_count, 2)
+
+    @mock.patch('Management.signals.ReviewDigests.record')
+    def test_review_is_recorded_once_the_score_is_committed(self, record):
+        performance = Performance.objects.get(student=self.student, week_no=1)
+        performance.score = 8
+        with mock.patch('Management.signals.transaction.on_commit') as on_commit:
+            performance.save()
+        record.assert_not_called()
+        on_commit.call_args[0][0]()
+        record.assert_called_once_with(performance)
+
+    @mock.patch('Management.signals.PerformanceSchedule.generate')
+    def test_schedule_is_rebuilt_only_when_mapping_changes(self, generate):
+        mapping = StudentCourseMentor.objects.get(student=self.student)
+        mapping.updated_by = self.mentor.mentor
+        mapping.save()
+        generate.assert_not_called()
+        mapping.course = Course.objects.create(course_name='Java', duration_weeks=3)
+        mapping.save()
+        generate.assert_called_once_with([mapping])
+
+    @mock.patch('Management.signals.Principal.refresh')
+    def test_profile_changes_do_not_refresh_principal(self, refresh):
+        student = Student.objects.get(id=self.student.id)
+        student.current_location = 'Pune'
+        student.save()
+        refresh.assert_not_called()
+        self.assertEqual(Student.objects.get(id=self.student.id).current_location, 'Pune')
@@ -0,0 +1,93 @@
+import datetime
+from unittest import mock
+import pandas
+from django.test import TestCase
+from ..excel_validator import ExcelException, ExcelValidator
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.roles import RoleRegistry
+
+
+class ExcelValidatorTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        self.admin = Roles.objects.create(role='admin')
+        self.mentor = Roles.objects.create(role='mentor')
+        RoleRegistry.invalidate(publish=False)
+        self.df = pandas.DataFrame({
+            'SID': ['SI-1000', 'SI-1001', 'SI-1002', 'SI-1003'],
+            'CID': ['CI-1000'] * 4,
+            'WEEK': ['Week 1', 'week 1', 'WEEK 2', 'Week 1'],
+            'SCORE': [7, 8, 9, 10],
+            'REVIEW DATE': ['10-05-2021'] * 4,
+            'REMARKS': ['Good'] * 4,
+        })
+
+    def test_valid_sheet_has_no_errors(self):
+        df, errors = ExcelValidator.validateExcel(self.df, self.mentor)
+        self.assertEqual(errors, {})
+        self.assertEqual(len(df), 4)
+
+    def test_every_invalid_cell_is_reported_per_row(self):
+        df = self.df.astype(object)
+        df.loc[0, 'SCORE'] = '7'
+        df.loc[1, 'SCORE'] = 11
+        df.loc[1, 'SID'] = 'SI-12'
+        df.loc[2, 'CID'] = 1000
+        df.loc[2, 'REVIEW DATE'] = '31-02-2021'
+        df.loc[3, 'REMARKS'] = None
+        valid, errors = ExcelValidator.validateExcel(df, self.mentor)
+        self.assertEqual(errors, {
+            'Row_no-1': {'SCORE': 'SCORE should be a number'},
+            'Row_no-2': {'SID': 'SID pattern does not match, [SI-0000] expected',
+                         'SCORE': 'SCORE should not be beyond 10'},
+            'Row_no-3': {'CID': 'CID pattern does not match, [CI-0000] expected',
+                         'REVIEW DATE': 'Invalid date or date pattern found, [dd-mm-yyyy] expected'},
+            'Row_no-4': {'REMARKS': 'REMARKS value is missing'},
+        })
+        self.assertTrue(valid.empty)
+
+    def test_first_copy_of_a_duplicate_is_kept(self):
+        df = self.df.copy()
+        df.loc[3, 'SID'] = 'SI-1000'
+        valid, errors = ExcelValidator.validateExcel(df, self.mentor)
+        duplicate = {'WEEK': 'Duplicate records found. [SID, CID, WEEK] should not be duplicate'}
+        self.assertEqual(errors, {'Row_no-4': duplicate})
+        self.assertEqual(list(valid.index), [0, 1, 2])
+
+    def test_duplicates_of_earlier_chunks_are_flagged(self):
+        seen = set()
+        ExcelValidator.validateExcel(self.df.iloc[:2], self.mentor, seen)
+        valid, errors = ExcelValidator.validateExcel(self.df.iloc[2:].assign(SID=['SI-1002', 'SI-1000']),
+                                                     self.mentor, seen)
+        self.assertEqual(list(errors), ['Row_no-4'])
+        self.assertEqual(list(valid.index), [2])
+        self.assertEqual(len(seen), 3)
+
+    def test_wrong_header_rejects_the_file(self):
+        with self.assertRaises(ExcelException):
+            ExcelValidator.validateExcel(self.df, self.admin)
+        df = self.df.assign(MID=['MI-1000', 'MI-10', 'MI-1000', 'MI-1000'])
+        _, errors = ExcelValidator.validateExcel(df, self.admin)
+        self.assertEqual(errors, {'Row_no-2': {'MID': 'MID pattern does not match, [MI-0000] expected'}})
+
+    def test_columns_without_strings_do_not_match(self):
+        df = self.df.assign(SID=[1000, 1001, 1002, 1003])
+        _, errors = ExcelValidator.validateExcel(df, self.mentor)
+        self.assertEqual(len(errors), 4)
+
+    def test_review_dates_are_read_in_every_accepted_form(self):
+        column = pandas.Series(['10-05-2021', '10/05-2021', '10052021', datetime.datetime(2021, 5, 10, 9, 30),
+                                pandas.Timestamp('2021-05-10'), '29/02/2020', '31-02-2021', 10052021, None])
+        day = datetime.date(2021, 5, 10)
+        self.assertEqual(list(ExcelValidator.review_dates(column)),
+                         [day, day, day, day, day, datetime.date(2020, 2, 29), None, None, None])
+        _, errors = ExcelValidator.validateExcel(self.df.assign(**{'REVIEW DATE': column[2:6].tolist()}),
+                                                 self.mentor)
+        self.assertEqual(errors, {})
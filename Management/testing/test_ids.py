@@ -0,0 +1,43 @@
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, override_settings
+from Management.models import Course, IdAllocator, IdSequence
+
+
+@override_settings(ID_BLOCK_SIZE=10)
+class IdAllocatorTest(TransactionTestCase):
+
+    def setUp(self):
+        IdAllocator._blocks = {}
+
+    def test_ids_are_handed_out_from_reserved_block(self):
+        self.assertEqual(IdAllocator.next_ids('SID', 3), ['SI-1000', 'SI-1001', 'SI-1002'])
+        with self.assertNumQueries(0):
+            self.assertEqual(IdAllocator.next_ids('SID'), ['SI-1003'])
+        self.assertEqual(IdSequence.objects.get(name='SID').next_value, 1010)
+
+    def test_batch_larger_than_block_is_reserved_at_once(self):
+        IdAllocator.next_ids('MID', 8)
+        # two ids are left in the block, the rest of the batch is one more reservation
+        self.assertEqual(IdAllocator.next_ids('MID', 25), [f"MI-{number}" for number in range(1008, 1033)])
+        self.assertEqual(IdSequence.objects.get(name='MID').next_value, 1033)
+
+    def test_sequence_starts_after_existing_ids(self):
+        Course.objects.create(course_name='Python', cid='CI-1041')
+        self.assertEqual(IdAllocator.next_ids('CID'), ['CI-1042'])
+        self.assertEqual(Course.objects.create(course_name='Java').cid, 'CI-1043')
+
+    def test_forked_worker_does_not_reuse_parent_block(self):
+        IdAllocator.next_ids('SID')
+        with mock.patch('Management.models.os.getpid', return_value=-1):
+            self.assertEqual(IdAllocator.next_ids('SID'), ['SI-1010'])
+
+
+class IdAllocatorTransactionTest(TestCase):
+
+    def setUp(self):
+        IdAllocator._blocks = {}
+
+    def test_only_requested_ids_are_reserved_inside_transaction(self):
+        self.assertEqual(IdAllocator.next_ids('SID', 2), ['SI-1000', 'SI-1001'])
+        self.assertEqual(IdSequence.objects.get(name='SID').next_value, 1002)
+        self.assertEqual(IdAllocator._blocks, {})
@@ -0,0 +1,217 @@
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
+import openpyxl
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from ..models import User, Course, Mentor, Student, StudentCourseMentor, Performance
+from ..excel_validator import ExcelValidator
+from ..imports import ImportJobs
+from ..ingestion import ScoreIngestion
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.principal import Principal
+from Auth.roles import RoleRegistry
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def run_on_commit(func):
+    func()
+
+
+def written(cache):
+    """Merges the fields of every hset of the job pipelines"""
+    fields = {}
+    for call in cache.return_value.pipeline.return_value.hset.call_args_list:
+        fields.update(call.kwargs['mapping'])
+    return fields
+
+
+def stored_rows(cache):
+    """Keeps the row digests of the job pipelines in a dict"""
+    hashes = {}
+
+    def hset(key, mapping):
+        hashes.setdefault(key, {}).update({name: str(value).encode('utf-8') for name, value in mapping.items()})
+
+    cache.return_value.pipeline.return_value.hset.side_effect = hset
+    cache.return_value.hmget.side_effect = lambda key, names: [hashes.get(key, {}).get(name) for name in names]
+    return hashes
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@mock.patch('Management.ingestion.transaction.on_commit', side_effect=run_on_commit)
+@mock.patch('Management.ingestion.ReviewDigests.record_many')
+@mock.patch('LMS.cache.Cache.getCacheInstance')
+class ImportJobsTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        student_role = Roles.objects.create(role='student')
+        mentor_role = Roles.objects.create(role='mentor')
+        Roles.objects.create(role='admin')
+        RoleRegistry.invalidate(publish=False)
+        self.course = Course.objects.create(course_name='Python', duration_weeks=4)
+        with mock.patch('Auth.principal.Principal.refresh'):
+            self.mentor_user = User.objects.create_user(username='mentor', first_name='Mentor', last_name='Mentor',
+                                                        role=mentor_role, mobile='8989898989',
+                                                        email='mentor@gmail.com', password='mentor123')
+            self.mentor = Mentor.objects.get(mentor=self.mentor_user)
+            self.mentor.course.add(self.course)
+            self.students = []
+            for i in range(3):
+                user = User.objects.create_user(username=f'student{i}', first_name='Student', last_name='Student',
+                                                role=student_role, mobile=f'808080808{i}',
+                                                email=f'student{i}@gmail.com', password='student123')
+                student = Student.objects.get(student=user)
+                StudentCourseMentor.objects.create(student=student, course=self.course, mentor=self.mentor)
+                self.students.append(student)
+        self.principal = Principal.snapshot(self.mentor_user, self.mentor.id)
+
+    def store(self, content):
+        return default_storage.save('imports/test.csv', SimpleUploadedFile('test.csv', content.encode('utf-8')))
+
+    def sheet(self, rows):
+        lines = ['SID,CID,WEEK,SCORE,REVIEW DATE,REMARKS']
+        lines += [f'{student.sid},{self.course.cid},Week {week_no},{score},10-05-2021,Good'
+                  for student, week_no, score in rows]
+        return '\n'.join(lines)
+
+    def test_sheet_is_imported_with_progress_and_report(self, cache, record_many, on_commit):
+        stored_rows(cache)
+        lines = ['SID,CID,WEEK,SCORE,REVIEW DATE,REMARKS']
+        lines += [f'{student.sid},{self.course.cid},Week 1,7,10-05-2021,Good' for student in self.students]
+        lines.append(f'{self.students[0].sid},{self.course.cid},Week 1,11,10-05-2021,Good')
+        path = self.store('\n'.join(lines))
+        with self.settings(EXCEL_CHUNK_ROWS=2):
+            state = ImportJobs.run('job', path, self.principal)
+        self.assertEqual(state['status'], ImportJobs.COMPLETED)
+        self.assertEqual(list(json.loads(state['report'])), ['Row_no-4'])
+        self.assertEqual(Performance.objects.filter(week_no=1, score=7).count(), 3)
+        progress = [call.kwargs['mapping'] for call in cache.return_value.pipeline.return_value.hset.call_args_list
+                    if 'rows' in call.kwargs['mapping']]
+        self.assertEqual(progress, [{'rows': 2, 'saved': 2, 'errors': 0, 'unchanged': 0},
+                                    {'rows': 4, 'saved': 3, 'errors': 1, 'unchanged': 0}])
+        self.assertFalse(default_storage.exists(path))
+
+    def test_unchanged_rows_of_a_modified_sheet_are_skipped(self, cache, record_many, on_commit):
+        hashes = stored_rows(cache)
+        ImportJobs.run('first', self.store(self.sheet([(student, 1, 7) for student in self.students]
+                                                      + [(self.students[0], 2, 11)])), self.principal)
+        self.assertEqual(len(hashes[f'import:rows:{self.mentor_user.id}']), 3)
+        rows = [(student, 1, 7) for student in self.students] + [(self.students[0], 2, 8), (self.students[1], 2, 9)]
+        with mock.patch('Management.imports.ExcelValidator.validateExcel',
+                        wraps=ExcelValidator.validateExcel) as validate:
+            state = ImportJobs.run('second', self.store(self.sheet(rows)), self.principal)
+        self.assertEqual(state['status'], ImportJobs.COMPLETED)
+        self.assertEqual(json.loads(state['report']), {})
+        self.assertEqual(len(validate.call_args.args[0]), 2)
+        self.assertEqual(written(cache)['unchanged'], 3)
+        self.assertEqual(Performance.objects.filter(week_no=2, score__isnull=False).count(), 2)
+
+    def test_rows_whose_score_changed_since_are_imported_again(self, cache, record_many, on_commit):
+        stored_rows(cache)
+        sheet = self.sheet([(student, 1, 7) for student in self.students])
+        ImportJobs.run('first', self.store(sheet), self.principal)
+        Performance.objects.filter(student=self.students[0], week_no=1).update(score=None)
+        Performance.objects.filter(student=self.students[1], week_no=1).update(score=5)
+        state = ImportJobs.run('second', self.store(sheet), self.principal)
+        self.assertEqual(json.loads(state['report']), {'Row_no-2': ScoreIngestion.DUPLICATE})
+        self.assertEqual(written(cache)['unchanged'], 1)
+        self.assertEqual(Performance.objects.get(student=self.students[0], week_no=1).score, 7)
+
+    def test_rows_which_fail_validation_are_reported_whatever_their_cell_types(self, cache, record_many, on_commit):
+        stored_rows(cache)
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['SID', 'CID', 'WEEK', 'SCORE', 'REVIEW DATE', 'REMARKS'])
+        workbook.active.append([self.students[0].sid, self.course.cid, 1, 7, '10-05-2021', 'Good'])
+        content = io.BytesIO()
+        workbook.save(content)
+        path = default_storage.save('imports/test.xlsx', SimpleUploadedFile('test.xlsx', content.getvalue()))
+        state = ImportJobs.run('job', path, self.principal)
+        self.assertEqual(state['status'], ImportJobs.COMPLETED)
+        self.assertEqual(list(json.loads(state['report'])['Row_no-1']), ['WEEK'])
+
+    def test_invalid_header_fails_the_job(self, cache, record_many, on_commit):
+        path = self.store(f'SID,WEEK\n{self.students[0].sid},Week 1')
+        state = ImportJobs.run('job', path, self.principal)
+        self.assertEqual(state['status'], ImportJobs.FAILED)
+        self.assertEqual(written(cache)['status'], ImportJobs.FAILED)
+        self.assertFalse(Performance.objects.filter(score__isnull=False).exists())
+        self.assertFalse(default_storage.exists(path))
+
+    @mock.patch('Management.tasks.import_score_sheet.delay')
+    def test_start_stores_the_file_and_queues_the_job(self, delay, cache, record_many, on_commit):
+        self.mentor_user.profile_id = self.mentor.id
+        job_id, queued = ImportJobs.start(SimpleUploadedFile('scores.csv', b'SID'), self.mentor_user)
+        self.assertTrue(queued)
+        (queued_id, path, principal), _ = delay.call_args
+        self.assertEqual(queued_id, job_id)
+        self.assertTrue(default_storage.exists(path))
+        self.assertEqual(json.loads(principal)['profile_id'], self.mentor.id)
+        self.assertEqual(written(cache)['status'], ImportJobs.QUEUED)
+        cache.return_value.pipeline.return_value.expire.assert_called_with(f'import:job:{job_id}', 24 * 60 * 60)
+        fingerprint = f'import:upload:{self.mentor_user.id}:{hashlib.sha256(b"SID").hexdigest()}'
+        cache.return_value.set.assert_called_once_with(fingerprint, job_id, nx=True, ex=24 * 60 * 60)
+        cache.return_value.get.assert_not_called()
+        default_storage.delete(path)
+
+    @mock.patch('Management.imports.Cache.runScript', return_value=1)
+    @mock.patch('Management.tasks.import_score_sheet.delay')
+    def test_same_upload_gives_back_its_job(self, delay, run_script, cache, record_many, on_commit):
+        cache.return_value.set.return_value = None
+        cache.return_value.get.return_value = b'previous'
+        cache.return_value.hgetall.return_value = {b'status': b'completed', b'owner': b'1', b'rows': b'4',
+                                                   b'saved': b'4', b'errors': b'0', b'unchanged': b'0'}
+        self.assertEqual(ImportJobs.start(SimpleUploadedFile('scores.csv', b'SID'), self.mentor_user),
+                         ('previous', False))
+        delay.assert_not_called()
+        run_script.assert_not_called()
+        cache.return_value.hgetall.return_value[b'status'] = b'failed'
+        job_id, queued = ImportJobs.start(SimpleUploadedFile('scores.csv', b'SID'), self.mentor_user)
+        self.assertTrue(queued)
+        self.assertEqual(run_script.call_args.args[2][:2], ['previous', job_id])
+        default_storage.delete(delay.call_args.args[1])
+
+    @mock.patch('Management.tasks.import_score_sheet.delay')
+    def test_claimed_upload_without_its_job_is_being_queued(self, delay, cache, record_many, on_commit):
+        cache.return_value.set.return_value = None
+        cache.return_value.get.return_value = b'previous'
+        cache.return_value.hgetall.return_value = {}
+        self.assertEqual(ImportJobs.start(SimpleUploadedFile('scores.csv', b'SID'), self.mentor_user),
+                         ('previous', False))
+        delay.assert_not_called()
+
+    @mock.patch('Management.tasks.import_score_sheet.delay', side_effect=ConnectionError('broker is down'))
+    def test_claim_is_given_up_when_the_job_can_not_be_queued(self, delay, cache, record_many, on_commit):
+        with self.assertRaises(ConnectionError):
+            ImportJobs.start(SimpleUploadedFile('scores.csv', b'SID'), self.mentor_user)
+        fingerprint = f'import:upload:{self.mentor_user.id}:{hashlib.sha256(b"SID").hexdigest()}'
+        cache.return_value.delete.assert_called_once_with(fingerprint)
+        self.assertFalse(default_storage.exists(delay.call_args.args[1]))
+
+    def test_job_is_decoded(self, cache, record_many, on_commit):
+        cache.return_value.hgetall.return_value = {b'status': b'completed', b'owner': b'3', b'rows': b'4',
+                                                   b'saved': b'3', b'errors': b'1', b'unchanged': b'0', b'queued_at': b'1.5',
+                                                   b'report': b'{"Row_no-4": {"SCORE": "Invalid"}}'}
+        job = ImportJobs.get('job')
+        self.assertEqual(job['rows'], 4)
+        self.assertEqual(job['queued_at'], 1.5)
+        self.assertEqual(job['report'], {'Row_no-4': {'SCORE': 'Invalid'}})
+        cache.return_value.hgetall.return_value = {}
+        self.assertIsNone(ImportJobs.get('unknown'))
@@ -0,0 +1,114 @@
+import datetime
+from unittest import mock
+import pandas
+from django.test import TestCase, override_settings
+from ..models import User, Course, Mentor, Student, StudentCourseMentor, Performance
+from ..ingestion import ScoreIngestion
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.roles import RoleRegistry
+
+
+def run_on_commit(func):
+    func()
+
+
+@mock.patch('Management.ingestion.transaction.on_commit', side_effect=run_on_commit)
+@mock.patch('Management.ingestion.ReviewDigests.record_many')
+class ScoreIngestionTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        student_role = Roles.objects.create(role='student')
+        mentor_role = Roles.objects.create(role='mentor')
+        self.admin_role = Roles.objects.create(role='admin')
+        RoleRegistry.invalidate(publish=False)
+        self.course = Course.objects.create(course_name='Python', duration_weeks=4)
+        with mock.patch('Auth.principal.Principal.refresh'):
+            self.mentor_user = User.objects.create_user(username='mentor', first_name='Mentor', last_name='Mentor',
+                                                        role=mentor_role, mobile='8989898989',
+                                                        email='mentor@gmail.com', password='mentor123')
+            self.mentor = Mentor.objects.get(mentor=self.mentor_user)
+            self.mentor.course.add(self.course)
+            self.students = []
+            for i in range(12):
+                user = User.objects.create_user(username=f'student{i}', first_name='Student', last_name='Student',
+                                                role=student_role, mobile=f'80808080{i:02d}',
+                                                email=f'student{i}@gmail.com', password='student123')
+                student = Student.objects.get(student=user)
+                StudentCourseMentor.objects.create(student=student, course=self.course, mentor=self.mentor)
+                self.students.append(student)
+        self.mentor_user.profile_id = self.mentor.id
+
+    def sheet(self, rows, mid=None):
+        df = pandas.DataFrame([{'SID': sid, 'CID': self.course.cid, 'WEEK': f'Week {week_no}', 'SCORE': score,
+                                'REVIEW DATE': '10-05-2021', 'REMARKS': 'Good'} for sid, week_no, score in rows])
+        if mid:
+            df['MID'] = mid
+        return df
+
+    def test_scores_are_saved_with_constant_queries(self, record_many, on_commit):
+        # SIDs and CIDs (a mentor sheet has no MIDs), the mapping join, the existing records and the bulk update
+        # inside a savepoint
+        with self.assertNumQueries(7):
+            saved, errors = ScoreIngestion.ingest(self.sheet([(s.sid, 1, 7) for s in self.students[:2]]),
+                                                  self.mentor_user)
+        self.assertEqual((saved, errors), (2, {}))
+        with self.assertNumQueries(7):
+            saved, errors = ScoreIngestion.ingest(self.sheet([(s.sid, 2, 8) for s in self.students]),
+                                                  self.mentor_user)
+        self.assertEqual((saved, errors), (12, {}))
+        record = Performance.objects.get(student=self.students[5], week_no=2)
+        self.assertEqual((record.score, str(record.review_date), record.remark, record.update_by_id),
+                         (8.0, '2021-05-10', 'Good', self.mentor_user.id))
+        self.assertEqual(len(record_many.call_args[0][0]), 12)
+
+    def test_errors_are_reported_per_row(self, record_many, on_commit):
+        Performance.objects.filter(student=self.students[0], week_no=1).update(score=5)
+        StudentCourseMentor.objects.filter(student=self.students[1]).update(mentor=None)
+        df = self.sheet([(self.students[0].sid, 1, 7), (self.students[1].sid, 1, 7), ('SI-999999', 1, 7),
+                         (self.students[2].sid, 1, 7), (self.students[3].sid, 1, 7)])
+        df.loc[3, 'REVIEW DATE'] = '31-02-2021'
+        saved, errors = ScoreIngestion.ingest(df, self.mentor_user)
+        self.assertEqual(saved, 1)
+        self.assertEqual(errors, {'Row_no-1': ScoreIngestion.DUPLICATE, 'Row_no-2': ScoreIngestion.NOT_MAPPED,
+                                  'Row_no-3': 'Student matching query does not exist.',
+                                  'Row_no-4': ScoreIngestion.INVALID_DATE})
+        self.assertEqual(Performance.objects.get(student=self.students[3], week_no=1).score, 7)
+
+    def test_review_dates_are_read_like_the_validator_reads_them(self, record_many, on_commit):
+        df = self.sheet([(student.sid, 1, 7) for student in self.students[:3]]).astype(object)
+        df['REVIEW DATE'] = ['10052021', '10/05-2021', datetime.datetime(2021, 5, 10, 9, 30)]
+        saved, errors = ScoreIngestion.ingest(df, self.mentor_user)
+        self.assertEqual((saved, errors), (3, {}))
+        self.assertEqual(set(Performance.objects.filter(week_no=1, score=7).values_list('review_date', flat=True)),
+                         {datetime.date(2021, 5, 10)})
+
+    def test_admin_sheet_resolves_mentors(self, record_many, on_commit):
+        admin = User.objects.create_user(username='admin', first_name='Admin', last_name='Admin',
+                                         role=self.admin_role, mobile='9090909090', email='admin@gmail.com',
+                                         password='admin123')
+        saved, errors = ScoreIngestion.ingest(self.sheet([(self.students[0].sid, 1, 9)], mid=self.mentor.mid), admin)
+        self.assertEqual((saved, errors), (1, {}))
+        saved, errors = ScoreIngestion.ingest(self.sheet([(self.students[0].sid, 2, 9)], mid='MI-999999'), admin)
+        self.assertEqual(errors, {'Row_no-1': 'Mentor matching query does not exist.'})
+
+    @override_settings(PERFORMANCE_LAZY_WEEKS=True)
+    def test_weeks_without_a_record_are_inserted(self, record_many, on_commit):
+        Performance.objects.all().delete()
+        saved, errors = ScoreIngestion.ingest(self.sheet([(s.sid, 1, 6) for s in self.students[:3]]),
+                                              self.mentor_user)
+        self.assertEqual((saved, errors), (3, {}))
+        self.assertEqual(Performance.objects.filter(week_no=1, score=6).count(), 3)
+        self.assertTrue(all(record.pk for record in record_many.call_args[0][0]))
+
+    def test_rows_keep_their_sheet_numbers(self, record_many, on_commit):
+        df = self.sheet([(self.students[0].sid, 1, 7), ('SI-999999', 1, 7), (self.students[1].sid, 1, 7)])
+        saved, errors = ScoreIngestion.ingest(df.iloc[1:], self.mentor_user)
+        self.assertEqual((saved, errors), (1, {'Row_no-2': 'Student matching query does not exist.'}))
+        self.assertEqual(ScoreIngestion.ingest(df.iloc[:0], self.mentor_user), (0, {}))
@@ -0,0 +1,135 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+from ..models import User, Course, Mentor, Student, StudentCourseMentor, Performance
+from ..schedule import PerformanceSchedule
+import sys
+
+sys.path.append('..')
+from Auth.models import Roles
+from Auth.roles import RoleRegistry
+
+
+class PerformanceScheduleTest(TestCase):
+
+    def setUp(self):
+        # saved roles publish the registry version to redis
+        patcher = mock.patch('LMS.cache.Cache.getCacheInstance')
+        patcher.start().return_value.get.return_value = None
+        self.addCleanup(patcher.stop)
+        student_role = Roles.objects.create(role='student')
+        mentor_role = Roles.objects.create(role='mentor')
+        RoleRegistry.invalidate(publish=False)
+        self.python = Course.objects.create(course_name='Python', duration_weeks=24)
+        self.java = Course.objects.create(course_name='Java', duration_weeks=6)
+        with mock.patch('Auth.principal.Principal.refresh'):
+            mentor_user = User.objects.create_user(username='mentor', first_name='Mentor', last_name='Mentor',
+                                                   role=mentor_role, mobile='8989898989',
+                                                   email='mentor@gmail.com', password='mentor123')
+            self.mentor = Mentor.objects.get(mentor=mentor_user)
+            self.students = []
+            for i in range(3):
+                user = User.objects.create_user(username=f'student{i}', first_name='Student', last_name='Student',
+                                                role=student_role, mobile=f'808080808{i}',
+                                                email=f'student{i}@gmail.com', password='student123')
+                self.students.append(Student.objects.get(student=user))
+
+    def test_mapping_creates_schedule_with_constant_queries(self):
+        # mapping insert, then one delete, one lookup and one insert of the 24 weeks inside a savepoint
+        with self.assertNumQueries(6):
+            StudentCourseMentor.objects.create(student=self.students[0], course=self.python, mentor=self.mentor)
+        weeks = Performance.objects.filter(student=self.students[0], course=self.python)
+        self.assertEqual(sorted(weeks.values_list('week_no', flat=True)), list(range(1, 25)))
+
+    def test_remapping_replaces_unreviewed_weeks_and_keeps_reviewed_ones(self):
+        mapping = StudentCourseMentor.objects.create(student=self.students[0], course=self.python, mentor=self.mentor)
+        Performance.objects.filter(student=self.students[0], week_no=1).update(score=8)
+        mapping.course = self.java
+        mapping.save()
+        records = Performance.objects.filter(student=self.students[0])
+        self.assertEqual(records.filter(course=self.python).count(), 1)
+        self.assertEqual(records.filter(course=self.java).count(), 6)
+
+    def test_schedules_of_many_mappings_are_generated_at_once(self):
+        mappings = [StudentCourseMentor(student=student, course=self.java, mentor=self.mentor)
+                    for student in self.students]
+        with self.assertNumQueries(5):
+            created = PerformanceSchedule.generate(mappings)
+        self.assertEqual(created, 18)
+        self.assertEqual(Performance.objects.filter(course=self.java).count(), 18)
+
+    def test_queryset_of_mappings_reads_the_durations_at_once(self):
+        StudentCourseMentor.objects.bulk_create([
+            StudentCourseMentor(student=student, course=course, mentor=self.mentor)
+            for student, course in zip(self.students, (self.java, self.python, self.java))])
+        # the mappings, the durations of both courses, then the schedule queries inside a savepoint
+        with self.assertNumQueries(7):
+            created = PerformanceSchedule.generate(StudentCourseMentor.objects.all())
+        self.assertEqual(created, 36)
+
+
+@override_settings(PERFORMANCE_LAZY_WEEKS=True)
+class LazyPerformanceWeeksTest(PerformanceScheduleTest):
+
+    def test_mapping_creates_schedule_with_constant_queries(self):
+        StudentCourseMentor.objects.create(student=self.students[0], course=self.python, mentor=self.mentor)
+        self.assertFalse(Performance.objects.filter(student=self.students[0]).exists())
+
+    def test_remapping_replaces_unreviewed_weeks_and_keeps_reviewed_ones(self):
+        StudentCourseMentor.objects.create(student=self.students[0], course=self.python, mentor=self.mentor)
+        Performance.objects.create(student=self.students[0], course=self.python, mentor=self.mentor, week_no=1)
+        PerformanceSchedule.generate(StudentCourseMentor.objects.filter(student=self.students[0]))
+        self.assertFalse(Performance.objects.filter(student=self.students[0]).exists())
+
+    def test_schedules_of_many_mappings_are_generated_at_once(self):
+        mappings = [StudentCourseMentor(student=student, course=self.java, mentor=self.mentor)
+                    for student in self.students]
+        self.assertEqual(PerformanceSchedule.generate(mappings), 0)
+        self.assertFalse(Performance.objects.exists())
+
+    def test_queryset_of_mappings_reads_the_durations_at_once(self):
+        StudentCourseMentor.objects.bulk_create([StudentCourseMentor(student=student, course=self.java)
+                                                 for student in self.students])
+        with self.assertNumQueries(2):
+            records = PerformanceSchedule.with_pending_weeks([], StudentCourseMentor.objects.all())
+        self.assertEqual(len(records), 18)
+
+    def test_unreviewed_weeks_are_synthesized_on_read(self):
+        StudentCourseMentor.objects.create(student=self.students[0], course=self.java, mentor=self.mentor)
+        with mock.patch('Management.signals.ReviewDigests.record'):
+            Performance.objects.create(student=self.students[0], course=self.java, mentor=self.mentor, week_no=2,
+                                       score=7)
+        filters = {'student_id': self.students[0].id}
+        with self.assertNumQueries(2):
+            records = PerformanceSchedule.records(filters, filters)
+        self.assertEqual([record.week_no for record in records], list(range(1, 7)))
+        self.assertEqual([record.score for record in records], [None, 7, None, None, None, None])
+        self.assertEqual(sum(record.pk is None for record in records), 5)
+
+    def test_week_of_unreviewed_record_is_built_from_the_mapping(self):
+        StudentCourseMentor.objects.create(student=self.students[0], course=self.java, mentor=self.mentor)
+        record = PerformanceSchedule.week(self.students[0].id, 3, mentor_id=self.mentor.id)
+        self.assertIsNone(record.pk)
+        self.assertEqual((record.course_id, record.mentor_id, record.week_no), (self.java.id, self.mentor.id, 3))
+        with self.assertRaises(Performance.DoesNotExist):
+            PerformanceSchedule.week(self.students[0].id, 7)
+        with self.assertRaises(Performance.DoesNotExist):
+            PerformanceSchedule.week(self.students[1].id, 1)
+
+    def test_prune_command_deletes_placeholders_only(self):
+        with override_settings(PERFORMANCE_LAZY_WEEKS=False):
+            StudentCourseMentor.objects.create(student=self.students[0], course=self.java, mentor=self.mentor)
+        Performance.objects.filter(student=self.students[0], week_no=1).update(score=9)
+        out = StringIO()
+        call_command('prune_performance_placeholders', '--dry-run', stdout=out)
+        self.assertIn('5 placeholder records would be deleted', out.getvalue())
+        call_command('prune_performance_placeholders', '--batch-size', '2', stdout=out)
+        self.assertEqual(list(Performance.objects.values_list('week_no', flat=True)), [1])
+
+    @override_settings(PERFORMANCE_LAZY_WEEKS=False)
+    def test_prune_command_refuses_to_run_without_lazy_weeks(self):
+        StudentCourseMentor.objects.create(student=self.students[0], course=self.java, mentor=self.mentor)
+        with self.assertRaises(CommandError):
+            call_command('prune_performance_placeholders', stdout=StringIO())
+        self.assertEqual(Performance.objects.count(), 6)
@@ -0,0 +1,50 @@
+import datetime
+import io
+import openpyxl
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from ..sheets import SheetReader
+
+HEADER = ['SID', 'CID', 'WEEK', 'SCORE', 'REVIEW DATE', 'REMARKS']
+
+
+def workbook_file(rows, name='scores.xlsx'):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER + [None])
+    for row in rows:
+        sheet.append(row)
+    content = io.BytesIO()
+    workbook.save(content)
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+class SheetReaderTest(SimpleTestCase):
+
+    def test_workbook_is_read_in_indexed_chunks(self):
+        rows = [[f'SI-{1000 + i}', 'CI-1000', 'Week 1', i % 10, '10-05-2021', 'Good'] for i in range(7)]
+        chunks = list(SheetReader.chunks(workbook_file(rows), chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual(list(chunks[1].index), [3, 4, 5])
+        self.assertEqual(list(chunks[0].columns), HEADER)
+        self.assertEqual(chunks[2].iloc[0].tolist(), rows[6])
+
+    def test_date_cells_and_blank_rows(self):
+        rows = [['SI-1000', 'CI-1000', 'Week 1', 7, datetime.datetime(2021, 5, 10), 'Good'], [None] * 6,
+                ['SI-1001', 'CI-1000', 'Week 1', 8, '11-05-2021', 'Good']]
+        chunk, = SheetReader.chunks(workbook_file(rows), chunk_size=10)
+        self.assertEqual(chunk['REVIEW DATE'].tolist(), ['10-05-2021', '11-05-2021'])
+
+    def test_sheet_without_rows_gives_an_empty_chunk(self):
+        chunk, = SheetReader.chunks(workbook_file([]))
+        self.assertTrue(chunk.empty)
+        self.assertEqual(list(chunk.columns), HEADER)
+
+    def test_csv_is_read_in_chunks_with_typed_scores(self):
+        content = ','.join(HEADER) + '\n' + ''.join(
+            f"SI-{1000 + i},CI-1000,Week 1,{'seven' if i == 4 else i},10-05-2021,Good\n" for i in range(5))
+        chunks = list(SheetReader.chunks(SimpleUploadedFile('scores.csv', content.encode()), chunk_size=2))
+        self.assertEqual([list(chunk.index) for chunk in chunks], [[0, 1], [2, 3], [4]])
+        self.assertEqual(chunks[1]['SCORE'].tolist(), [2, 3])
+        self.assertEqual(chunks[2]['SCORE'].tolist(), ['seven'])
+        self.assertEqual(chunks[0]['SID'].tolist(), ['SI-1000', 'SI-1001'])
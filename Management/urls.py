@@ -27,6 +27,7 @@ urlpatterns = [
     path('students-performance/<int:student_id>/<int:week_no>', views.StudentPerfromanceUpdate.as_view(),
          name='performance-update'),
     path('students-performance-file/', views.UpdateScoreFromExcel.as_view(), name='update-file'),
+    path('students-performance-file/<str:job_id>/', views.ImportJobStatusAPIView.as_view(), name='import-job'),
     path('mentor/', views.AddMentorAPIView.as_view(), name='mentor'),
     path('mentor-details/', views.GetMentorDetailsAPIView.as_view(), name='mentor-details'),
     path('students-profile/<int:student_id>/', views.Studentprofile.as_view(), name='student-profile'),
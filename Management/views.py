@@ -1,5 +1,6 @@
 from django.contrib.sites.shortcuts import get_current_site
-from django.db import IntegrityError
+from django.urls import reverse
+from django.db import IntegrityError, transaction
 from rest_framework import authentication, status, generics, viewsets
 from rest_framework.response import Response
 from Auth.tasks import send_registration_mail
@@ -10,13 +11,14 @@ from django.utils.decorators import method_decorator
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import AllowAny
 from .serializer import *
-import pandas
-from .utils import ExcelHeader, ValueRange, Pattern, Configure
-from .excel_validator import ExcelException, ExcelValidator
+from .imports import ImportJobs
+from .bulk import BulkSignals
+from .schedule import PerformanceSchedule
 import sys
 
 sys.path.append('..')
 from Auth.permissions import isAdmin, isMentorOrAdmin, OnlyStudent
+from Auth.roles import Role, RoleRegistry
 from Auth.middlewares import TokenAuthentication
 from LMS.loggerConfig import log
 
@@ -226,24 +228,30 @@ class StudentCourseMentorMapAPIView(GenericAPIView):
 
     def post(self, request):
         """
-        This API is used to post student course mentor mapped record
+        This API is used to post student course mentor mapped record, or a list of records which are saved in one
+        bulk signal scope so that their schedules are generated together
         """
-        serializer = self.serializer_class(data=request.data, context={'user': request.META['user']})
+        many = isinstance(request.data, list)
+        serializer = self.serializer_class(data=request.data, many=many, context={'user': request.META['user']})
         serializer.is_valid(raise_exception=True)
-        mentor = serializer.validated_data.get('mentor')
-        course = serializer.validated_data.get('course')
-        student = serializer.validated_data.get('student')
-
-        if mentor is None or course is None:
+        rows = serializer.validated_data if many else [serializer.validated_data]
+        if any(row.get('mentor') is None or row.get('course') is None for row in rows):
             return Response({'response': "Mentor or Course can not be Null"}, status=status.HTTP_400_BAD_REQUEST)
-        if course in mentor.course.all():
+        buckets = set(Mentor.course.through.objects.filter(mentor_id__in={row['mentor'].id for row in rows})
+                      .values_list('mentor_id', 'course_id'))
+        for row in rows:
+            mentor, course = row['mentor'], row['course']
+            if (mentor.id, course.id) not in buckets:
+                log.info('course not in mentor bucket')
+                return Response({'response:': f"{course.course_name} is not in {mentor.mentor.get_full_name()}'s "
+                                              f"bucket"}, status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic(), BulkSignals.scope():
             serializer.save()
-            student.save()
-            log.info('Record added')
-            return Response({'response': "Record added"}, status=status.HTTP_200_OK)
-        log.info('course not in mentor bucket')
-        return Response({'response:': f"{course.course_name} is not in {mentor.mentor.get_full_name()}'s bucket"}
-                        , status=status.HTTP_404_NOT_FOUND)
+            for row in rows:
+                row['student'].save()
+        log.info(f'{len(rows)} record(s) added')
+        return Response({'response': f"{len(rows)} records added" if many else "Record added"},
+                        status=status.HTTP_200_OK)
 
 
 @method_decorator(TokenAuthentication, name='dispatch')
@@ -326,21 +334,21 @@ class StudentsAPIView(GenericAPIView):
         """Using this API Admin can see all course assigned students and mentor can see his course assigned students
          and student can see his own record
         """
-        if request.META['user'].role == Roles.objects.get(role='mentor'):
+        if RoleRegistry.has_role(request.META['user'], Role.MENTOR):
             query = StudentCourseMentor.objects.filter(mentor=Mentor.objects.get(mentor_id=request.META['user']))
-        elif request.META['user'].role == Roles.objects.get(role='student'):
+        elif RoleRegistry.has_role(request.META['user'], Role.STUDENT):
             student = Student.objects.get(student_id=request.META['user'])
             query = StudentCourseMentor.objects.filter(student=student)
         else:
             query = self.queryset.all()
         if not query:
-            if request.META['user'].role == Roles.objects.get(role='student'):
+            if RoleRegistry.has_role(request.META['user'], Role.STUDENT):
                 student_serializer = StudentBasicSerializer(student)
                 return Response({'response': student_serializer.data}, status=status.HTTP_200_OK)
             log.info("Records not found")
             return Response({'response': "Records not found"}, status=status.HTTP_404_NOT_FOUND)
         serializerDict = self.serializer_class(query, many=True).data
-        log.info(f"records retrieved by {request.META['user'].role.role}")
+        log.info(f"records retrieved by {RoleRegistry.name_of(request.META['user'])}")
         return Response({'response': serializerDict}, status=status.HTTP_200_OK)
 
 
@@ -358,9 +366,9 @@ class StudentDetailsAPIView(GenericAPIView):
         those student under him and student can see his own details
         """
         try:
-            if request.META['user'].role == Roles.objects.get(role='student'):
+            if RoleRegistry.has_role(request.META['user'], Role.STUDENT):
                 student = Student.objects.get(student_id=request.META['user'])
-            elif request.META['user'].role == Roles.objects.get(role='mentor'):
+            elif RoleRegistry.has_role(request.META['user'], Role.MENTOR):
                 student = StudentCourseMentor.objects.get(mentor=Mentor.objects.get(mentor_id=request.META['user']),
                                                           student_id=student_id).student
             else:
@@ -374,7 +382,7 @@ class StudentDetailsAPIView(GenericAPIView):
                 serializer.update(studentCourseSerializer)
             except StudentCourseMentor.DoesNotExist:
                 pass
-            log.info(f"Data accessed by {request.META['user'].role.role}")
+            log.info(f"Data accessed by {RoleRegistry.name_of(request.META['user'])}")
             return Response({'response': serializer}, status=status.HTTP_200_OK)
         except (Student.DoesNotExist, StudentCourseMentor.DoesNotExist, Education.DoesNotExist):
             log.info('Record not found')
@@ -404,7 +412,7 @@ class StudentsDetailsUpdateAPIView(GenericAPIView):
         except Exception:
             log.info('Some error occurred')
             return Response({'response': "Some error occurred "}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        log.info('Record updated by ' + request.META['user'].role.role)
+        log.info('Record updated by ' + RoleRegistry.name_of(request.META['user']))
         return Response({'response': 'Records updated'}, status=status.HTTP_200_OK)
 
 
@@ -422,10 +430,10 @@ class EducationDetails(GenericAPIView):
         student can see his own details
         """
         try:
-            if request.META['user'].role == Roles.objects.get(role='student'):
+            if RoleRegistry.has_role(request.META['user'], Role.STUDENT):
                 student = Student.objects.get(student_id=request.META['user'].id)
                 query = self.queryset.filter(student_id=student.id)
-            elif request.META['user'].role == Roles.objects.get(role='mentor'):
+            elif RoleRegistry.has_role(request.META['user'], Role.MENTOR):
                 mentor = Mentor.objects.get(mentor_id=request.META['user'].id)
                 query = self.queryset.filter(mentor_id=mentor, student_id=student_id)
             else:
@@ -525,7 +533,7 @@ class NotMappedStudents(GenericAPIView):
             if not serializer.data:
                 log.info('No records found')
                 return Response({'response': 'No records found'}, status=status.HTTP_404_NOT_FOUND)
-            log.info('Records Retrieved by ' + request.META['user'].role.role)
+            log.info('Records Retrieved by ' + RoleRegistry.name_of(request.META['user']))
             return Response({'response': serializer.data}, status=status.HTTP_200_OK)
         except Exception as e:
             log.error(e)
@@ -551,14 +559,17 @@ class StudentPerformance(GenericAPIView):
         @return: performance records of specific student
         """
         try:
-            if request.META['user'].role == Roles.objects.get(role='student'):
+            if RoleRegistry.has_role(request.META['user'], Role.STUDENT):
                 student = Student.objects.get(student_id=request.META['user'].id)
-                query = self.queryset.filter(student_id=student.id)
-            elif request.META['user'].role == Roles.objects.get(role='mentor'):
+                filters = {'student_id': student.id}
+                query = PerformanceSchedule.records(filters, filters)
+            elif RoleRegistry.has_role(request.META['user'], Role.MENTOR):
                 mentor = Mentor.objects.get(mentor_id=request.META['user'].id)
-                query = self.queryset.filter(mentor_id=mentor.id, student_id=student_id)
+                filters = {'mentor_id': mentor.id, 'student_id': student_id}
+                query = PerformanceSchedule.records(filters, filters)
             else:
-                query = self.queryset.filter(student_id=student_id)
+                filters = {'student_id': student_id}
+                query = PerformanceSchedule.records(filters, filters)
             serializer = self.serializer_class(query, many=True)
         except (Student.DoesNotExist, Mentor.DoesNotExist):
             log.info('Records not found')
@@ -586,17 +597,18 @@ class StudentPerfromanceUpdate(GenericAPIView):
         @return: updates score
         """
         try:
-            if request.META['user'].role == Roles.objects.get(role='mentor'):
+            if RoleRegistry.has_role(request.META['user'], Role.MENTOR):
                 mentor = Mentor.objects.get(mentor_id=request.META['user'].id)
-                student = self.queryset.get(mentor_id=mentor.id, student_id=student_id, week_no=week_no)
+                student = PerformanceSchedule.week(student_id, week_no, mentor_id=mentor.id)
             else:
-                student = self.queryset.get(student_id=student_id, week_no=week_no)
+                student = PerformanceSchedule.week(student_id, week_no)
 
             serializer = self.serializer_class(instance=student, data=request.data,
                                                context={'user': request.META['user']})
             serializer.is_valid(raise_exception=True)
             if week_no > 1:
-                previous_record = self.queryset.get(student_id=student_id, week_no=week_no - 1).score
+                previous_record = self.queryset.filter(student_id=student_id, week_no=week_no - 1,
+                                                       score__isnull=False).exists()
                 if not previous_record:
                     log.info('Need to update previous weeks first')
                     return Response({'response': f'Need to update previous weeks first'},
@@ -620,70 +632,48 @@ class UpdateScoreFromExcel(GenericAPIView):
 
     def post(self, request):
         """
-        This function is used to update student's performance score from excel
-        :param request:
-        :return:
+        This function is used to queue the import of student's performance scores from an excel or csv file
+        :param request: file
+        :return: id and status url of the import job, or of the job of the same earlier upload
         """
-        try:
-            file = request.FILES.get('file')
-            serializer = self.serializer_class(data={'file': file})
-            if serializer.is_valid():
-                file = serializer.validated_data['file']
-                df = pandas.read_excel(file)
-                role = request.META.get('user').role
-                ExcelValidator.validateExcel(df, role)  # Validating the excel file
-                error_message = {}
-                for row_no, row in enumerate(df.iterrows()):
-                    try:
-                        if request.META.get('user').role == Roles.objects.get(role='mentor'):
-                            mentor_id = request.META.get('user').mentor.id
-                        else:
-                            mentor_id = Mentor.objects.get(mid=row[1][-2]).id
-                        data = Configure.get_configured_excel_data(row, mentor_id)  # configuring excel data
-                        serializer = PerformanceUpdateViaExcelSerializer(data=data,
-                                                                         context={'user': request.META.get('user')})
-                        if serializer.is_valid():
-                            student = serializer.validated_data['student']
-                            course = serializer.validated_data['course']
-                            mentor = serializer.validated_data['mentor']
-                            week_no = serializer.validated_data['week_no']
-                            map_obj = StudentCourseMentor.objects.get(student=student)
-                            duplicate_entry = False
-                            performance_list = Performance.objects.filter(student=student)
-                            for performance in performance_list:
-                                # checking duplicate entry
-                                if performance.student == student and performance.week_no == week_no and performance.course == course:
-                                    error_message[
-                                        f"Row_no-{row_no + 1}"] = 'Duplicate Entry found, Data is already saved'
-                                    duplicate_entry = True
-                            if not duplicate_entry:
-                                # checking student mentor course mapping
-                                if map_obj.course == course and map_obj.mentor == mentor and course in mentor.course.all():
-                                    serializer.save()
-                                else:
-                                    error_message[
-                                        f"Row_no-{row_no + 1}"] = 'course-mentor-student mapping does not exist'
-                            else:
-                                pass
-                        else:
-                            error_message[f"Row_no-{row_no + 1}"] = serializer.errors
-                    except (Student.DoesNotExist, Mentor.DoesNotExist, StudentCourseMentor.DoesNotExist,
-                            Course.DoesNotExist) as e:
-                        error_message[f"Row_no-{row_no + 1}"] = str(e)
-                if error_message:
-                    msg = 'Record Partially updated! ' + str(error_message)
-                    log.error(str(error_message))
-                else:
-                    msg = 'Record updated successfully'
-                return Response({"response": msg}, status=status.HTTP_200_OK)
+        serializer = self.serializer_class(data={'file': request.FILES.get('file')})
+        if not serializer.is_valid():
             log.error(serializer.errors)
             return Response({'response': serializer.errors["non_field_errors"][0]}, status=status.HTTP_400_BAD_REQUEST)
-        except ExcelException as e:
-            log.error(str(e))
-            return Response({'response': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job_id, queued = ImportJobs.start(serializer.validated_data['file'], request.META['user'])
         except Exception as e:
-            log.error(str(e))
-            return Response({'response': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            log.error(e)
+            return Response({'response': 'Import can not be started right now'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'response': {'job_id': job_id, 'status': reverse('import-job', kwargs={'job_id': job_id})}},
+                        status=status.HTTP_202_ACCEPTED if queued else status.HTTP_200_OK)
+
+
+@method_decorator(TokenAuthentication, name='dispatch')
+class ImportJobStatusAPIView(GenericAPIView):
+    """
+    This API is used for the progress of a score sheet import
+    """
+    permission_classes = [isMentorOrAdmin]
+
+    def get(self, request, job_id):
+        """
+        This function is used to get the progress of an import job, and its per row report once it is finished.
+        Mentors can see their own jobs and admin can see any job
+        @param job_id: import job id
+        @return: status, processed rows, saved rows, number of errors and the report
+        """
+        try:
+            job = ImportJobs.get(job_id)
+        except Exception as e:
+            log.error(e)
+            return Response({'response': 'Import status can not be read right now'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        user = request.META['user']
+        if not job or (job['owner'] != user.id and not RoleRegistry.has_role(user, Role.ADMIN)):
+            return Response({'response': 'Import job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'response': job}, status=status.HTTP_200_OK)
 
 
 @method_decorator(TokenAuthentication, name='dispatch')
@@ -708,7 +698,7 @@ class AddMentorAPIView(GenericAPIView):
             last_name = GetFirstNameAndLastName.get_last_name(name)
             password = GeneratePassword.generate_password(self)
             user = User.objects.create_user(username=email, first_name=first_name, last_name=last_name, email=email,
-                                            password=password, mobile=mobile, role=Roles.objects.get(role='mentor'))
+                                            password=password, mobile=mobile, role=RoleRegistry.get(Role.MENTOR))
             mentor = Mentor.objects.get(mentor=user)
             data = {
                 'name': user.get_full_name(),
@@ -762,7 +752,7 @@ class GetMentorDetailsAPIView(GenericAPIView):
         :return: mentor details
         """
         try:
-            if request.META['user'].role == Roles.objects.get(role='admin'):
+            if RoleRegistry.has_role(request.META['user'], Role.ADMIN):
                 mentors = Mentor.objects.all()
                 if len(mentors) == 0:
                     log.info("Mentors list empty")
@@ -776,7 +766,7 @@ class GetMentorDetailsAPIView(GenericAPIView):
                         mentor_list.append(serializer)
                     log.info("Mentors retrieved")
                     return Response({'response': mentor_list}, status=status.HTTP_200_OK)
-            elif request.META['user'].role == Roles.objects.get(role='mentor'):
+            elif RoleRegistry.has_role(request.META['user'], Role.MENTOR):
                 mentor = Mentor.objects.get(mentor=request.META['user'])
                 serializer = dict(self.serializer_class(mentor).data)
                 course_list = self.get_student_count_in_course_list(mentor)
@@ -817,7 +807,7 @@ class AddStudent(GenericAPIView):
             if mentor and course:
                 if course in mentor.course.all():
                     user = User.objects.create_user(username=email, first_name=first_name, last_name=last_name,
-                                                    email=email, mobile=mobile, role=Roles.objects.get(role='student'),
+                                                    email=email, mobile=mobile, role=RoleRegistry.get(Role.STUDENT),
                                                     password=password)
                     StudentCourseMentor.objects.create(student=Student.objects.get(student=user),
                                                        course=course,
@@ -861,9 +851,9 @@ class Studentprofile(GenericAPIView):
         :return: student profile
         """
         try:
-            if request.META['user'].role == Roles.objects.get(role='student'):
+            if RoleRegistry.has_role(request.META['user'], Role.STUDENT):
                 student = Student.objects.get(student_id=request.META['user'])
-            elif request.META['user'].role == Roles.objects.get(role='mentor'):
+            elif RoleRegistry.has_role(request.META['user'], Role.MENTOR):
                 student = StudentCourseMentor.objects.get(mentor=Mentor.objects.get(mentor_id=request.META['user']),
                                                           student_id=student_id).student
             else:
@@ -878,7 +868,7 @@ class Studentprofile(GenericAPIView):
             studentCourseSerializer = GetMentorCourseDetailsSerializer(student).data
             serializer.update({'Mentor&Course': studentCourseSerializer})
 
-            log.info(f"Data accessed by {request.META['user'].role.role}")
+            log.info(f"Data accessed by {RoleRegistry.name_of(request.META['user'])}")
             return Response({'response': serializer}, status=status.HTTP_200_OK)
         except (Student.DoesNotExist, StudentCourseMentor.DoesNotExist) as e:
             log.error(e)
@@ -902,7 +892,8 @@ class MentorStudentCourse(GenericAPIView):
             @return: List of Students
         """
         try:
-            query = self.queryset.filter(mentor_id=mentor_id, course_id=course_id)
+            filters = {'mentor_id': mentor_id, 'course_id': course_id}
+            query = PerformanceSchedule.records(filters, filters)
             serializer = self.serializer_class(query, many=True)
 
             if not serializer.data: